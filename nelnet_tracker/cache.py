@@ -0,0 +1,245 @@
+"""Caches the series that plots read from the database on disk, decoded into
+NumPy arrays, so that plotting again only reads the scrapes added since.
+
+A cached series is saved with the state of the database it was read from: its
+schema version, its last main record and observation row IDs, the number of
+scrapes up to them, and its rollup generation. As long as those scrapes are
+all still there, only the ones after the row IDs are read and merged in.
+Otherwise, for instance after records were deleted, the schema changed or
+the rollups were rebuilt, the series is read from scratch.
+`PRAGMA data_version` only tells changes apart within one connection, so it
+can't stand in for the row IDs in a cache that outlives the process.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+import sqlite3
+import tempfile
+import zipfile
+
+import numpy as np
+
+from .config import CONFIG
+from .connection import connection, default_database_path, snapshot
+from .migrations import migrate_database, schema_version
+from .query import fetch_chunks, records_query, rollups_query
+from .rollup import ROLLUP_RESOLUTIONS
+
+
+# Version of the layout of cache files. Files of any other version are read
+# from scratch again.
+SERIES_CACHE_VERSION: int = 2
+
+# Type of balance series. Each row is a scrape, or the last scrape of a
+# period at a resolution of `rollup.ROLLUP_RESOLUTIONS`, with the start of its
+# period and the timestamp of the first scrape in it. For single scrapes,
+# those are the scrape's own timestamp.
+BALANCE_SERIES_DTYPE: np.dtype = np.dtype(
+    [
+        ("timestamp", "datetime64[us]"),
+        ("cents", "int64"),
+        ("period", "datetime64[us]"),
+        ("first_timestamp", "datetime64[us]"),
+    ]
+)
+
+
+def balance_series(
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+    resolution: str | None = None,
+) -> np.ndarray:
+    """Returns the rows of `query.iter_balances` for the same arguments as an
+    array of `BALANCE_SERIES_DTYPE`, read through the cache unless
+    `CONFIG.cache_plot_series` is off.
+    """
+    if resolution is not None and resolution not in ROLLUP_RESOLUTIONS:
+        raise ValueError(f"Unknown rollup resolution: {resolution!r}")
+    database_path = database_path or default_database_path()
+    cache_path: Path = _cache_path(database_path, f"balance.{resolution or 'scrape'}")
+
+    series: np.ndarray = np.empty(0, dtype=BALANCE_SERIES_DTYPE)
+    cached_state: tuple[int, ...] | None = None
+    if CONFIG.cache_plot_series:
+        cached: tuple[np.ndarray, tuple[int, ...]] | None = _load(cache_path)
+        if cached is not None:
+            series, cached_state = cached
+    migrate_database(database_path)
+    with connection(database_path) as con, snapshot(con):
+        state: tuple[int, ...] = _database_state(con)
+        if cached_state is None or not _extends(con, cached_state, state):
+            series = np.empty(0, dtype=BALANCE_SERIES_DTYPE)
+            cached_state = (state[0], 0, 0, 0, state[4])
+        if cached_state != state:
+            series = _add_balances(con, series, cached_state, resolution)
+            if CONFIG.cache_plot_series:
+                _save(cache_path, series, state)
+    return _in_time_range(series, start, end, resolution)
+
+
+def _cache_path(database_path: Path, series: str) -> Path:
+    """Returns the path of the cache file of a series of a database."""
+    database_hash: str = hashlib.sha256(
+        str(database_path.resolve()).encode()
+    ).hexdigest()
+    return (
+        CONFIG.cache_dir
+        / "plot_series"
+        / f"{database_path.stem}-{database_hash[:16]}.{series}.npz"
+    )
+
+
+def _database_state(con: sqlite3.Connection) -> tuple[int, ...]:
+    """Returns the schema version, the last main record and observation row
+    IDs, the number of scrapes and the rollup generation of the database.
+    """
+    row: tuple[int, int, int, int] = con.execute(
+        """
+        SELECT
+            (SELECT coalesce(max(row_id), 0) FROM main_record),
+            (SELECT coalesce(max(row_id), 0) FROM record_observation),
+            (SELECT count(*) FROM main_record)
+                + (SELECT count(*) FROM record_observation),
+            (SELECT generation FROM rollup_generation)
+        """
+    ).fetchone()
+    return (schema_version(con), *row)
+
+
+def _extends(
+    con: sqlite3.Connection, cached_state: tuple[int, ...], state: tuple[int, ...]
+) -> bool:
+    """Returns whether the database in `state` only has scrapes added to
+    those in `cached_state`.
+    """
+    version, record_id, observation_id, num_scrapes, generation = cached_state
+    if (
+        version != state[0]
+        or record_id > state[1]
+        or observation_id > state[2]
+        or generation != state[4]
+    ):
+        return False
+    num_kept: int = con.execute(
+        """
+        SELECT
+            (SELECT count(*) FROM main_record WHERE row_id <= ?)
+                + (SELECT count(*) FROM record_observation WHERE row_id <= ?)
+        """,
+        (record_id, observation_id),
+    ).fetchone()[0]
+    return num_kept == num_scrapes
+
+
+def _add_balances(
+    con: sqlite3.Connection,
+    series: np.ndarray,
+    cached_state: tuple[int, ...],
+    resolution: str | None,
+) -> np.ndarray:
+    """Returns a balance series with the scrapes added after `cached_state`
+    merged in.
+    """
+    since: tuple[int, int] = cached_state[1], cached_state[2]
+    if resolution is None:
+        added: np.ndarray = _read_balances(
+            con, records_query(("current_balance_cents",), since=since), False
+        )
+        series = np.concatenate([series, added])
+        return series[np.argsort(series["timestamp"], kind="stable")]
+
+    # New scrapes change the rollups of their periods, so those from the
+    # earliest one on are read again.
+    earliest: tuple | None = con.execute(
+        *records_query(("main_record_id",), since=since)
+    ).fetchone()
+    if earliest is None:
+        return series
+    period: str = earliest[0][: ROLLUP_RESOLUTIONS[resolution]]
+    kept: np.ndarray = series[series["period"] < np.datetime64(period, "us")]
+    added = _read_balances(
+        con,
+        rollups_query(
+            "record_rollup",
+            resolution,
+            ("last_timestamp", "last_balance_cents", "first_timestamp"),
+            start=period,
+        ),
+        True,
+    )
+    return np.concatenate([kept, added])
+
+
+def _read_balances(
+    con: sqlite3.Connection, query: tuple[str, dict], rollups: bool
+) -> np.ndarray:
+    """Returns the rows of a query of the (timestamp, balance) of scrapes, or
+    of the (period, last timestamp, last balance, first timestamp) of
+    rollups, that have a balance, as a balance series.
+    """
+    rows: list[tuple] = []
+    for chunk in fetch_chunks(con, query):
+        for row in chunk:
+            if rollups:
+                period, timestamp, cents, first_timestamp = row
+            else:
+                timestamp, cents = row
+                period = first_timestamp = timestamp
+            if cents is not None:
+                rows.append((timestamp, cents, period, first_timestamp))
+    return np.array(rows, dtype=BALANCE_SERIES_DTYPE)
+
+
+def _in_time_range(
+    series: np.ndarray, start: str | None, end: str | None, resolution: str | None
+) -> np.ndarray:
+    """Returns the rows of a balance series from `start` up to but not
+    including `end`, the same as `query.records_query` or
+    `query.rollups_query` would.
+    """
+    length: int | None = ROLLUP_RESOLUTIONS.get(resolution or "")
+    keep: np.ndarray = np.ones(len(series), dtype=bool)
+    if start is not None:
+        keep &= series["period"] >= np.datetime64(start[:length], "us")
+    if end is not None:
+        keep &= series["period"] <= np.datetime64(end[:length], "us")
+        keep &= series["first_timestamp"] < np.datetime64(end, "us")
+    return series[keep]
+
+
+def _load(path: Path) -> tuple[np.ndarray, tuple[int, ...]] | None:
+    """Returns a cached series and the database state it was read in, or None
+    if there is no usable cache file.
+    """
+    try:
+        with np.load(path) as cache:
+            if int(cache["version"]) != SERIES_CACHE_VERSION:
+                return None
+            return cache["series"], tuple(int(n) for n in cache["state"])
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _save(path: Path, series: np.ndarray, state: tuple[int, ...]) -> None:
+    """Writes a series and the database state it was read in to a cache
+    file, replacing it all at once so that concurrent readers never see half
+    of one.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, suffix=".npz", delete=False
+    ) as tmp_file:
+        try:
+            np.savez(
+                tmp_file,
+                version=np.int64(SERIES_CACHE_VERSION),
+                state=np.array(state, dtype=np.int64),
+                series=series,
+            )
+        except BaseException:
+            tmp_file.close()
+            os.unlink(tmp_file.name)
+            raise
+    os.replace(tmp_file.name, path)
@@ -1,15 +1,50 @@
 """Defines the command line interface."""
 
+import datetime as dt
 from importlib.metadata import version
 import json
 from pathlib import Path
+import time
 from typing import Any
 
 import click
+import numpy as np
 
-from .database import write_record_to_database
-from .plot import plot_aggregate_balance
-from .scrape import scrape_all_data
+from .compact import compact_database
+from .config import CONFIG, check_account_name
+from .connection import connection, transaction, write_lock
+from .daemon import daemon_address, run_daemon, send_request
+from .database import (
+    WRITE_RESULTS,
+    create_database,
+    read_records_from_database,
+    write_record_to_database,
+)
+from .export import EXPORT_FORMATS, export_history
+from .plot import (
+    PLOT_STYLES,
+    plot_aggregate_balance,
+    plot_group_balances,
+    plot_loan_balances,
+)
+from .reconcile import reconcile_accrual
+from .rollup import ROLLUP_RESOLUTIONS, rebuild_rollups
+from .scrape import (
+    EXPANSION_MODES,
+    EXTRACTION_MODES,
+    PROFILES,
+    WebScraper,
+    scrape_accounts,
+    scrape_file_name,
+    scrape_page_source,
+)
+from .simulate import (
+    SIMULATION_ORDERS,
+    latest_loans,
+    scenario_grid,
+    simulate_repayment,
+)
+from .stats import database_stats
 
 
 def print_version(ctx: click.Context, param: click.Parameter, value: Any) -> None:
@@ -22,6 +57,19 @@ def print_version(ctx: click.Context, param: click.Parameter, value: Any) -> Non
     ctx.exit()
 
 
+def check_account_names(ctx: click.Context, param: click.Parameter, value: Any) -> Any:
+    """Rejects account names that aren't safe to use in paths."""
+    names: tuple[str, ...] = value if isinstance(value, tuple) else (value,)
+    for name in names:
+        if name is None:
+            continue
+        try:
+            check_account_name(name)
+        except ValueError as e:
+            raise click.BadParameter(str(e), ctx, param) from e
+    return value
+
+
 @click.group()
 @click.option(
     "--version",
@@ -31,9 +79,14 @@ def print_version(ctx: click.Context, param: click.Parameter, value: Any) -> Non
     is_eager=True,
     help="Show the version and exit.",
 )
-def cli() -> None:
+@click.option(
+    "--account",
+    callback=check_account_names,
+    help="Name of the borrower account to use, if not the default one.",
+)
+def cli(account: str | None) -> None:
     """Nelnet Tracker command line interface."""
-    ...
+    CONFIG.account = account
 
 
 @cli.command()
@@ -44,26 +97,187 @@ def cli() -> None:
     type=click.Path(path_type=Path),
     help="Path to a JSON file to write to instead of the database.",
 )
-def scrape(json_path: Path | None) -> None:
+@click.option(
+    "--extraction",
+    type=click.Choice(EXTRACTION_MODES),
+    default=CONFIG.scrape_extraction,
+    show_default=True,
+    help=(
+        "Read the page from a single in-memory snapshot, or with one browser"
+        " call per field."
+    ),
+)
+@click.option(
+    "--save-page/--no-save-page",
+    default=CONFIG.save_page_sources,
+    show_default=True,
+    help="Save the loaded page source so it can be parsed again with from-html.",
+)
+@click.option(
+    "--expansion",
+    type=click.Choice(EXPANSION_MODES),
+    default=CONFIG.scrape_expansion,
+    show_default=True,
+    help="Expand all loan groups at once, or one group at a time.",
+)
+@click.option(
+    "--profile",
+    type=click.Choice(PROFILES),
+    default=CONFIG.scrape_profile,
+    show_default=True,
+    help=(
+        'Browser profile. "fast" skips images, web fonts and tracking hosts,'
+        " and doesn't wait for them to load."
+    ),
+)
+@click.option(
+    "--headless-after-login/--no-headless-after-login",
+    default=CONFIG.headless_after_login,
+    show_default=True,
+    help="Continue in a headless browser once logged in.",
+)
+@click.option(
+    "--daemon",
+    "use_daemon",
+    is_flag=True,
+    help="Scrape with the browser session of a running scrape-daemon.",
+)
+@click.option(
+    "--accounts",
+    multiple=True,
+    callback=check_account_names,
+    help=(
+        "Scrape these borrower accounts at once, each in its own browser,"
+        " into each account's database. May be given several times."
+    ),
+)
+def scrape(
+    json_path: Path | None,
+    extraction: str,
+    save_page: bool,
+    expansion: str,
+    profile: str,
+    headless_after_login: bool,
+    use_daemon: bool,
+    accounts: tuple[str, ...],
+) -> None:
     """Scrape data from the Nelnet website and store it as a database entry."""
+    if accounts:
+        if json_path is not None or use_daemon:
+            raise click.UsageError("--accounts can't be used with --json or --daemon")
+        click.echo(f"Opening {len(accounts)} automated web drivers")
+        click.echo(
+            'Please log in and navigate to the "My Loans" page in each browser.'
+            " Each one is scraped as soon as that page is open."
+        )
+        failed: list[str] = []
+        for account, account_data, error in scrape_accounts(
+            list(accounts),
+            extraction=extraction,
+            save_page=save_page,
+            expansion=expansion,
+            profile=profile,
+            headless_after_login=headless_after_login,
+        ):
+            if error is not None:
+                click.echo(
+                    f"Failed to scrape {account}: {type(error).__name__}: {error}",
+                    err=True,
+                )
+                failed.append(account)
+                continue
+            click.echo(f"Writing record for {account} to database")
+            database_path: Path = CONFIG.database_path_for(account)
+            _echo_write_result(write_record_to_database(account_data, database_path))
+        if failed:
+            raise click.ClickException(
+                f"Failed to scrape {len(failed)} of {len(accounts)} accounts: "
+                + ", ".join(failed)
+            )
+        click.echo("All done!")
+        return
+
     if json_path is not None:
         # Expand "~" to the username.
         json_path = json_path.expanduser()
-    click.echo("Opening automated web driver")
-    click.echo(
-        'Please navigate to the "My Loans" page, then return here to press Enter.'
-    )
-    data: dict = scrape_all_data()
+    data: dict
+    timings: dict[str, float]
+    if use_daemon:
+        click.echo(f"Requesting a scrape from the daemon at {daemon_address()}")
+        try:
+            response: dict = send_request(
+                dict(
+                    command="scrape",
+                    extraction=extraction,
+                    expansion=expansion,
+                    save_page=save_page,
+                ),
+                CONFIG.daemon_port,
+            )
+        except RuntimeError as e:
+            raise click.ClickException(str(e)) from e
+        if not response["reused_session"]:
+            click.echo("The daemon had to log in again")
+        data, timings = response["data"], response["timings"]
+    else:
+        click.echo("Opening automated web driver")
+        click.echo(
+            'Please navigate to the "My Loans" page, then return here to press'
+            " Enter."
+        )
+        scraper: WebScraper = WebScraper(
+            extraction,
+            CONFIG.page_source_dir if save_page else None,
+            expansion,
+            profile,
+            headless_after_login,
+        )
+        data = scraper.scrape_all_data()
+        timings = scraper.timings
+    click.echo("Timings: " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
     if json_path:
         click.echo(f"Writing record to {json_path}")
         with open(json_path, "w") as jf:
             json.dump(data, jf)
     else:
         click.echo("Writing record to database")
-        write_record_to_database(data)
+        _echo_write_result(write_record_to_database(data))
     click.echo("All done!")
 
 
+@cli.command()
+@click.option(
+    "--port",
+    type=int,
+    default=CONFIG.daemon_port,
+    show_default=True,
+    help="Local port to listen on where there are no Unix domain sockets.",
+)
+@click.option(
+    "--profile",
+    type=click.Choice(PROFILES),
+    default=CONFIG.scrape_profile,
+    show_default=True,
+    help="Browser profile, see scrape --help.",
+)
+@click.option(
+    "--headless-after-login/--no-headless-after-login",
+    default=CONFIG.headless_after_login,
+    show_default=True,
+    help="Continue in a headless browser once logged in.",
+)
+def scrape_daemon(port: int, profile: str, headless_after_login: bool) -> None:
+    """Keep a logged-in browser open and scrape on request.
+
+    Run `scrape --daemon` to request a scrape. The browser is only logged in
+    again when its session has expired.
+    """
+    try:
+        run_daemon(port, profile, headless_after_login)
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+
+
 @cli.command()
 @click.argument(
     "json_path",
@@ -76,16 +290,643 @@ def from_json(json_path: Path) -> None:
     with open(json_path, "r") as jf:
         data: dict = json.load(jf)
     click.echo("Writing record to database")
-    write_record_to_database(data)
+    _echo_write_result(write_record_to_database(data))
+    click.echo("All done!")
+
+
+@cli.command()
+@click.argument(
+    "paths",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, path_type=Path),
+)
+def from_html(paths: tuple[Path, ...]) -> None:
+    """Record data from page sources saved by scrape as database entries.
+
+    PATHS may be HTML files or directories of them.
+    """
+    html_paths: list[Path] = []
+    for path in paths:
+        path = path.expanduser()
+        if path.is_dir():
+            html_paths.extend(sorted(path.glob("*.html")))
+        else:
+            html_paths.append(path)
+
+    results: dict[str, int] = dict.fromkeys(WRITE_RESULTS, 0)
+    for html_path in html_paths:
+        click.echo(f"Reading {html_path}")
+        data: dict = scrape_page_source(html_path)
+        results[write_record_to_database(data)] += 1
+    click.echo(
+        f"Wrote {results['inserted']} records to database,"
+        f" {results['observed']} unchanged,"
+        f" {results['duplicate']} already recorded"
+    )
+    click.echo("All done!")
+
+
+@cli.command("export-json")
+@click.argument(
+    "output_dir",
+    type=click.Path(file_okay=False, path_type=Path),
+)
+@click.option("--start", type=click.DateTime(), help="Export scrapes from then on.")
+@click.option("--end", type=click.DateTime(), help="Export scrapes before then.")
+def export_json(
+    output_dir: Path, start: dt.datetime | None, end: dt.datetime | None
+) -> None:
+    """Write each scrape to a JSON file, as scrape --json would have.
+
+    Files are written to OUTPUT_DIR, named after the time of the scrape, and
+    can be recorded again with from-json.
+    """
+    output_dir = output_dir.expanduser()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with write_lock():
+        create_database()
+    click.echo(f"Exporting {CONFIG.database_path} to {output_dir}")
+    written: int = 0
+    for data in read_records_from_database(_timestamp(start), _timestamp(end)):
+        json_path: Path = output_dir / scrape_file_name(
+            data["scrape_timestamp"], ".json"
+        )
+        with open(json_path, "w") as jf:
+            json.dump(data, jf)
+        written += 1
+    click.echo(f"Wrote {written} records")
+    click.echo("All done!")
+
+
+@cli.command()
+def migrate() -> None:
+    """Bring the database schema up to date.
+
+    This also happens automatically whenever a record is written.
+    """
+    click.echo(f"Migrating {CONFIG.database_path}")
+    start: float = time.perf_counter()
+    before: int
+    after: int
+    with write_lock():
+        before, after = create_database()
+    elapsed: float = time.perf_counter() - start
+    if before == after:
+        click.echo(f"Already at schema version {after}")
+    else:
+        click.echo(
+            f"Migrated from schema version {before} to {after}"
+            f" in {elapsed * 1000:.0f} ms"
+        )
+    click.echo("All done!")
+
+
+@cli.command()
+@click.argument(
+    "output_dir",
+    type=click.Path(file_okay=False, path_type=Path),
+)
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(EXPORT_FORMATS),
+    default="npz",
+    show_default=True,
+    help="File format: NumPy .npz archives, or Parquet (requires pyarrow).",
+)
+@click.option("--start", type=click.DateTime(), help="Export scrapes from then on.")
+@click.option("--end", type=click.DateTime(), help="Export scrapes before then.")
+def export(
+    output_dir: Path,
+    export_format: str,
+    start: dt.datetime | None,
+    end: dt.datetime | None,
+) -> None:
+    """Export the full history as typed tables for analysis.
+
+    Writes records, groups and loans tables to OUTPUT_DIR, with a row per
+    scrape, per group of each record and per loan of each record
+    respectively, and a column per field.
+    """
+    output_dir = output_dir.expanduser()
+    click.echo(f"Exporting {CONFIG.database_path} to {output_dir}")
+    started: float = time.perf_counter()
+    try:
+        num_rows: dict[str, int] = export_history(
+            output_dir, export_format, _timestamp(start), _timestamp(end)
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+    elapsed: float = time.perf_counter() - started
+    for table, count in num_rows.items():
+        click.echo(f"Wrote {count} rows to {output_dir / f'{table}.{export_format}'}")
+    click.echo(f"Exported in {elapsed:.2f} s")
+    click.echo("All done!")
+
+
+@cli.command()
+@click.option(
+    "--keep-all",
+    "keep_all_days",
+    type=click.IntRange(min=0),
+    default=CONFIG.retention_all_days,
+    show_default=True,
+    help="Keep every scrape from this many days back.",
+)
+@click.option(
+    "--keep-daily",
+    "keep_daily_days",
+    type=click.IntRange(min=0),
+    default=CONFIG.retention_daily_days,
+    show_default=True,
+    help="Keep the last scrape of each day from this many days back.",
+)
+@click.option("--dry-run", is_flag=True, help="Only report what would be removed.")
+def compact(keep_all_days: int, keep_daily_days: int, dry_run: bool) -> None:
+    """Remove old scrapes and shrink the database file.
+
+    Older scrapes than --keep-all days are thinned out to the last of each
+    day, and older than --keep-daily days to the last of each month. The
+    daily and monthly rollups still cover the removed scrapes.
+    """
+    if keep_daily_days < keep_all_days:
+        raise click.UsageError("--keep-daily can't be less than --keep-all")
+    click.echo(f"Compacting {CONFIG.database_path}")
+    started: float = time.perf_counter()
+    result: dict[str, int] = compact_database(
+        keep_all_days, keep_daily_days, dry_run=dry_run
+    )
+    elapsed: float = time.perf_counter() - started
+    click.echo(
+        f"{'Would remove' if dry_run else 'Removed'} {result['records']} records,"
+        f" {result['observations']} observations and {result['history_rows']}"
+        " rows of loan details"
+    )
+    if not dry_run:
+        click.echo(
+            f"Shrank the database from {_size(result['before'])} to"
+            f" {_size(result['after'])} in {elapsed:.2f} s"
+        )
+    click.echo("All done!")
+
+
+@cli.command("rebuild-rollups")
+def rebuild_all_rollups() -> None:
+    """Recompute the daily and monthly rollups from all records.
+
+    Rollups are kept up to date as records are written, so this is only
+    needed if they were changed or deleted by other means. Rebuilt rollups
+    no longer cover scrapes removed by compact.
+    """
+    click.echo(f"Rebuilding rollups in {CONFIG.database_path}")
+    with write_lock():
+        create_database()
+        start: float = time.perf_counter()
+        with connection() as con, transaction(con):
+            num_scrapes: int = rebuild_rollups(con)
+    elapsed: float = time.perf_counter() - start
+    click.echo(f"Rolled up {num_scrapes} scrapes in {elapsed:.2f} s")
     click.echo("All done!")
 
 
+@cli.command()
+@click.option("--json", "as_json", is_flag=True, help="Print the statistics as JSON.")
+def stats(as_json: bool) -> None:
+    """Show how much space the database takes up and where.
+
+    Lists the rows and size of each table and index, the size per scrape and
+    of the latest record, how fast the database grows, and how fragmented it
+    is.
+    """
+    try:
+        db_stats: dict = database_stats()
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+    if as_json:
+        click.echo(json.dumps(db_stats, indent=2))
+        return
+
+    click.echo(f"Database: {db_stats['path']}")
+    click.echo(
+        f"Size: {_size(db_stats['file_bytes'])} in pages of"
+        f" {db_stats['page_size']} bytes, {db_stats['free_pages']} of them free"
+    )
+    click.echo(f"Schema version: {db_stats['schema_version']}")
+    click.echo(
+        f"Scrapes: {db_stats['scrapes']} ({db_stats['records']} records,"
+        f" {db_stats['observations']} observations of unchanged records)"
+    )
+    if db_stats["scrapes"]:
+        click.echo(f"From {db_stats['first_scrape']} to {db_stats['last_scrape']}")
+    click.echo(f"Size per scrape: {_size(db_stats['bytes_per_scrape'])}")
+    click.echo(f"Latest record: {_size(db_stats['latest_record_bytes'])} (estimated)")
+    click.echo(f"Growth: {_size(db_stats['bytes_per_day'])} per day")
+
+    click.echo()
+    click.echo(
+        f"{'Table or index':<40} {'Rows':>8} {'Size':>10} {'Unused':>7} {'Frag.':>6}"
+    )
+    for name, o in db_stats["objects"].items():
+        rows: str = "" if o["rows"] is None else str(o["rows"])
+        click.echo(
+            f"{name:<40} {rows:>8} {_size(o['bytes']):>10}"
+            f" {o['unused_bytes'] / o['bytes']:>7.0%} {o['fragmentation']:>6.0%}"
+        )
+
+    click.echo()
+    click.echo(f"{'Month':<8} {'Records':>8} {'Observed':>8} {'Size':>10}")
+    for month in db_stats["growth"]:
+        click.echo(
+            f"{month['month']:<8} {month['records']:>8} {month['observations']:>8}"
+            f" {_size(month['bytes']):>10}"
+        )
+
+
+@cli.command()
+@click.option(
+    "--extra",
+    multiple=True,
+    default=["0"],
+    show_default=True,
+    help="Extra amount to pay each month, in dollars, or a range START:STOP:STEP.",
+)
+@click.option(
+    "--lump-sum",
+    multiple=True,
+    default=["0"],
+    show_default=True,
+    help="Lump sum to pay once, in dollars, or a range START:STOP:STEP.",
+)
+@click.option(
+    "--lump-sum-month",
+    multiple=True,
+    default=["0"],
+    show_default=True,
+    help="Month to pay the lump sum in, 0 for the next payment, or a range.",
+)
+@click.option(
+    "--order",
+    "orders",
+    type=click.Choice(SIMULATION_ORDERS),
+    multiple=True,
+    default=SIMULATION_ORDERS,
+    show_default=True,
+    help="Pay extra toward the highest rate or the smallest balance first.",
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Number of strategies to list, by least interest.",
+)
+@click.option("--json", "as_json", is_flag=True, help="Print every result as JSON.")
+def simulate(
+    extra: tuple[str, ...],
+    lump_sum: tuple[str, ...],
+    lump_sum_month: tuple[str, ...],
+    orders: tuple[str, ...],
+    top: int,
+    as_json: bool,
+) -> None:
+    """Simulate paying off the loans under payment strategies.
+
+    Starts from the loans in the latest record, paying each group's regular
+    monthly payment, and tries every combination of the orders, extra
+    amounts and lump sums. Options may be given more than once.
+    """
+    try:
+        start, loans = latest_loans()
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+    scenarios = scenario_grid(
+        tuple(dict.fromkeys(orders)),
+        tuple(round(dollars * 100) for dollars in _values(extra, "--extra")),
+        tuple(round(dollars * 100) for dollars in _values(lump_sum, "--lump-sum")),
+        tuple(int(month) for month in _values(lump_sum_month, "--lump-sum-month")),
+    )
+    started: float = time.perf_counter()
+    try:
+        results = simulate_repayment(loans, scenarios, start)
+    except ValueError as e:
+        raise click.UsageError(str(e)) from e
+    elapsed: float = time.perf_counter() - started
+    if as_json:
+        click.echo(
+            json.dumps(
+                [
+                    dict(
+                        order=str(scenario["order"]),
+                        extra_cents=int(scenario["extra_cents"]),
+                        lump_sum_cents=int(scenario["lump_sum_cents"]),
+                        lump_sum_month=int(scenario["lump_sum_month"]),
+                        payoff_date=_date(result["payoff_date"]),
+                        months=int(result["months"]),
+                        total_interest_cents=int(result["total_interest_cents"]),
+                        total_paid_cents=int(result["total_paid_cents"]),
+                    )
+                    for scenario, result in zip(scenarios, results)
+                ],
+                indent=2,
+            )
+        )
+        return
+
+    click.echo(
+        f"{len(loans)} loans with {_dollars(loans['principal_cents'].sum())} of"
+        f" principal as of {start}, paying"
+        f" {_dollars(loans['minimum_payment_cents'].sum())} a month"
+    )
+    click.echo(f"Simulated {len(scenarios)} strategies in {elapsed:.2f} s")
+    click.echo()
+    click.echo(
+        f"{'Order':<10} {'Extra':>10} {'Lump sum':>12} {'Month':>5}"
+        f" {'Paid off':>10} {'Months':>6} {'Interest':>12}"
+    )
+    for i in np.argsort(results["total_interest_cents"], kind="stable")[:top]:
+        scenario, result = scenarios[i], results[i]
+        click.echo(
+            f"{scenario['order']:<10} {_dollars(scenario['extra_cents']):>10}"
+            f" {_dollars(scenario['lump_sum_cents']):>12}"
+            f" {scenario['lump_sum_month']:>5}"
+            f" {_date(result['payoff_date']) or 'never':>10} {result['months']:>6}"
+            f" {_dollars(result['total_interest_cents']):>12}"
+        )
+
+
+@cli.command()
+@click.option("--start", type=click.DateTime(), help="Check scrapes from then on.")
+@click.option("--end", type=click.DateTime(), help="Check scrapes before then.")
+@click.option("--loan", "loans", multiple=True, help="Only check this loan.")
+@click.option(
+    "--group", "groups", multiple=True, help="Only check loans in this group."
+)
+@click.option(
+    "--tolerance-cents",
+    type=click.FloatRange(min=0),
+    default=CONFIG.accrual_tolerance_cents,
+    show_default=True,
+    help="Cents the accrued interest may be off by.",
+)
+@click.option(
+    "--tolerance-percent",
+    type=click.FloatRange(min=0),
+    default=CONFIG.accrual_tolerance_fraction * 100,
+    show_default=True,
+    help="Percent of the expected interest it may be off by, on top of that.",
+)
+@click.option(
+    "--top",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Number of divergent intervals to list, the furthest off first.",
+)
+def reconcile(
+    start: dt.datetime | None,
+    end: dt.datetime | None,
+    loans: tuple[str, ...],
+    groups: tuple[str, ...],
+    tolerance_cents: float,
+    tolerance_percent: float,
+    top: int,
+) -> None:
+    """Check the interest accrued on each loan against its rate.
+
+    Compares the accrued interest of consecutive scrapes of each loan with
+    simple daily interest on the principal, leaving out those in between
+    which the principal changed or the interest went down, and lists the
+    loans whose interest diverges. --loan and --group may be given more than
+    once.
+    """
+    started: float = time.perf_counter()
+    try:
+        intervals, summary = reconcile_accrual(
+            _timestamp(start),
+            _timestamp(end),
+            list(loans) or None,
+            list(groups) or None,
+            tolerance_cents,
+            tolerance_percent / 100,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+    elapsed: float = time.perf_counter() - started
+    click.echo(
+        f"Checked {len(intervals)} intervals between scrapes of {len(summary)}"
+        f" loans in {elapsed:.2f} s"
+    )
+    click.echo()
+    click.echo(
+        f"{'Loan':<20} {'Intervals':>9} {'Divergent':>9}"
+        f" {'Expected':>12} {'Observed':>12}"
+    )
+    for loan in summary:
+        click.echo(
+            f"{loan['loan']:<20} {loan['intervals']:>9} {loan['divergent']:>9}"
+            f" {_dollars(loan['expected_cents']):>12}"
+            f" {_dollars(loan['observed_cents']):>12}"
+        )
+
+    divergent: np.ndarray = intervals[intervals["divergent"]]
+    click.echo()
+    click.echo(
+        f"{np.count_nonzero(summary['divergent'])} of {len(summary)} loans have"
+        f" interest diverging from their rate in {len(divergent)} intervals"
+    )
+    if not len(divergent) or not top:
+        return
+    click.echo()
+    click.echo(
+        f"{'Loan':<20} {'From':<19} {'To':<19} {'Days':>4} {'Rate':>7}"
+        f" {'Expected':>10} {'Observed':>10}"
+    )
+    difference: np.ndarray = np.abs(
+        divergent["observed_cents"] - divergent["expected_cents"]
+    )
+    for interval in divergent[np.argsort(-difference, kind="stable")[:top]]:
+        click.echo(
+            f"{interval['loan']:<20}"
+            f" {str(interval['start'].astype('M8[s]')).replace('T', ' '):<19}"
+            f" {str(interval['end'].astype('M8[s]')).replace('T', ' '):<19}"
+            f" {interval['days']:>4} {interval['interest_rate_percent']:>6.3f}%"
+            f" {_dollars(interval['expected_cents']):>10}"
+            f" {_dollars(interval['observed_cents']):>10}"
+        )
+
+
+def _values(options: tuple[str, ...], name: str) -> list[float]:
+    """Returns the numbers of an option given as numbers or ranges of them,
+    START:STOP:STEP with STOP included.
+    """
+    values: list[float] = []
+    for option in options:
+        try:
+            numbers: list[float] = [float(n) for n in option.split(":")]
+        except ValueError as e:
+            raise click.BadParameter(
+                f"Not a number or range: {option}", param_hint=name
+            ) from e
+        if len(numbers) == 1:
+            values.extend(numbers)
+        elif len(numbers) == 3 and numbers[2] > 0:
+            start, stop, step = numbers
+            values.extend(start + step * np.arange(int((stop - start) / step) + 1))
+        else:
+            raise click.BadParameter(
+                f"Ranges are START:STOP:STEP with a positive step: {option}",
+                param_hint=name,
+            )
+    return values
+
+
+def _dollars(cents: int) -> str:
+    """Returns an amount in cents as dollars."""
+    return f"${cents / 100:,.2f}"
+
+
+def _date(value: np.datetime64) -> str | None:
+    """Returns a date in ISO 8601 format, or None if it's NaT."""
+    return None if np.isnat(value) else str(value)
+
+
+def _size(num_bytes: float | None) -> str:
+    """Returns a number of bytes in KiB, MiB or GiB as fits."""
+    if num_bytes is None:
+        return "n/a"
+    for unit in ("bytes", "KiB", "MiB"):
+        if num_bytes < 1024:
+            return (
+                f"{num_bytes:.0f} {unit}"
+                if unit == "bytes"
+                else f"{num_bytes:.1f} {unit}"
+            )
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GiB"
+
+
+def _echo_write_result(result: str) -> None:
+    if result == "observed":
+        click.echo("Record unchanged since the previous scrape, noted as observed")
+    elif result == "duplicate":
+        click.echo("A scrape at the same time is already recorded, skipped")
+
+
+def _timestamp(value: dt.datetime | None) -> str | None:
+    """Returns a date and time option in the form of scrape timestamps."""
+    return None if value is None else str(value)
+
+
 @cli.group()
 def plot():
     """Data plotting functions."""
 
 
 @plot.command("balance")
-def plot_agg_balance() -> None:
+@click.option("--start", type=click.DateTime(), help="Plot scrapes from then on.")
+@click.option("--end", type=click.DateTime(), help="Plot scrapes before then.")
+@click.option(
+    "--resolution",
+    type=click.Choice(["scrape", *ROLLUP_RESOLUTIONS]),
+    default="scrape",
+    show_default=True,
+    help="Plot every scrape, or only the last of each day or month.",
+)
+def plot_agg_balance(
+    start: dt.datetime | None, end: dt.datetime | None, resolution: str
+) -> None:
     """Plot the aggregate balance of all loans over time."""
-    plot_aggregate_balance()
+    try:
+        plot_aggregate_balance(
+            _timestamp(start),
+            _timestamp(end),
+            None if resolution == "scrape" else resolution,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+
+
+@plot.command("loans")
+@click.option("--start", type=click.DateTime(), help="Plot scrapes from then on.")
+@click.option("--end", type=click.DateTime(), help="Plot scrapes before then.")
+@click.option(
+    "--resolution",
+    type=click.Choice(["scrape", *ROLLUP_RESOLUTIONS]),
+    default="scrape",
+    show_default=True,
+    help="Plot every scrape, or only the last of each day or month.",
+)
+@click.option("--loan", "loans", multiple=True, help="Only plot this loan.")
+@click.option("--group", "groups", multiple=True, help="Only plot loans in this group.")
+@click.option(
+    "--style",
+    type=click.Choice(PLOT_STYLES),
+    default="stacked",
+    show_default=True,
+    help="Stack the balances, or plot each on its own.",
+)
+def plot_loans(
+    start: dt.datetime | None,
+    end: dt.datetime | None,
+    resolution: str,
+    loans: tuple[str, ...],
+    groups: tuple[str, ...],
+    style: str,
+) -> None:
+    """Plot the principal balance of each loan over time.
+
+    --loan and --group may be given more than once.
+    """
+    try:
+        plot_loan_balances(
+            _timestamp(start),
+            _timestamp(end),
+            list(loans) or None,
+            list(groups) or None,
+            None if resolution == "scrape" else resolution,
+            style,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+
+
+@plot.command("groups")
+@click.option("--start", type=click.DateTime(), help="Plot scrapes from then on.")
+@click.option("--end", type=click.DateTime(), help="Plot scrapes before then.")
+@click.option(
+    "--resolution",
+    type=click.Choice(["scrape", *ROLLUP_RESOLUTIONS]),
+    default="scrape",
+    show_default=True,
+    help="Plot every scrape, or only the last of each day or month.",
+)
+@click.option("--group", "groups", multiple=True, help="Only plot this group.")
+@click.option(
+    "--style",
+    type=click.Choice(PLOT_STYLES),
+    default="stacked",
+    show_default=True,
+    help="Stack the balances, or plot each on its own.",
+)
+def plot_groups(
+    start: dt.datetime | None,
+    end: dt.datetime | None,
+    resolution: str,
+    groups: tuple[str, ...],
+    style: str,
+) -> None:
+    """Plot the principal balance of each loan group over time.
+
+    --group may be given more than once.
+    """
+    try:
+        plot_group_balances(
+            _timestamp(start),
+            _timestamp(end),
+            list(groups) or None,
+            None if resolution == "scrape" else resolution,
+            style,
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
@@ -0,0 +1,196 @@
+"""Thins out old scrapes and gives the space they took back to the file
+system, so that the database doesn't grow without bound.
+
+Every scrape from the last `keep_all_days` days is kept. Of older ones, the
+last scrape of each day is kept for up to `keep_daily_days` days, and the last
+of each month beyond that. Removing a record removes its rows in every table
+that refers to it, and loan details no remaining record holds. The rollups
+are left as they are, so they still summarize every scrape, removed ones
+included.
+"""
+
+import datetime as dt
+from pathlib import Path
+import sqlite3
+
+from .config import CONFIG
+from .connection import (
+    connection,
+    default_database_path,
+    transaction,
+    write_lock,
+)
+from .database import create_database
+from .migrations import delete_unheld_history
+from .rollup import ROLLUP_RESOLUTIONS
+
+
+def compact_database(
+    keep_all_days: int | None = None,
+    keep_daily_days: int | None = None,
+    now: dt.datetime | None = None,
+    dry_run: bool = False,
+    database_path: Path | None = None,
+) -> dict[str, int]:
+    """Removes the scrapes that the retention policy doesn't keep, as of
+    `now` or the current time, and vacuums the database. The number of days
+    default to `CONFIG.retention_all_days` and `CONFIG.retention_daily_days`.
+    Returns the number of "records", "observations" and "history_rows"
+    removed, and the size of the database in bytes "before" and "after".
+    With `dry_run`, the numbers are worked out but nothing is changed.
+    """
+    if keep_all_days is None:
+        keep_all_days = CONFIG.retention_all_days
+    if keep_daily_days is None:
+        keep_daily_days = CONFIG.retention_daily_days
+    if not 0 <= keep_all_days <= keep_daily_days:
+        raise ValueError(
+            "Scrapes must be kept for zero or more days, and daily ones at least"
+            " as long as all of them"
+        )
+    now = now or dt.datetime.now()
+    database_path = database_path or default_database_path()
+    with write_lock(database_path):
+        create_database(database_path)
+        with connection(database_path) as con:
+            before: int = _size(con)
+            with transaction(con):
+                con.execute("SAVEPOINT compact")
+                removed: dict[str, int] = _remove_scrapes(
+                    con,
+                    str(now - dt.timedelta(days=keep_all_days)),
+                    str(now - dt.timedelta(days=keep_daily_days)),
+                )
+                if dry_run:
+                    con.execute("ROLLBACK TO compact")
+                con.execute("RELEASE compact")
+            if not dry_run:
+                _vacuum(con)
+            return dict(**removed, before=before, after=_size(con))
+
+
+def _remove_scrapes(
+    con: sqlite3.Connection, all_since: str, daily_since: str
+) -> dict[str, int]:
+    """Removes the scrapes before `all_since` that aren't the last of their
+    day, or of their month if before `daily_since`, and returns how many
+    records, observations and history rows went.
+    """
+    con.execute(
+        """
+        CREATE TEMP TABLE compact_scrape AS
+        SELECT
+            is_observation, row_id, main_record_id, scrape_timestamp,
+            period IS NULL OR row_number() OVER (
+                PARTITION BY period
+                -- Of scrapes at the same time, main records stay.
+                ORDER BY scrape_timestamp DESC, is_observation, row_id DESC
+            ) == 1 AS kept
+        FROM (
+            SELECT
+                *,
+                CASE
+                    WHEN scrape_timestamp >= :all_since THEN NULL
+                    WHEN scrape_timestamp >= :daily_since
+                        THEN substr(scrape_timestamp, 1, :day_length)
+                    ELSE substr(scrape_timestamp, 1, :month_length)
+                END AS period
+            FROM (
+                SELECT 0 AS is_observation, row_id, row_id AS main_record_id,
+                    scrape_timestamp
+                FROM main_record
+                UNION ALL
+                SELECT 1, row_id, main_record_id, scrape_timestamp
+                FROM record_observation
+            )
+        )
+        """,
+        dict(
+            all_since=all_since,
+            daily_since=daily_since,
+            day_length=ROLLUP_RESOLUTIONS["day"],
+            month_length=ROLLUP_RESOLUTIONS["month"],
+        ),
+    )
+    # A record that goes, but has observations that stay, is still needed for
+    # their content. It takes over the earliest of them, which goes instead.
+    con.execute(
+        """
+        CREATE TEMP TABLE compact_takeover AS
+        SELECT main_record_id, row_id AS observation_id, scrape_timestamp
+        FROM (
+            SELECT
+                o.main_record_id, o.row_id, o.scrape_timestamp,
+                row_number() OVER (
+                    PARTITION BY o.main_record_id
+                    ORDER BY o.scrape_timestamp, o.row_id
+                ) AS n
+            FROM compact_scrape AS o
+            JOIN compact_scrape AS m
+                ON m.main_record_id == o.main_record_id AND NOT m.is_observation
+            WHERE o.is_observation AND o.kept AND NOT m.kept
+        )
+        WHERE n == 1
+        """
+    )
+    con.execute(
+        """
+        UPDATE main_record
+        SET scrape_timestamp = (
+            SELECT t.scrape_timestamp FROM compact_takeover AS t
+            WHERE t.main_record_id == main_record.row_id
+        )
+        WHERE row_id IN (SELECT main_record_id FROM compact_takeover)
+        """
+    )
+    observations: int = con.execute(
+        """
+        DELETE FROM record_observation
+        WHERE row_id IN (
+            SELECT row_id FROM compact_scrape WHERE is_observation AND NOT kept
+        )
+        OR row_id IN (SELECT observation_id FROM compact_takeover)
+        """
+    ).rowcount
+    # Deleting main records cascades to their rows in other tables.
+    records: int = con.execute(
+        """
+        DELETE FROM main_record
+        WHERE row_id IN (
+            SELECT row_id FROM compact_scrape WHERE NOT is_observation AND NOT kept
+        )
+        AND row_id NOT IN (SELECT main_record_id FROM compact_takeover)
+        """
+    ).rowcount
+    history_rows: int = delete_unheld_history(con)
+    con.execute("DROP TABLE compact_scrape")
+    con.execute("DROP TABLE compact_takeover")
+    return dict(
+        records=records,
+        observations=observations,
+        history_rows=history_rows,
+    )
+
+
+def _vacuum(con: sqlite3.Connection) -> None:
+    """Returns the free pages of the database to the file system. Databases
+    created before incremental vacuuming was turned on are vacuumed in full
+    once, which turns it on for them.
+    """
+    # PRAGMA auto_vacuum is 2 for incremental.
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        con.execute("PRAGMA incremental_vacuum")
+    else:
+        con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        con.execute("VACUUM")
+    # Shrink the write-ahead log, which the vacuum may have filled.
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _size(con: sqlite3.Connection) -> int:
+    """Returns the size of the database in bytes, without its write-ahead
+    log.
+    """
+    page_count: int = con.execute("PRAGMA page_count").fetchone()[0]
+    page_size: int = con.execute("PRAGMA page_size").fetchone()[0]
+    return page_count * page_size
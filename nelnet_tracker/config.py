@@ -1,26 +1,169 @@
 """Program configuration."""
 
 from pathlib import Path
+import re
 
 import platformdirs
 
+# Account names become part of file and directory names, so they're limited to
+# characters that can't leave the data directory.
+ACCOUNT_NAME_PATTERN: re.Pattern = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def check_account_name(account: str) -> str:
+    """Returns the account name, or raises a ValueError if it isn't safe to use
+    in paths.
+    """
+    if not ACCOUNT_NAME_PATTERN.fullmatch(account):
+        raise ValueError(
+            f"Invalid account name {account!r}: use only letters, digits,"
+            ' "_" and "-"'
+        )
+    return account
+
 
 class Config:
     def __init__(self) -> None:
         self.app_name: str = "nelnet_tracker"
         self.app_author: str = "Homebrew-Software"
         self.database_name: str = "nelnet_records.sqlite3"
+        # Name of the borrower account in use, or None for the default one.
+        # Each account has its own database, page sources and browser profile.
+        self.account: str | None = None
         self.plot_figure_size: tuple[int, int] = (10, 6)
+        # Whether plots keep the series they read in the cache directory, so
+        # that plotting again only reads the scrapes added since.
+        self.cache_plot_series: bool = True
+        # How the scraper reads the loaded page, "snapshot" or "per-field".
+        self.scrape_extraction: str = "snapshot"
+        # How the scraper expands loan groups, "all" or "sequential".
+        self.scrape_expansion: str = "all"
+        # Seconds to wait for the loans page before deciding a reused browser
+        # session has been logged out.
+        self.session_check_timeout: float = 10
+        # Seconds to wait for the user to log in when scraping several
+        # accounts at once.
+        self.login_timeout: float = 600
+        # Local port the scrape daemon listens on where there are no Unix
+        # domain sockets, e.g. on Windows.
+        self.daemon_port: int = 52117
+        # Seconds to wait for the scrape daemon to accept a request, and to
+        # respond to it, which may take a login.
+        self.daemon_connect_timeout: float = 10
+        self.daemon_response_timeout: float = 900
+        # Whether to save the page source of each scrape for later re-parsing.
+        self.save_page_sources: bool = True
+        # Browser profile used for scraping, "default" or "fast". The fast
+        # profile uses the eager page load strategy and doesn't load images,
+        # web fonts or anything from `blocked_hosts`.
+        self.scrape_profile: str = "default"
+        # Whether to carry on in a headless browser once the user has logged
+        # in. Mostly useful with the scrape daemon.
+        self.headless_after_login: bool = False
+        # Third-party hosts (and their subdomains) the fast profile blocks.
+        self.blocked_hosts: list[str] = [
+            "adobedtm.com",
+            "demdex.net",
+            "doubleclick.net",
+            "google-analytics.com",
+            "googletagmanager.com",
+            "hotjar.com",
+            "nr-data.net",
+            "omtrdc.net",
+            "quantummetric.com",
+        ]
+        # SQLite settings applied to every database connection, see
+        # https://www.sqlite.org/pragma.html.
+        # Page cache size per connection, in KiB.
+        self.sqlite_cache_size_kib: int = 16 * 1024
+        # Bytes of the database file to memory-map for reads, 0 to turn off.
+        self.sqlite_mmap_size: int = 256 * 1024 * 1024
+        # "OFF", "NORMAL", "FULL" or "EXTRA". With write-ahead logging,
+        # "NORMAL" can only lose the latest commits on a power failure, never
+        # corrupt the database.
+        self.sqlite_synchronous: str = "NORMAL"
+        # Milliseconds to wait for another connection to release a lock.
+        self.sqlite_busy_timeout: int = 5000
+        # Times to try taking the write lock again once the busy timeout has
+        # run out, waiting this many seconds before the first try and twice as
+        # long before each one after.
+        self.sqlite_begin_retries: int = 3
+        self.sqlite_begin_retry_delay: float = 0.5
+        # Seconds to wait for another process to finish writing to the
+        # database, e.g. a scheduled scrape while importing.
+        self.write_lock_timeout: float = 120
+        # Retention policy of `compact`: every scrape is kept for this many
+        # days, then the last scrape of each day until `retention_daily_days`,
+        # and the last of each month after that.
+        self.retention_all_days: int = 90
+        self.retention_daily_days: int = 365
+        # Months of payments `simulate` goes through before giving up on a
+        # strategy paying the loans off.
+        self.simulation_max_months: int = 600
+        # How far the interest accrued between two records of a loan may be
+        # from what its rate calls for before `reconcile` flags it: this many
+        # cents, for amounts being rounded, plus a fraction of the expected
+        # interest, for rounding of the daily interest.
+        self.accrual_tolerance_cents: float = 2
+        self.accrual_tolerance_fraction: float = 0.02
 
     @property
     def database_path(self) -> Path:
+        return self.database_path_for(self.account)
+
+    def database_path_for(self, account: str | None) -> Path:
+        name: str = self.database_name
+        if account is not None:
+            check_account_name(account)
+            path: Path = Path(name)
+            name = f"{path.stem}.{account}{path.suffix}"
+        return (
+            Path(
+                platformdirs.user_data_dir(
+                    appname=self.app_name, appauthor=self.app_author
+                )
+            )
+            / name
+        )
+
+    @property
+    def cache_dir(self) -> Path:
+        return Path(
+            platformdirs.user_cache_dir(
+                appname=self.app_name, appauthor=self.app_author
+            )
+        )
+
+    @property
+    def runtime_dir(self) -> Path:
+        return Path(
+            platformdirs.user_runtime_dir(
+                appname=self.app_name, appauthor=self.app_author
+            )
+        )
+
+    @property
+    def page_source_dir(self) -> Path:
+        return (
+            Path(
+                platformdirs.user_data_dir(
+                    appname=self.app_name, appauthor=self.app_author
+                )
+            )
+            / "page_sources"
+            / (check_account_name(self.account) if self.account else "")
+        )
+
+    @property
+    def browser_profile_dir(self) -> Path:
         return (
             Path(
                 platformdirs.user_data_dir(
                     appname=self.app_name, appauthor=self.app_author
                 )
             )
-            / self.database_name
+            / "browser_profiles"
+            / (check_account_name(self.account) if self.account else "default")
         )
 
 
@@ -0,0 +1,180 @@
+"""Opens database connections, all set up the same way from `CONFIG`.
+
+Databases use write-ahead logging, so that readers such as plots don't block
+the writer and vice versa. Writers from different processes, such as a
+scheduled `scrape` and a manual `from-json`, take turns through `write_lock`.
+"""
+
+import contextlib
+import functools
+from pathlib import Path
+import sqlite3
+import time
+from typing import IO, Iterator
+
+from .config import CONFIG
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Values accepted by PRAGMA synchronous.
+SYNCHRONOUS_MODES: tuple[str, ...] = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+@functools.lru_cache(maxsize=None)
+def _database_path_for(account: str | None) -> Path:
+    return CONFIG.database_path_for(account)
+
+
+def default_database_path() -> Path:
+    """Returns the database path of the current account. The path is only
+    worked out once per account.
+    """
+    return _database_path_for(CONFIG.account)
+
+
+def connect(
+    database_path: Path | None = None, read_only: bool = False
+) -> sqlite3.Connection:
+    """Opens a connection to the database at `database_path`, or the current
+    account's database, with the pragmas from `CONFIG` applied. A
+    `read_only` connection can't change the database, and fails to open if
+    it doesn't exist rather than creating it.
+
+    The connection is in autocommit mode, so write transactions must be
+    started explicitly, e.g. with `transaction`.
+    """
+    if CONFIG.sqlite_synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(
+            f"Unknown SQLite synchronous mode: {CONFIG.sqlite_synchronous!r}"
+        )
+    database_path = database_path or default_database_path()
+    con: sqlite3.Connection = sqlite3.connect(
+        f"{database_path.resolve().as_uri()}?mode=ro" if read_only else database_path,
+        isolation_level=None,
+        timeout=CONFIG.sqlite_busy_timeout / 1000,
+        uri=read_only,
+    )
+    if not read_only:
+        # New databases give the pages freed by `compact` back to the file
+        # system, see `compact._vacuum`. This must come before anything is
+        # written, and is only set on empty databases, as setting it waits
+        # for the write lock, which would hold up readers while another
+        # process writes.
+        if con.execute("PRAGMA page_count").fetchone()[0] == 0:
+            con.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # PRAGMA statements can't take parameters, hence the formatting.
+        con.execute("PRAGMA journal_mode = WAL")
+    con.execute(f"PRAGMA synchronous = {CONFIG.sqlite_synchronous}")
+    # A negative cache size is in KiB rather than pages.
+    con.execute(f"PRAGMA cache_size = {-CONFIG.sqlite_cache_size_kib:d}")
+    con.execute(f"PRAGMA mmap_size = {CONFIG.sqlite_mmap_size:d}")
+    con.execute(f"PRAGMA busy_timeout = {CONFIG.sqlite_busy_timeout:d}")
+    con.execute("PRAGMA foreign_keys = ON")
+    return con
+
+
+@contextlib.contextmanager
+def connection(
+    database_path: Path | None = None, read_only: bool = False
+) -> Iterator[sqlite3.Connection]:
+    """Context manager version of `connect` that closes the connection on
+    exit. Unlike using a `sqlite3.Connection` itself as a context manager,
+    this doesn't commit anything.
+    """
+    con: sqlite3.Connection = connect(database_path, read_only)
+    try:
+        yield con
+    finally:
+        con.close()
+
+
+@contextlib.contextmanager
+def transaction(con: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Runs the body in a transaction that takes the write lock up front,
+    committing on success and rolling back on any exception. If another
+    connection holds the lock for longer than the busy timeout, taking it is
+    retried up to `CONFIG.sqlite_begin_retries` times before giving up.
+    """
+    for attempt in range(CONFIG.sqlite_begin_retries + 1):
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            # Python 3.10 has no error codes on exceptions, only the message.
+            if attempt == CONFIG.sqlite_begin_retries or "locked" not in str(e):
+                raise
+            time.sleep(CONFIG.sqlite_begin_retry_delay * 2**attempt)
+    try:
+        yield con
+    except BaseException:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
+    con.execute("COMMIT")
+
+
+@contextlib.contextmanager
+def snapshot(con: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Runs the body in a read transaction, so that all of its queries see the
+    database as it was at the first one, whatever is written meanwhile.
+    """
+    con.execute("BEGIN")
+    try:
+        yield con
+    finally:
+        if con.in_transaction:
+            con.execute("COMMIT")
+
+
+@contextlib.contextmanager
+def write_lock(database_path: Path | None = None) -> Iterator[None]:
+    """Holds an advisory lock on a file next to the database for the body,
+    so that only one process at a time writes to it, migrations included.
+    Waits up to `CONFIG.write_lock_timeout` seconds for other processes to
+    finish. The lock isn't reentrant, even within one process.
+    """
+    database_path = database_path or default_database_path()
+    database_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path: Path = database_path.with_name(f"{database_path.name}.lock")
+    deadline: float = time.monotonic() + CONFIG.write_lock_timeout
+    with open(lock_path, "a+b") as lock_file:
+        while not _try_lock(lock_file):
+            if time.monotonic() >= deadline:
+                raise RuntimeError(
+                    f"Timed out waiting for another process writing to"
+                    f" {database_path}"
+                )
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            _unlock(lock_file)
+
+
+def _try_lock(lock_file: IO[bytes]) -> bool:
+    """Takes an exclusive lock on an open file without waiting, and returns
+    whether it did.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            # Windows locks a byte range, here the first byte.
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(lock_file: IO[bytes]) -> None:
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,281 @@
+"""Long-running scrape server that keeps one logged-in browser session alive
+between scrapes.
+
+Requests and responses are single lines of JSON. Where there are Unix domain
+sockets, the daemon listens on one in the user's runtime directory that only
+the user can connect to. Elsewhere, it listens on a local TCP port, which
+any local user can connect to, so requests must carry a random token that
+the daemon writes to a file only the user can read.
+
+Each account has its own daemon, socket and token, and a daemon refuses
+requests for any other account.
+"""
+
+import hmac
+import json
+import os
+from pathlib import Path
+import secrets
+import socket
+import socketserver
+import threading
+import traceback
+
+import click
+
+from .config import CONFIG, check_account_name
+from .scrape import WebScraper
+
+
+# Only accept TCP connections from this machine.
+DAEMON_HOST: str = "127.0.0.1"
+
+# Whether the daemon listens on a Unix domain socket rather than TCP.
+_UNIX_SOCKETS: bool = hasattr(socket, "AF_UNIX")
+
+
+def daemon_socket_path() -> Path:
+    """Returns the path of the Unix domain socket the daemon for
+    `CONFIG.account` listens on.
+    """
+    return CONFIG.runtime_dir / f"{_daemon_file_stem()}.sock"
+
+
+def daemon_token_path() -> Path:
+    """Returns the path of the file with the token that requests over TCP
+    to the daemon for `CONFIG.account` must carry.
+    """
+    return CONFIG.runtime_dir / f"{_daemon_file_stem()}.token"
+
+
+def _daemon_file_stem() -> str:
+    if CONFIG.account is None:
+        return "scrape_daemon"
+    return f"scrape_daemon.{check_account_name(CONFIG.account)}"
+
+
+def daemon_address(port: int = CONFIG.daemon_port) -> str:
+    """Returns where the daemon listens, for messages."""
+    return str(daemon_socket_path()) if _UNIX_SOCKETS else f"{DAEMON_HOST}:{port}"
+
+
+class ScrapeDaemon(socketserver.TCPServer):
+    """Serves scrape requests one at a time with a single `WebScraper`."""
+
+    address_family = socket.AF_UNIX if _UNIX_SOCKETS else socket.AF_INET
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        port: int = CONFIG.daemon_port,
+        profile: str = CONFIG.scrape_profile,
+        headless_after_login: bool = CONFIG.headless_after_login,
+    ) -> None:
+        # Token that requests must carry, over TCP only.
+        self.token: str | None = None
+        if _UNIX_SOCKETS:
+            path: Path = daemon_socket_path()
+            if path.exists():
+                # Left behind by a daemon that didn't shut down cleanly, unless
+                # one is still listening.
+                with socket.socket(socket.AF_UNIX) as sock:
+                    if sock.connect_ex(str(path)) == 0:
+                        raise RuntimeError(
+                            f"A scrape daemon is already running at {path}"
+                        )
+                path.unlink()
+            path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            super().__init__(str(path), _RequestHandler)
+        else:
+            self.token = secrets.token_hex(32)
+            _write_private(daemon_token_path(), self.token)
+            super().__init__((DAEMON_HOST, port), _RequestHandler)
+        # Account whose browser session and page sources the daemon uses.
+        self.account: str | None = CONFIG.account
+        self.profile: str = profile
+        self.headless_after_login: bool = headless_after_login
+        # Created on the first request, so that the browser opens when there
+        # is someone around to log in.
+        self.scraper: WebScraper | None = None
+
+    def scrape(self, request: dict) -> dict:
+        """Scrapes with the warm session, logging in again only if the session
+        has expired. Returns the response to send to the client.
+        """
+        if self.scraper is None:
+            self.scraper = WebScraper(
+                profile=self.profile, headless_after_login=self.headless_after_login
+            )
+        scraper: WebScraper = self.scraper
+
+        scraper.extraction = request.get("extraction", scraper.extraction)
+        scraper.expansion = request.get("expansion", scraper.expansion)
+        scraper.page_source_dir = (
+            CONFIG.page_source_dir if request.get("save_page", False) else None
+        )
+
+        logged_in: bool = scraper.reload()
+        if not logged_in:
+            if scraper.loans_url is not None:
+                click.echo("Browser session has expired.")
+            click.echo(
+                'Please navigate to the "My Loans" page, then return here to'
+                " press Enter."
+            )
+            scraper.login()
+        data: dict = scraper.scrape_loaded_page()
+        return dict(
+            ok=True,
+            data=data,
+            timings=scraper.timings,
+            reused_session=logged_in,
+        )
+
+    def server_bind(self) -> None:
+        if self.address_family != socket.AF_UNIX:
+            super().server_bind()
+            return
+        # The socket is created with the permissions the umask leaves, so
+        # only the user may connect from the start.
+        umask: int = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, 0o600)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.address_family == socket.AF_UNIX:
+            Path(self.server_address).unlink(missing_ok=True)
+        else:
+            daemon_token_path().unlink(missing_ok=True)
+        if self.scraper is not None:
+            self.scraper.driver.quit()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: ScrapeDaemon
+
+    def handle(self) -> None:
+        line: bytes = self.rfile.readline()
+        # Connections that send nothing, e.g. to see if a daemon is running,
+        # get no response.
+        if not line:
+            return
+        response: dict = self.respond(line)
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+    def respond(self, line: bytes) -> dict:
+        """Returns the response to a request line."""
+        try:
+            request: object = json.loads(line)
+        # Not JSON, or not UTF-8.
+        except ValueError as e:
+            return dict(ok=False, error=f"Invalid request: {e}")
+        if not isinstance(request, dict):
+            return dict(ok=False, error="Invalid request: not a JSON object")
+        if self.server.token is not None and not hmac.compare_digest(
+            str(request.get("token", "")), self.server.token
+        ):
+            return dict(ok=False, error="Invalid token")
+        if request.get("account") != self.server.account:
+            return dict(
+                ok=False,
+                error=(
+                    f"This daemon serves {_account_label(self.server.account)},"
+                    f" not {_account_label(request.get('account'))}"
+                ),
+            )
+        response: dict
+        command: str = request.get("command", "")
+        try:
+            if command == "scrape":
+                response = self.server.scrape(request)
+            elif command == "ping":
+                response = dict(ok=True)
+            elif command == "shutdown":
+                response = dict(ok=True)
+                # shutdown() waits for serve_forever() to return, so it can't
+                # be called from the thread that is serving this request.
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                response = dict(ok=False, error=f"Unknown command: {command!r}")
+        except Exception as e:
+            traceback.print_exc()
+            response = dict(ok=False, error=f"{type(e).__name__}: {e}")
+        return response
+
+
+def _account_label(account: object) -> str:
+    return "the default account" if account is None else f"account {account!r}"
+
+
+def run_daemon(
+    port: int = CONFIG.daemon_port,
+    profile: str = CONFIG.scrape_profile,
+    headless_after_login: bool = CONFIG.headless_after_login,
+) -> None:
+    """Serves scrape requests until shut down or interrupted."""
+    with ScrapeDaemon(port, profile, headless_after_login) as daemon:
+        click.echo(f"Listening on {daemon_address(port)}")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def send_request(request: dict, port: int = CONFIG.daemon_port) -> dict:
+    """Sends a request to the daemon for `CONFIG.account` and returns its
+    response. Raises a RuntimeError if there is no daemon, it takes longer than
+    `CONFIG.daemon_connect_timeout` to accept the request or
+    `CONFIG.daemon_response_timeout` to respond, which leaves time to log in,
+    or it reports an error.
+    """
+    request = dict(request, account=CONFIG.account)
+    try:
+        with _connect(port) as sock:
+            if not _UNIX_SOCKETS:
+                request = dict(request, token=daemon_token_path().read_text())
+            sock.settimeout(CONFIG.daemon_response_timeout)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line: bytes = f.readline()
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise RuntimeError(
+            f"No scrape daemon is running at {daemon_address(port)}"
+        ) from e
+    except socket.timeout as e:
+        raise RuntimeError(
+            f"The scrape daemon at {daemon_address(port)} didn't respond in time"
+        ) from e
+    if not line:
+        raise RuntimeError("Daemon closed the connection without responding")
+    response: dict = json.loads(line)
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response
+
+
+def _connect(port: int) -> socket.socket:
+    """Returns a connection to the daemon."""
+    if not _UNIX_SOCKETS:
+        return socket.create_connection(
+            (DAEMON_HOST, port), timeout=CONFIG.daemon_connect_timeout
+        )
+    sock: socket.socket = socket.socket(socket.AF_UNIX)
+    try:
+        sock.settimeout(CONFIG.daemon_connect_timeout)
+        sock.connect(str(daemon_socket_path()))
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def _write_private(path: Path, text: str) -> None:
+    """Writes a file that only the user can read and write."""
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    fd: int = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, "w") as f:
+        f.write(text)
@@ -1,470 +1,720 @@
 """Marshals data into a SQLite database."""
 
+import copy
+import hashlib
+import json
 import os
+from pathlib import Path
 import sqlite3
+from typing import Callable, Iterable, Iterator
+
+from .connection import (
+    connection,
+    default_database_path,
+    snapshot,
+    transaction,
+    write_lock,
+)
+from .migrations import TYPED_COLUMNS, migrate, migrate_database
+from .query import fetch_chunks, records_query
+from .rollup import update_rollups
+
+
+def create_database(database_path: Path | None = None) -> tuple[int, int]:
+    """Creates all the necessary database tables, or migrates an existing
+    database to the current schema. Returns the schema versions before and
+    after.
+    """
+    database_path = database_path or default_database_path()
+    database_path.parent.mkdir(parents=True, exist_ok=True)
+    with connection(database_path) as con:
+        return migrate(con)
 
-from .config import CONFIG
-
-
-def create_database() -> None:
-    """Creates all the necessary database tables."""
-    CONFIG.database_path.parent.mkdir(parents=True, exist_ok=True)
-
-    con: sqlite3.Connection = sqlite3.connect(CONFIG.database_path)
-    cur: sqlite3.Cursor = con.cursor()
 
-    # Top-level record data containing timestamp and high-level data.
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS main_record (
-            row_id INTEGER PRIMARY KEY,
-            scrape_timestamp TEXT NOT NULL,
-            past_due_amount TEXT NOT NULL,
-            monthly_payment_remaining TEXT NOT NULL,
-            current_amount_due TEXT NOT NULL,
-            due_date TEXT NOT NULL,
-            current_balance TEXT NOT NULL,
-            last_payment_received TEXT NOT NULL
-        )
-        """
-    )
-
-    # Group table for reference in many records.
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS loan_group (
-            row_id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL
-        )
-        """
+def delete_database() -> None:
+    """Removes the database from the file system. Warning: This cannot be
+    undone.
+    """
+    os.remove(default_database_path())
+
+
+# What writing a record can come to: a new main record is "inserted", a
+# record unchanged since the previous scrape is "observed", and a scrape with
+# the timestamp of one already in the database is a "duplicate" and skipped.
+WRITE_RESULTS: tuple[str, ...] = ("inserted", "observed", "duplicate")
+
+# Display text columns filled in by `DatabaseRecord` for each table, in the
+# order of the tuples it collects for them.
+_INSERT_COLUMNS: dict[str, tuple[str, ...]] = dict(
+    main_record=(
+        "scrape_timestamp",
+        "past_due_amount",
+        "monthly_payment_remaining",
+        "current_amount_due",
+        "due_date",
+        "current_balance",
+        "last_payment_received",
+        "content_hash",
+    ),
+    group_record=(
+        "main_record_id",
+        "group_id",
+        "loan_type",
+        "status",
+        "repayment_plan",
+    ),
+    payment_information=(
+        "main_record_id",
+        "group_id",
+        "current_amount_due",
+        "due_date",
+        "interest_rate",
+        "regular_monthly_payment_amount",
+        "last_payment_received",
+    ),
+    balance_information=(
+        "main_record_id",
+        "group_id",
+        "principal_balance",
+        "accrued_interest",
+        "fees",
+        "outstanding_balance",
+    ),
+    loan_current_information=(
+        "main_record_id",
+        "loan_id",
+        "group_id",
+        "group_placement",
+        "due_date",
+        "interest_rate",
+        "interest_rate_type",
+        "loan_term",
+        "principal_balance",
+        "accrued_interest",
+        "capitalized_interest",
+    ),
+    loan_record_history=(
+        "loan_id",
+        "valid_from",
+        "loan_type",
+        "loan_status",
+        "interest_subsidy",
+        "lender_name",
+        "school_name",
+    ),
+    loan_historic_information_history=(
+        "row_id",
+        "loan_id",
+        "valid_from",
+        "convert_to_repayment",
+        "original_loan_amount",
+    ),
+    loan_disbursement=("loan_historic_information_id", "info"),
+    loan_benefit_details_history=(
+        "loan_id",
+        "position",
+        "valid_from",
+        "name",
+        "status",
+    ),
+)
+
+# Columns of the tables that only get a row when a loan's values change, as
+# (columns telling apart the rows that hold at the same time, columns of
+# their values).
+_HISTORY_COLUMNS: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = dict(
+    loan_record_history=(
+        ("loan_id",),
+        (
+            "loan_type",
+            "loan_status",
+            "interest_subsidy",
+            "lender_name",
+            "school_name",
+        ),
+    ),
+    loan_historic_information_history=(
+        ("loan_id",),
+        ("convert_to_repayment", "original_loan_amount"),
+    ),
+    loan_benefit_details_history=(("loan_id", "position"), ("name", "status")),
+)
+
+
+def _insert_statement(table: str) -> str:
+    """Returns an INSERT statement for the text and typed columns of a table,
+    taking a tuple like those returned by `_with_typed_values`.
+    """
+    columns: list[str] = list(_INSERT_COLUMNS[table])
+    columns.extend(typed for typed, _, _ in TYPED_COLUMNS.get(table, ()))
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)})"
+        f" VALUES ({', '.join('?' * len(columns))})"
     )
 
-    # Group-level data per record.
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS group_record (
-            row_id INTEGER PRIMARY KEY,
-            main_record_id INTEGER NOT NULL,
-            group_id INTEGER NOT NULL,
-            loan_type TEXT NOT NULL,
-            status TEXT NOT NULL,
-            repayment_plan TEXT NOT NULL
-        )
-        """
-    )
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS payment_information (
-            row_id INTEGER PRIMARY KEY,
-            main_record_id INTEGER NOT NULL,
-            group_id INTEGER NOT NULL,
-            current_amount_due TEXT NOT NULL,
-            due_date TEXT NOT NULL,
-            interest_rate TEXT NOT NULL,
-            regular_monthly_payment_amount TEXT NOT NULL,
-            last_payment_received TEXT NOT NULL
-        )
-        """
-    )
+def _with_typed_values(table: str, rows: list[tuple]) -> list[tuple]:
+    """Returns rows of the text columns of a table, extended with the values
+    of its typed columns.
+    """
+    typed_columns: tuple[tuple[str, str, Callable], ...] = TYPED_COLUMNS.get(table, ())
+    if not typed_columns:
+        return rows
+    columns: tuple[str, ...] = _INSERT_COLUMNS[table]
+    parsers: list[tuple[int, Callable]] = [
+        (columns.index(text), parser) for _, text, parser in typed_columns
+    ]
+    return [row + tuple(parser(row[i]) for i, parser in parsers) for row in rows]
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS balance_information (
-            row_id INTEGER PRIMARY KEY,
-            main_record_id INTEGER NOT NULL,
-            group_id INTEGER NOT NULL,
-            principal_balance TEXT NOT NULL,
-            accrued_interest TEXT NOT NULL,
-            fees TEXT NOT NULL,
-            outstanding_balance TEXT NOT NULL
-        )
-        """
-    )
 
-    # Loan table for reference in many records.
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS loan (
-            row_id INTEGER PRIMARY KEY,
-            group_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            group_placement INTEGER NOT NULL
-        )
-        """
-    )
-
-    # Loan-level data per record.
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS loan_record (
-            row_id INTEGER PRIMARY KEY,
-            main_record_id INTEGER NOT NULL,
-            loan_id INTEGER NOT NULL,
-            loan_type TEXT NOT NULL,
-            loan_status TEXT NOT NULL,
-            interest_subsidy TEXT NOT NULL,
-            lender_name TEXT NOT NULL,
-            school_name TEXT NOT NULL
-        )
-        """
-    )
+class DatabaseRecord:
+    """A record to be inserted into the database."""
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS loan_current_information (
-            row_id INTEGER PRIMARY KEY,
-            main_record_id INTEGER NOT NULL,
-            loan_id INTEGER NOT NULL,
-            due_date TEXT NOT NULL,
-            interest_rate TEXT NOT NULL,
-            interest_rate_type TEXT NOT NULL,
-            loan_term TEXT NOT NULL,
-            principal_balance TEXT NOT NULL,
-            accrued_interest TEXT NOT NULL,
-            capitalized_interest TEXT NOT NULL
-        )
+    def __init__(self, data: dict, database_path: Path | None = None) -> None:
+        self.data: dict = data
+        self.database_path: Path = database_path or default_database_path()
+
+    def insert_all(self) -> str:
+        """Inserts all data into the database in a single transaction. If the
+        record's content is the same as the one before it, only an observation
+        of that record is inserted, and if a scrape with the same timestamp is
+        already in the database, nothing is. Returns which of
+        `WRITE_RESULTS` it came to.
         """
-    )
+        with connection(self.database_path) as con, transaction(con):
+            self.con: sqlite3.Connection = con
+            self.cur: sqlite3.Cursor = con.cursor()
+            return self.insert_in_transaction()
+
+    def insert_in_transaction(self) -> str:
+        if self.scrape_exists():
+            return "duplicate"
+        # Kept apart from the data, which belongs to the caller.
+        self.content_hash: str = record_content_hash(self.data)
+        previous_id: int | None = self.select_previous_record_id()
+        if previous_id is not None and self.content_hash == (
+            self.cur.execute(
+                "SELECT content_hash FROM main_record WHERE row_id == ?",
+                (previous_id,),
+            ).fetchone()[0]
+        ):
+            self.insert_observation(previous_id)
+            update_rollups(self.con, previous_id, self.data["scrape_timestamp"])
+            return "observed"
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS loan_historic_information (
-            row_id INTEGER PRIMARY KEY,
-            main_record_id INTEGER NOT NULL,
-            loan_id INTEGER NOT NULL,
-            convert_to_repayment TEXT NOT NULL,
-            original_loan_amount TEXT NOT NULL
+        main_record_id: int = self.insert_main_record()
+        group_ids: dict[str, int] = self.insert_loan_groups()
+        loan_ids: dict[str, int] = self.insert_loans(group_ids)
+        rows: dict[str, list[tuple]]
+        versions: dict[str, dict[tuple, tuple]]
+        rows, versions = self.collect_rows(main_record_id, group_ids, loan_ids)
+        closed: dict[str, list[int]] = self.collect_changes(
+            main_record_id, versions, rows
         )
+        for table, row_ids in closed.items():
+            self.cur.executemany(
+                f"UPDATE {table} SET valid_to = ? WHERE row_id == ?",
+                [(main_record_id, row_id) for row_id in row_ids],
+            )
+        for table, table_rows in rows.items():
+            self.cur.executemany(
+                _insert_statement(table), _with_typed_values(table, table_rows)
+            )
+        update_rollups(self.con, main_record_id, self.data["scrape_timestamp"])
+        return "inserted"
+
+    def scrape_exists(self) -> bool:
+        """Returns whether a main record or observation has this record's
+        scrape timestamp. Each table's timestamps are unique by index, and the
+        write lock held by the transaction keeps the two tables from sharing
+        one.
         """
-    )
+        return self.cur.execute(
+            """
+            SELECT
+                EXISTS (
+                    SELECT 1 FROM main_record
+                    WHERE scrape_timestamp == :scrape_timestamp
+                )
+                OR EXISTS (
+                    SELECT 1 FROM record_observation
+                    WHERE scrape_timestamp == :scrape_timestamp
+                )
+            """,
+            self.data,
+        ).fetchone()[0]
 
-    cur.execute(
+    def select_previous_record_id(self) -> int | None:
+        """Returns the ID of the main record that was current as of this
+        record's scrape timestamp, counting observations, if any.
         """
-        CREATE TABLE IF NOT EXISTS loan_disbursement (
-            row_id INTEGER PRIMARY KEY,
-            loan_historic_information_id INTEGER NOT NULL,
-            info TEXT NOT NULL
-        )
-        """
-    )
+        result: tuple | None = self.cur.execute(
+            """
+            SELECT main_record_id FROM (
+                SELECT * FROM (
+                    SELECT row_id AS main_record_id, scrape_timestamp
+                    FROM main_record
+                    WHERE scrape_timestamp <= :scrape_timestamp
+                    ORDER BY scrape_timestamp DESC
+                    LIMIT 1
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT main_record_id, scrape_timestamp
+                    FROM record_observation
+                    WHERE scrape_timestamp <= :scrape_timestamp
+                    ORDER BY scrape_timestamp DESC
+                    LIMIT 1
+                )
+            )
+            ORDER BY scrape_timestamp DESC
+            LIMIT 1
+            """,
+            self.data,
+        ).fetchone()
+        return None if result is None else result[0]
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS loan_benefit_details (
-            row_id INTEGER PRIMARY KEY,
-            main_record_id INTEGER NOT NULL,
-            loan_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            status TEXT NOT NULL
+    def insert_observation(self, main_record_id: int) -> None:
+        self.cur.execute(
+            """
+            INSERT INTO record_observation (main_record_id, scrape_timestamp)
+            VALUES (:main_record_id, :scrape_timestamp)
+            """,
+            dict(
+                main_record_id=main_record_id,
+                scrape_timestamp=self.data["scrape_timestamp"],
+            ),
         )
-        """
-    )
-
-    con.commit()
-    con.close()
-
-
-def delete_database() -> None:
-    """Removes the database from the file system. Warning: This cannot be
-    undone.
-    """
-    os.remove(CONFIG.database_path)
-
-
-class DatabaseRecord:
-    """A record to be inserted into the database."""
-
-    def __init__(self, data: dict) -> None:
-        self.data: dict = data
-
-    def insert_all(self) -> None:
-        """Inserts all data into the database."""
-        self.con: sqlite3.Connection = sqlite3.connect(CONFIG.database_path)
-        self.cur: sqlite3.Cursor = self.con.cursor()
-
-        self.propagate_blank_row_id()
-        main_record_id: int = self.insert_main_record()
-        self.propagate_main_record_id(main_record_id)
-        for group in self.data["groups"]:
-            group_id: int = self.insert_loan_group(group)
-            self.propagate_group_id(group_id)
-            self.insert_group_record(group)
-            self.insert_payment_information(group)
-            self.insert_balance_information(group)
-            for loan in group["loans"]:
-                loan_id: int = self.insert_loan(loan)
-                self.propagate_loan_id(loan_id)
-                self.insert_loan_record(loan)
-                self.insert_loan_current_information(loan)
-                historic_info_id: int = self.insert_loan_historic_information(loan)
-                self.insert_loan_disbursements(loan, historic_info_id)
-                self.insert_loan_benefit_details(loan)
-
-        self.con.commit()
-        self.con.close()
-
-    def propagate_blank_row_id(self) -> None:
-        """Inserts a None in each section of the data dictionary that will be
-        used as data in INSERT statements.
-        """
-        self.data["row_id"] = None
-        for group in self.data["groups"]:
-            group["row_id"] = None
-            group["payment_information"]["row_id"] = None
-            group["balance_information"]["row_id"] = None
-            for loan in group["loans"]:
-                loan["row_id"] = None
-                loan["current_information"]["row_id"] = None
-                loan["historic_information"]["row_id"] = None
 
     def insert_main_record(self) -> int:
         """Inserts the main record data into the database and returns the new
         main record ID.
         """
+        values: dict = dict(self.data, content_hash=self.content_hash)
+        row: tuple = tuple(values[c] for c in _INSERT_COLUMNS["main_record"])
         self.cur.execute(
-            """
-            INSERT INTO main_record VALUES (
-                :row_id,
-                :scrape_timestamp,
-                :past_due_amount,
-                :monthly_payment_remaining,
-                :current_amount_due,
-                :due_date,
-                :current_balance,
-                :last_payment_received
-            )
-            """,
-            self.data,
+            _insert_statement("main_record"),
+            _with_typed_values("main_record", [row])[0],
         )
         row_id: int | None = self.cur.lastrowid
         if row_id is None:
             raise RuntimeError("Didn't get the new main record ID")
         return row_id
 
-    def propagate_main_record_id(self, id_: int) -> None:
-        """Propagates the given main record ID into all areas of the data
-        dictionary for convenience when using pieces of it as data for SQLite
-        INSERT statements.
+    def insert_loan_groups(self) -> dict[str, int]:
+        """Inserts the record's loan groups that are not in the database yet
+        and returns the IDs of all of them by name.
         """
-        for group in self.data["groups"]:
-            group["main_record_id"] = id_
-            group["payment_information"]["main_record_id"] = id_
-            group["balance_information"]["main_record_id"] = id_
-            for loan in group["loans"]:
-                loan["main_record_id"] = id_
-                loan["current_information"]["main_record_id"] = id_
-                loan["historic_information"]["main_record_id"] = id_
+        names: list[str] = list(dict.fromkeys(g["name"] for g in self.data["groups"]))
+        ids: dict[str, int] = self.select_ids("loan_group", names)
+        self.cur.executemany(
+            "INSERT INTO loan_group (name) VALUES (?)",
+            [(name,) for name in names if name not in ids],
+        )
+        if len(ids) < len(names):
+            ids = self.select_ids("loan_group", names)
+        return ids
 
-    def insert_loan_group(self, group: dict) -> int:
-        """Inserts the given loan group into the database, if it does not
-        exist, and returns the new group ID.
-        """
-        self.cur.execute("SELECT row_id FROM loan_group WHERE name == :name", group)
-        result: tuple | None = self.cur.fetchone()
-        if result is None:
-            self.cur.execute("INSERT INTO loan_group VALUES (:row_id, :name)", group)
-            row_id: int | None = self.cur.lastrowid
-            if row_id is None:
-                raise RuntimeError("Didn't get the new loan group ID")
-            return row_id
-        return result[0]
-
-    def propagate_group_id(self, id_: int) -> None:
-        """Propagates the given loan group ID into all areas of the data
-        dictionary for convenience when using pieces of it as data for SQLite
-        INSERT statements.
+    def insert_loans(self, group_ids: dict[str, int]) -> dict[str, int]:
+        """Inserts the record's loans that are not in the database yet and
+        returns the IDs of all of them by name.
         """
+        # The first group a loan appears in, like its placement, is kept
+        # here, and the ones of each record with its current information.
+        new_loans: dict[str, tuple] = {}
         for group in self.data["groups"]:
-            group["group_id"] = id_
-            group["payment_information"]["group_id"] = id_
-            group["balance_information"]["group_id"] = id_
             for loan in group["loans"]:
-                loan["group_id"] = id_
-
-    def insert_group_record(self, group: dict) -> None:
-        self.cur.execute(
-            """
-            INSERT INTO group_record VALUES (
-                :row_id,
-                :main_record_id,
-                :group_id,
-                :loan_type,
-                :status,
-                :repayment_plan
-            )
-            """,
-            group,
+                new_loans.setdefault(
+                    loan["name"],
+                    (group_ids[group["name"]], loan["name"], loan["group_placement"]),
+                )
+        ids: dict[str, int] = self.select_ids("loan", list(new_loans))
+        self.cur.executemany(
+            "INSERT INTO loan (group_id, name, group_placement) VALUES (?, ?, ?)",
+            [row for name, row in new_loans.items() if name not in ids],
         )
+        if len(ids) < len(new_loans):
+            ids = self.select_ids("loan", list(new_loans))
+        return ids
 
-    def insert_payment_information(self, group: dict) -> None:
-        self.cur.execute(
-            """
-            INSERT INTO payment_information VALUES (
-                :row_id,
-                :main_record_id,
-                :group_id,
-                :current_amount_due,
-                :due_date,
-                :interest_rate,
-                :regular_monthly_payment_amount,
-                :last_payment_received
+    def select_ids(self, table: str, names: list[str]) -> dict[str, int]:
+        """Returns the IDs of the rows of a `loan_group` or `loan` table with
+        the given names, by name.
+        """
+        ids: dict[str, int] = {}
+        # Stay well under SQLite's limit on the number of query parameters.
+        for i in range(0, len(names), 500):
+            chunk: list[str] = names[i : i + 500]
+            ids.update(
+                (name, row_id)
+                for row_id, name in self.cur.execute(
+                    f"SELECT row_id, name FROM {table}"
+                    f" WHERE name IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
             )
-            """,
-            group["payment_information"],
-        )
+        return ids
+
+    def collect_rows(
+        self,
+        main_record_id: int,
+        group_ids: dict[str, int],
+        loan_ids: dict[str, int],
+    ) -> tuple[dict[str, list[tuple]], dict[str, dict[tuple, tuple]]]:
+        """Returns the rows to insert into each per-record table, as tuples
+        of the text columns in `_INSERT_COLUMNS`, and the values of each loan
+        for the tables of `_HISTORY_COLUMNS`, as (key columns) -> (value
+        columns). The values of historic information end with a tuple of its
+        disbursements.
+        """
+        rows: dict[str, list[tuple]] = {
+            table: [] for table in _INSERT_COLUMNS if table != "main_record"
+        }
+        versions: dict[str, dict[tuple, tuple]] = {
+            table: {} for table in _HISTORY_COLUMNS
+        }
 
-    def insert_balance_information(self, group: dict) -> None:
-        self.cur.execute(
-            """
-            INSERT INTO balance_information VALUES (
-                :row_id,
-                :main_record_id,
-                :group_id,
-                :principal_balance,
-                :accrued_interest,
-                :fees,
-                :outstanding_balance
+        for group in self.data["groups"]:
+            group_id: int = group_ids[group["name"]]
+            payment: dict = group["payment_information"]
+            balance: dict = group["balance_information"]
+            rows["group_record"].append(
+                (
+                    main_record_id,
+                    group_id,
+                    group["loan_type"],
+                    group["status"],
+                    group["repayment_plan"],
+                )
+            )
+            rows["payment_information"].append(
+                (
+                    main_record_id,
+                    group_id,
+                    payment["current_amount_due"],
+                    payment["due_date"],
+                    payment["interest_rate"],
+                    payment["regular_monthly_payment_amount"],
+                    payment["last_payment_received"],
+                )
+            )
+            rows["balance_information"].append(
+                (
+                    main_record_id,
+                    group_id,
+                    balance["principal_balance"],
+                    balance["accrued_interest"],
+                    balance["fees"],
+                    balance["outstanding_balance"],
+                )
             )
-            """,
-            group["balance_information"],
-        )
 
-    def insert_loan(self, loan: dict) -> int:
-        """Inserts the given loan into the database, if it does not exist, and
-        returns the new loan ID.
+            for loan in group["loans"]:
+                loan_id: int = loan_ids[loan["name"]]
+                current: dict = loan["current_information"]
+                historic: dict = loan["historic_information"]
+                rows["loan_current_information"].append(
+                    (
+                        main_record_id,
+                        loan_id,
+                        group_id,
+                        loan["group_placement"],
+                        current["due_date"],
+                        current["interest_rate"],
+                        current["interest_rate_type"],
+                        current["loan_term"],
+                        current["principal_balance"],
+                        current["accrued_interest"],
+                        current["capitalized_interest"],
+                    )
+                )
+                versions["loan_record_history"][(loan_id,)] = (
+                    loan["loan_type"],
+                    loan["loan_status"],
+                    loan["interest_subsidy"],
+                    loan["lender_name"],
+                    loan["school_name"],
+                )
+                versions["loan_historic_information_history"][(loan_id,)] = (
+                    historic["convert_to_repayment"],
+                    historic["original_loan_amount"],
+                    tuple(historic["disbursements"]),
+                )
+                for position, (name, status) in enumerate(loan["benefit_details"], 1):
+                    versions["loan_benefit_details_history"][(loan_id, position)] = (
+                        name,
+                        status,
+                    )
+        return rows, versions
+
+    def collect_changes(
+        self,
+        main_record_id: int,
+        versions: dict[str, dict[tuple, tuple]],
+        rows: dict[str, list[tuple]],
+    ) -> dict[str, list[int]]:
+        """Adds rows to `rows` for the `versions` that differ from the values
+        that held until now, and returns the IDs of the rows that stop holding
+        as of this record, by table.
         """
-        self.cur.execute("SELECT row_id FROM loan WHERE name == :name", loan)
-        result: tuple | None = self.cur.fetchone()
-        if result is None:
-            self.cur.execute(
-                "INSERT INTO loan VALUES (:row_id, :group_id, :name, :group_placement)",
-                loan,
-            )
-            row_id: int | None = self.cur.lastrowid
-            if row_id is None:
-                raise RuntimeError("Didn't get the new loan ID")
-            return row_id
-        return result[0]
-
-    def propagate_loan_id(self, id_: int) -> None:
-        """Propagates the given loan ID into all areas of the data dictionary
-        for convenience when using pieces of it as data for SQLite INSERT
-        statements.
+        # Historic information IDs are assigned here, rather than read back
+        # after each insert, so that disbursements can refer to them. The
+        # write lock held by the transaction keeps them free.
+        historic_info_id: int = self.cur.execute(
+            "SELECT coalesce(max(row_id), 0) FROM loan_historic_information_history"
+        ).fetchone()[0]
+
+        closed: dict[str, list[int]] = {}
+        for table, table_versions in versions.items():
+            held: dict[tuple, tuple[int, tuple]] = self.select_held_versions(table)
+            closed[table] = [
+                row_id
+                for key, (row_id, values) in held.items()
+                if table_versions.get(key) != values
+            ]
+            for key, values in table_versions.items():
+                if key in held and held[key][1] == values:
+                    continue
+                if table == "loan_historic_information_history":
+                    historic_info_id += 1
+                    *values, disbursements = values
+                    rows["loan_disbursement"].extend(
+                        (historic_info_id, disbursement)
+                        for disbursement in disbursements
+                    )
+                    key = (historic_info_id, *key)
+                rows[table].append((*key, main_record_id, *values))
+        return closed
+
+    def select_held_versions(self, table: str) -> dict[tuple, tuple[int, tuple]]:
+        """Returns the rows of a table of `_HISTORY_COLUMNS` that hold as of
+        the latest main record, as (key columns) -> (row ID, value columns),
+        in the same form as the versions from `collect_rows`.
         """
-        for group in self.data["groups"]:
-            for loan in group["loans"]:
-                loan["loan_id"] = id_
-                loan["current_information"]["loan_id"] = id_
-                loan["historic_information"]["loan_id"] = id_
-
-    def insert_loan_record(self, loan: dict) -> None:
-        self.cur.execute(
-            """
-            INSERT INTO loan_record VALUES (
-                :row_id,
-                :main_record_id,
-                :loan_id,
-                :loan_type,
-                :loan_status,
-                :interest_subsidy,
-                :lender_name,
-                :school_name
+        keys, values = _HISTORY_COLUMNS[table]
+        held: dict[tuple, tuple[int, tuple]] = {
+            tuple(row[1 : len(keys) + 1]): (row[0], tuple(row[len(keys) + 1 :]))
+            for row in self.cur.execute(
+                f"SELECT row_id, {', '.join(keys + values)} FROM {table}"
+                " WHERE valid_to IS NULL"
             )
-            """,
-            loan,
-        )
+        }
+        if table == "loan_historic_information_history":
+            disbursements: dict[int, list[str]] = {
+                row_id: [] for row_id, _ in held.values()
+            }
+            # CROSS JOIN keeps SQLite from reading every disbursement in
+            # order instead of looking up those of the rows that hold.
+            for row_id, info in self.cur.execute(
+                """
+                SELECT d.loan_historic_information_id, d.info
+                FROM loan_historic_information_history AS h
+                CROSS JOIN loan_disbursement AS d
+                    ON d.loan_historic_information_id == h.row_id
+                WHERE h.valid_to IS NULL
+                ORDER BY d.row_id
+                """
+            ):
+                disbursements[row_id].append(info)
+            held = {
+                key: (row_id, (*values, tuple(disbursements[row_id])))
+                for key, (row_id, values) in held.items()
+            }
+        return held
+
+
+def record_content_hash(data: dict) -> str:
+    """Returns a hash of everything in a record except when it was scraped,
+    so that unchanged scrapes have the same hash.
+    """
+    content: dict = {
+        k: v for k, v in data.items() if k not in ("scrape_timestamp", "content_hash")
+    }
+    canonical: str = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
 
-    def insert_loan_current_information(self, loan: dict) -> None:
-        self.cur.execute(
-            """
-            INSERT INTO loan_current_information VALUES (
-                :row_id,
-                :main_record_id,
-                :loan_id,
-                :due_date,
-                :interest_rate,
-                :interest_rate_type,
-                :loan_term,
-                :principal_balance,
-                :accrued_interest,
-                :capitalized_interest
-            )
+
+def write_record_to_database(data: dict, database_path: Path | None = None) -> str:
+    """Inserts a record entry into the database, holding `write_lock` so that
+    writers in other processes wait their turn. Returns which of
+    `WRITE_RESULTS` it came to, see `DatabaseRecord.insert_all`.
+    """
+    with write_lock(database_path):
+        create_database(database_path)
+        record: DatabaseRecord = DatabaseRecord(data, database_path)
+        return record.insert_all()
+
+
+def load_records(
+    con: sqlite3.Connection, main_record_ids: Iterable[int]
+) -> dict[int, dict]:
+    """Returns the main records with the given IDs, by ID, rebuilt in the
+    shape of the data from `scrape.scrape_all_data` they were written from.
+    This takes a handful of queries per 500 records, however many groups and
+    loans they have.
+    """
+    ids: list[int] = list(dict.fromkeys(main_record_ids))
+    overview: tuple[str, ...] = _INSERT_COLUMNS["main_record"][1:-1]
+    payment: tuple[str, ...] = _INSERT_COLUMNS["payment_information"][2:]
+    balance: tuple[str, ...] = _INSERT_COLUMNS["balance_information"][2:]
+    details: tuple[str, ...] = _INSERT_COLUMNS["loan_record_history"][2:]
+    current: tuple[str, ...] = _INSERT_COLUMNS["loan_current_information"][4:]
+    historic: tuple[str, ...] = _INSERT_COLUMNS["loan_historic_information_history"][3:]
+    # What each row of the later queries goes into.
+    records: dict[int, dict] = {}
+    groups: dict[tuple[int, str], dict] = {}
+    loans: dict[tuple[int, int], dict] = {}
+    historic_info: dict[int, list[dict]] = {}
+
+    for chunk in _id_chunks(ids):
+        placeholders: str = ", ".join("?" * len(chunk))
+        for row_id, *values in con.execute(
+            f"""
+            SELECT row_id, {", ".join(overview)}, scrape_timestamp
+            FROM main_record
+            WHERE row_id IN ({placeholders})
             """,
-            loan["current_information"],
-        )
+            chunk,
+        ):
+            records[row_id] = dict(
+                zip(overview, values), groups=[], scrape_timestamp=values[-1]
+            )
 
-    def insert_loan_historic_information(self, loan: dict) -> int:
-        """Inserts historic information for the given loan into the database
-        and returns the new loan historic information ID.
-        """
-        self.cur.execute(
-            """
-            INSERT INTO loan_historic_information VALUES (
-                :row_id,
-                :main_record_id,
-                :loan_id,
-                :convert_to_repayment,
-                :original_loan_amount
+        for main_record_id, name, loan_type, status, plan, *values in con.execute(
+            f"""
+            SELECT
+                g.main_record_id, lg.name, g.loan_type, g.status, g.repayment_plan,
+                {", ".join(f"p.{c}" for c in payment)},
+                {", ".join(f"b.{c}" for c in balance)}
+            FROM group_record AS g
+            JOIN loan_group AS lg ON lg.row_id == g.group_id
+            JOIN payment_information AS p
+                ON p.main_record_id == g.main_record_id AND p.group_id == g.group_id
+            JOIN balance_information AS b
+                ON b.main_record_id == g.main_record_id AND b.group_id == g.group_id
+            WHERE g.main_record_id IN ({placeholders})
+            ORDER BY g.row_id
+            """,
+            chunk,
+        ):
+            group: dict = dict(
+                name=name,
+                loan_type=loan_type,
+                status=status,
+                repayment_plan=plan,
+                payment_information=dict(zip(payment, values)),
+                balance_information=dict(zip(balance, values[len(payment) :])),
+                loans=[],
             )
+            records[main_record_id]["groups"].append(group)
+            groups[main_record_id, name] = group
+
+        for (
+            main_record_id,
+            loan_id,
+            group_name,
+            name,
+            placement,
+            *values,
+        ) in con.execute(
+            f"""
+            SELECT
+                c.main_record_id, c.loan_id, lg.name, l.name, c.group_placement,
+                {", ".join(f"r.{c}" for c in details)},
+                {", ".join(f"c.{c}" for c in current)},
+                h.row_id,
+                {", ".join(f"h.{c}" for c in historic)}
+            FROM loan_current_information AS c
+            JOIN loan AS l ON l.row_id == c.loan_id
+            JOIN loan_group AS lg ON lg.row_id == c.group_id
+            JOIN loan_record_history AS r
+                ON r.loan_id == c.loan_id
+                AND r.valid_from <= c.main_record_id
+                AND (r.valid_to IS NULL OR c.main_record_id < r.valid_to)
+            JOIN loan_historic_information_history AS h
+                ON h.loan_id == c.loan_id
+                AND h.valid_from <= c.main_record_id
+                AND (h.valid_to IS NULL OR c.main_record_id < h.valid_to)
+            WHERE c.main_record_id IN ({placeholders})
+            ORDER BY c.row_id
             """,
-            loan["historic_information"],
-        )
-        row_id: int | None = self.cur.lastrowid
-        if row_id is None:
-            raise RuntimeError("Didn't get the new historic information ID")
-        return row_id
-
-    def insert_loan_disbursements(self, loan: dict, historic_info_id: int) -> None:
-        for disbursement in loan["historic_information"]["disbursements"]:
-            self.cur.execute(
-                """
-                INSERT INTO loan_disbursement VALUES (
-                    :row_id,
-                    :loan_historic_information_id,
-                    :info
-                )
-                """,
-                dict(
-                    row_id=None,
-                    loan_historic_information_id=historic_info_id,
-                    info=disbursement,
+            chunk,
+        ):
+            historic_info_id: int = values[len(details) + len(current)]
+            loan: dict = dict(
+                name=name,
+                group_placement=placement,
+                **dict(zip(details, values)),
+                current_information=dict(zip(current, values[len(details) :])),
+                historic_information=dict(
+                    zip(historic, values[len(details) + len(current) + 1 :]),
+                    disbursements=[],
                 ),
+                benefit_details=[],
             )
-
-    def insert_loan_benefit_details(self, loan: dict) -> None:
-        for benefit in loan["benefit_details"]:
-            self.cur.execute(
-                """
-                INSERT INTO loan_benefit_details VALUES (
-                    :row_id,
-                    :main_record_id,
-                    :loan_id,
-                    :name,
-                    :status
-                )
-                """,
-                dict(
-                    row_id=None,
-                    main_record_id=loan["main_record_id"],
-                    loan_id=loan["loan_id"],
-                    name=benefit[0],
-                    status=benefit[1],
-                ),
+            groups[main_record_id, group_name]["loans"].append(loan)
+            loans[main_record_id, loan_id] = loan
+            historic_info.setdefault(historic_info_id, []).append(
+                loan["historic_information"]
             )
 
-
-def write_record_to_database(data: dict) -> None:
-    """Inserts a record entry into the database."""
-    record: DatabaseRecord = DatabaseRecord(data)
-    record.insert_all()
+        for main_record_id, loan_id, name, status in con.execute(
+            f"""
+            SELECT c.main_record_id, c.loan_id, d.name, d.status
+            FROM loan_current_information AS c
+            JOIN loan_benefit_details_history AS d
+                ON d.loan_id == c.loan_id
+                AND d.valid_from <= c.main_record_id
+                AND (d.valid_to IS NULL OR c.main_record_id < d.valid_to)
+            WHERE c.main_record_id IN ({placeholders})
+            ORDER BY c.main_record_id, c.loan_id, d.position
+            """,
+            chunk,
+        ):
+            loans[main_record_id, loan_id]["benefit_details"].append((name, status))
+
+    # Historic information is shared by the records it held for, so each of
+    # its disbursements is only read once.
+    historic_ids: list[int] = list(historic_info)
+    for chunk in _id_chunks(historic_ids):
+        for historic_info_id, info in con.execute(
+            f"""
+            SELECT loan_historic_information_id, info
+            FROM loan_disbursement
+            WHERE loan_historic_information_id IN ({", ".join("?" * len(chunk))})
+            ORDER BY row_id
+            """,
+            chunk,
+        ):
+            for info_dict in historic_info[historic_info_id]:
+                info_dict["disbursements"].append(info)
+    return records
+
+
+def read_records_from_database(
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+) -> Iterator[dict]:
+    """Yields each scrape from `start` up to but not including `end`,
+    observations of unchanged records included, in order, as rebuilt by
+    `load_records` with its own scrape timestamp. Records are loaded a chunk
+    at a time, all from one snapshot of the database.
+    """
+    migrate_database(database_path)
+    with connection(database_path) as con, snapshot(con):
+        for rows in fetch_chunks(con, records_query(("main_record_id",), start, end)):
+            records: dict[int, dict] = load_records(
+                con, (main_record_id for _, main_record_id in rows)
+            )
+            for scrape_timestamp, main_record_id in rows:
+                data: dict = copy.deepcopy(records[main_record_id])
+                data["scrape_timestamp"] = scrape_timestamp
+                yield data
 
 
-def select_all_balances() -> list[tuple[str, str]]:
-    """Returns all associated timestamps and aggregate balances."""
-    con = sqlite3.connect(CONFIG.database_path)
-    with con:
-        result: list[tuple[str, str]] = con.execute(
-            "SELECT scrape_timestamp, current_balance FROM main_record"
-        ).fetchall()
-    return result
+def _id_chunks(ids: list[int]) -> Iterator[list[int]]:
+    """Yields IDs in lists short enough to pass as query parameters."""
+    # Stay well under SQLite's limit on the number of query parameters.
+    for i in range(0, len(ids), 500):
+        yield ids[i : i + 500]
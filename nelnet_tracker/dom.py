@@ -0,0 +1,280 @@
+"""In-process document model for evaluating the scraper's XPaths without a
+browser round trip per lookup.
+"""
+
+import functools
+from html.parser import HTMLParser
+import re
+
+
+# One location step of the XPath subset used by the scraper, e.g. "div",
+# "div[3]" or "div[@class='ng-star-inserted'][2]".
+_STEP_PATTERN: re.Pattern = re.compile(
+    r"^(?P<name>[\w\-*]+)(?P<predicates>(\[[^\]]*\])*)$"
+)
+_PREDICATE_PATTERN: re.Pattern = re.compile(r"\[([^\]]*)\]")
+_ATTRIBUTE_PATTERN: re.Pattern = re.compile(
+    r"^@(?P<name>[\w\-]+)=(['\"])(?P<value>.*)\2$"
+)
+
+
+class DomNode:
+    """A single element of a document tree."""
+
+    def __init__(
+        self,
+        tag: str,
+        attrs: dict[str, str] | None = None,
+        text: str | None = None,
+        children: "list[DomNode] | None" = None,
+    ) -> None:
+        self.tag: str = tag
+        self.attrs: dict[str, str] = attrs or {}
+        self.children: list[DomNode] = children or []
+        # Text and child elements in document order. Only kept for nodes
+        # parsed from HTML, whose text is worked out when first asked for.
+        self.content: list[str | DomNode] = []
+        self._text: str | None = text
+
+    @property
+    def text(self) -> str:
+        """Rendered text of the element, equivalent to Selenium's
+        WebElement.text.
+        """
+        if self._text is None:
+            self._text = _normalize_text(_raw_text(self))
+        return self._text
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "DomNode":
+        """Builds a tree from the nested dictionaries returned by
+        `SNAPSHOT_SCRIPT`.
+        """
+        return cls(
+            tag=snapshot["tag"],
+            attrs=snapshot["attrs"],
+            text=snapshot["text"],
+            children=[cls.from_snapshot(child) for child in snapshot["children"]],
+        )
+
+    def __repr__(self) -> str:
+        return f"DomNode({self.tag}, {self.attrs})"
+
+
+# Serializes the element found at the XPath given as the first argument,
+# along with its whole subtree, so it can be queried without further round
+# trips to the browser.
+SNAPSHOT_SCRIPT: str = """
+const root = document.evaluate(
+    arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+).singleNodeValue;
+if (root === null) {
+    return null;
+}
+function walk(element) {
+    const attrs = {};
+    for (const attr of element.attributes) {
+        attrs[attr.name] = attr.value;
+    }
+    return {
+        tag: element.localName,
+        attrs: attrs,
+        text: (element.innerText || "").trim(),
+        children: Array.from(element.children).map(walk),
+    };
+}
+return walk(root);
+"""
+
+
+# Elements that never have content, so never get an end tag.
+_VOID_TAGS: frozenset[str] = frozenset(
+    (
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "source",
+        "track",
+        "wbr",
+    )
+)
+# Elements whose content is never rendered as text.
+_HIDDEN_TAGS: frozenset[str] = frozenset(
+    ("head", "noscript", "script", "style", "template", "title")
+)
+# Elements rendered inline by default. Everything else is treated as a block
+# and starts a new line of text, approximating what `innerText` gives.
+_INLINE_TAGS: frozenset[str] = frozenset(
+    (
+        "a",
+        "abbr",
+        "b",
+        "bdi",
+        "bdo",
+        "cite",
+        "code",
+        "em",
+        "i",
+        "label",
+        "mark",
+        "q",
+        "s",
+        "small",
+        "span",
+        "strong",
+        "sub",
+        "sup",
+        "time",
+        "u",
+    )
+)
+_WHITESPACE_PATTERN: re.Pattern = re.compile(r"[ \t\r\f\v]+")
+
+
+class _TreeBuilder(HTMLParser):
+    """Builds a `DomNode` tree out of an HTML document."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.document: DomNode = DomNode("#document")
+        self.stack: list[DomNode] = [self.document]
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        node: DomNode = DomNode(tag, {k: v or "" for k, v in attrs})
+        parent: DomNode = self.stack[-1]
+        parent.children.append(node)
+        parent.content.append(node)
+        if tag not in _VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_TAGS:
+            self.stack.pop()
+
+    def handle_endtag(self, tag: str) -> None:
+        # Tolerate unclosed elements by closing everything up to the nearest
+        # matching open tag. Stray end tags are ignored.
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data: str) -> None:
+        self.stack[-1].content.append(data)
+
+
+def _raw_text(node: DomNode) -> str:
+    """Returns the text of a node parsed from HTML, with line breaks around
+    block elements but whitespace not yet collapsed.
+    """
+    parts: list[str] = []
+    for item in node.content:
+        if isinstance(item, str):
+            parts.append(item)
+        elif item.tag == "br":
+            parts.append("\n")
+        elif item.tag in _HIDDEN_TAGS:
+            continue
+        elif item.tag in _INLINE_TAGS:
+            parts.append(_raw_text(item))
+        else:
+            parts.extend(("\n", _raw_text(item), "\n"))
+    return "".join(parts)
+
+
+def _normalize_text(raw: str) -> str:
+    lines = (_WHITESPACE_PATTERN.sub(" ", line).strip() for line in raw.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def parse_html(html: str) -> DomNode:
+    """Parses an HTML document, such as a saved `page_source`, and returns its
+    document node.
+    """
+    builder: _TreeBuilder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.document
+
+
+def evaluate_xpath(
+    context: DomNode,
+    xpath: str,
+    cache: dict[str, list[DomNode]] | None = None,
+) -> list[DomNode]:
+    """Returns the nodes matched by `xpath`, evaluated relative to `context`,
+    in document order.
+
+    Only the subset of XPath used by the scraper is supported: child steps
+    separated by "/", each optionally followed by attribute equality and
+    1-based position predicates.
+
+    Passing the same `cache` for lookups against the same context lets paths
+    that share a prefix, like the fields of one loan, reuse its result.
+    """
+    path: str = xpath.strip("/")
+    if cache is None:
+        nodes: list[DomNode] = [context]
+        for step in path.split("/"):
+            nodes = _evaluate_step(nodes, step)
+        return nodes
+    return _evaluate_cached(context, path, cache)
+
+
+def _evaluate_cached(
+    context: DomNode, path: str, cache: dict[str, list[DomNode]]
+) -> list[DomNode]:
+    nodes: list[DomNode] | None = cache.get(path)
+    if nodes is None:
+        parent, _, step = path.rpartition("/")
+        parent_nodes: list[DomNode] = (
+            _evaluate_cached(context, parent, cache) if parent else [context]
+        )
+        nodes = _evaluate_step(parent_nodes, step)
+        cache[path] = nodes
+    return nodes
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_step(step: str) -> tuple[str, tuple[str, ...]]:
+    match: re.Match | None = _STEP_PATTERN.match(step)
+    if match is None:
+        raise ValueError(f"Unsupported XPath step: {step!r}")
+    return match["name"], tuple(_PREDICATE_PATTERN.findall(match["predicates"]))
+
+
+def _evaluate_step(nodes: list[DomNode], step: str) -> list[DomNode]:
+    name: str
+    predicates: tuple[str, ...]
+    name, predicates = _parse_step(step)
+
+    result: list[DomNode] = []
+    for node in nodes:
+        candidates: list[DomNode] = [
+            child for child in node.children if name == "*" or child.tag == name
+        ]
+        for predicate in predicates:
+            candidates = _apply_predicate(candidates, predicate)
+        result.extend(candidates)
+    return result
+
+
+def _apply_predicate(candidates: list[DomNode], predicate: str) -> list[DomNode]:
+    predicate = predicate.strip()
+    if predicate.isdigit():
+        position: int = int(predicate)
+        if 1 <= position <= len(candidates):
+            return [candidates[position - 1]]
+        return []
+    match: re.Match | None = _ATTRIBUTE_PATTERN.match(predicate)
+    if match is None:
+        raise ValueError(f"Unsupported XPath predicate: [{predicate}]")
+    return [c for c in candidates if c.attrs.get(match["name"]) == match["value"]]
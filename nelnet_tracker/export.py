@@ -0,0 +1,270 @@
+"""Exports the recorded history as flat, typed tables for analysis, so that it
+doesn't have to be joined back together from the database every time.
+
+Each table is written to its own file, in one of `EXPORT_FORMATS`:
+
+- "npz": A NumPy .npz archive with an array per column, stored uncompressed.
+- "parquet": A Parquet file. This requires pyarrow, which isn't installed
+  with nelnet_tracker.
+
+Rows are read from the database and written out in chunks, so memory use
+doesn't grow with the length of the history.
+"""
+
+import contextlib
+from pathlib import Path
+import sqlite3
+import tempfile
+from typing import Callable, Iterator
+import zipfile
+
+import numpy as np
+
+from .connection import connection, snapshot
+from .migrations import migrate_database
+from .query import fetch_chunks, groups_query, loans_query, records_query
+
+
+# Formats `export_history` writes.
+EXPORT_FORMATS: tuple[str, ...] = ("npz", "parquet")
+# Rows read from the database and converted at a time.
+EXPORT_CHUNK_SIZE: int = 10_000
+
+# Tables written by `export_history`, as functions returning their queries
+# for a range of scrape timestamps. The type of a column follows from its
+# name, see `_column_type`.
+EXPORT_TABLES: dict[str, Callable[[str | None, str | None], tuple[str, dict]]] = dict(
+    records=lambda start, end: records_query(start=start, end=end),
+    groups=lambda start, end: groups_query(start=start, end=end),
+    loans=lambda start, end: loans_query(start=start, end=end),
+)
+
+
+def _column_type(name: str) -> str:
+    """Returns the NumPy type of an exported column by its name. Amounts in
+    cents and IDs are integers, rates in percent are floats, ISO dates and
+    scrape timestamps are dates and times, and the rest is text, which has
+    no fixed type.
+    """
+    if name == "scrape_timestamp":
+        return "datetime64[us]"
+    if name.endswith(("_cents", "_id")):
+        return "int64"
+    if name.endswith("_percent"):
+        return "float64"
+    if name.endswith("_iso"):
+        return "datetime64[D]"
+    return "str"
+
+
+class _Column:
+    """A column of an exported table, converted to NumPy a chunk at a time.
+
+    Missing values are NaN in floats and NaT in dates and times. Integers and
+    text have no such value, so missing ones are zero or empty, and true in a
+    mask of the same shape.
+    """
+
+    def __init__(self, name: str, num_missing: int, max_length: int | None) -> None:
+        # Name of the column in the query and the exported table.
+        self.name: str = name
+        # NumPy type of the values.
+        self.dtype: np.dtype = np.dtype(
+            f"<U{max(max_length or 0, 1)}"
+            if _column_type(name) == "str"
+            else _column_type(name)
+        )
+        # Whether any values are missing and need a mask.
+        self.masked: bool = num_missing > 0 and self.dtype.kind in "iU"
+
+    def convert(self, values: list) -> tuple[np.ndarray, np.ndarray | None]:
+        """Returns a chunk of values as an array, and a mask of the missing
+        ones if the column is masked.
+        """
+        if not self.masked:
+            return np.array(values, dtype=self.dtype), None
+        mask: np.ndarray = np.fromiter(
+            (v is None for v in values), dtype=bool, count=len(values)
+        )
+        filler: int | str = 0 if self.dtype.kind == "i" else ""
+        array: np.ndarray = np.array(
+            [filler if v is None else v for v in values], dtype=self.dtype
+        )
+        return array, mask
+
+
+def export_history(
+    output_dir: Path,
+    export_format: str = "npz",
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> dict[str, int]:
+    """Writes each table of `EXPORT_TABLES` to `output_dir` as
+    `<table>.<export_format>` and returns the number of rows of each. Only
+    scrapes from `start` up to but not including `end` are exported, if
+    given. All tables are read from the same snapshot of the database.
+    """
+    writers: dict[str, Callable] = dict(npz=_write_npz, parquet=_write_parquet)
+    if export_format not in writers:
+        raise ValueError(f"Unknown export format: {export_format!r}")
+    if export_format == "parquet":
+        _import_pyarrow()
+
+    migrate_database(database_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    num_rows: dict[str, int] = {}
+    with connection(database_path) as con, snapshot(con):
+        for table, table_query in EXPORT_TABLES.items():
+            query: tuple[str, dict] = table_query(start, end)
+            columns: list[_Column]
+            columns, num_rows[table] = _describe(con, query)
+            writers[export_format](
+                output_dir / f"{table}.{export_format}",
+                columns,
+                num_rows[table],
+                _chunks(con, query, columns, chunk_size),
+            )
+    return num_rows
+
+
+def _describe(
+    con: sqlite3.Connection, query: tuple[str, dict]
+) -> tuple[list[_Column], int]:
+    """Returns the columns of a query, and its number of rows, from a pass
+    over it that only counts. Text columns are as wide as their longest value.
+    """
+    sql, params = query
+    names: list[str] = [d[0] for d in con.execute(f"{sql} LIMIT 0", params).description]
+    aggregates: list[str] = ["count(*)"]
+    for name in names:
+        aggregates.append(f"count({name})")
+        aggregates.append(f"max(length({name}))")
+    stats: tuple = con.execute(
+        f"SELECT {', '.join(aggregates)} FROM ({sql})", params
+    ).fetchone()
+    num_rows: int = stats[0]
+    columns: list[_Column] = [
+        _Column(name, num_rows - stats[1 + 2 * i], stats[2 + 2 * i])
+        for i, name in enumerate(names)
+    ]
+    return columns, num_rows
+
+
+def _chunks(
+    con: sqlite3.Connection,
+    query: tuple[str, dict],
+    columns: list[_Column],
+    chunk_size: int,
+) -> Iterator[list[tuple[np.ndarray, np.ndarray | None]]]:
+    """Yields the rows of a query in chunks, converted to an array and mask
+    per column.
+    """
+    for rows in fetch_chunks(con, query, chunk_size):
+        yield [
+            column.convert(list(values)) for column, values in zip(columns, zip(*rows))
+        ]
+
+
+def _write_npz(
+    path: Path,
+    columns: list[_Column],
+    num_rows: int,
+    chunks: Iterator[list[tuple[np.ndarray, np.ndarray | None]]],
+) -> None:
+    """Writes a table as an uncompressed .npz archive with an array for each
+    column, plus `<column>_mask` for each masked one. The arrays are filled in
+    on disk before being archived, so the table is never in memory whole.
+    """
+    with tempfile.TemporaryDirectory(dir=path.parent) as tmp_dir:
+        dtypes: dict[str, np.dtype] = {}
+        for column in columns:
+            dtypes[column.name] = column.dtype
+            if column.masked:
+                dtypes[f"{column.name}_mask"] = np.dtype(bool)
+        filenames: dict[str, Path] = {
+            name: Path(tmp_dir) / f"{name}.npy" for name in dtypes
+        }
+        # The arrays are unmapped before archiving, so that their files are
+        # complete and can be deleted.
+        with contextlib.ExitStack() as stack:
+            arrays: dict[str, np.memmap] = {
+                name: stack.enter_context(
+                    _open_memmap(filenames[name], dtype, num_rows)
+                )
+                for name, dtype in dtypes.items()
+            }
+            start: int = 0
+            for chunk in chunks:
+                stop: int = start + len(chunk[0][0])
+                for column, (array, mask) in zip(columns, chunk):
+                    arrays[column.name][start:stop] = array
+                    if mask is not None:
+                        arrays[f"{column.name}_mask"][start:stop] = mask
+                start = stop
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for name, filename in filenames.items():
+                zf.write(filename, f"{name}.npy")
+
+
+@contextlib.contextmanager
+def _open_memmap(path: Path, dtype: np.dtype, num_rows: int) -> Iterator[np.memmap]:
+    """Creates a .npy file of `num_rows` values mapped into memory, and flushes
+    and unmaps it on exit.
+    """
+    array: np.memmap = np.lib.format.open_memmap(
+        path, mode="w+", dtype=dtype, shape=(num_rows,)
+    )
+    try:
+        yield array
+    finally:
+        array.flush()
+        array._mmap.close()
+
+
+def _write_parquet(
+    path: Path,
+    columns: list[_Column],
+    num_rows: int,
+    chunks: Iterator[list[tuple[np.ndarray, np.ndarray | None]]],
+) -> None:
+    """Writes a table as a Parquet file with a row group per chunk. Missing
+    values are nulls.
+    """
+    pa, pq = _import_pyarrow()
+    schema = pa.schema(
+        [pa.field(column.name, _arrow_type(pa, column.dtype)) for column in columns]
+    )
+    with contextlib.closing(pq.ParquetWriter(path, schema)) as writer:
+        for chunk in chunks:
+            writer.write_batch(
+                pa.record_batch(
+                    [
+                        pa.array(array, type=field.type, mask=mask, from_pandas=True)
+                        for field, (array, mask) in zip(schema, chunk)
+                    ],
+                    schema=schema,
+                )
+            )
+
+
+def _arrow_type(pa, dtype: np.dtype):
+    """Returns the Arrow type of a column of a NumPy type."""
+    if dtype.kind == "U":
+        return pa.string()
+    if dtype == np.dtype("datetime64[D]"):
+        return pa.date32()
+    return pa.from_numpy_dtype(dtype)
+
+
+def _import_pyarrow() -> tuple:
+    """Returns the pyarrow and pyarrow.parquet modules."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError(
+            "Exporting to Parquet requires pyarrow: pip install pyarrow"
+        ) from e
+    return pyarrow, pyarrow.parquet
@@ -0,0 +1,1025 @@
+"""Versioned changes to the database schema.
+
+Each migration brings the schema from one version to the next, and
+`PRAGMA user_version` records the version a database is at. Migrations are
+written so that running one again is harmless, because databases from before
+versions were recorded are at version 0 whatever state their schema is in.
+They keep their own copies of the definitions they apply, so that changing
+those later doesn't change what an old migration does.
+"""
+
+from pathlib import Path
+import sqlite3
+from typing import Callable
+
+from .connection import connection, default_database_path, transaction, write_lock
+from .parse import parse_cents, parse_date, parse_percent
+from .rollup import rebuild_rollups
+
+
+# Numbers and dates parsed from display text columns, stored alongside them
+# so that SQLite can sort and aggregate them, as (typed column, text column,
+# parser). Amounts are in cents, rates in percent and dates in ISO 8601.
+TYPED_COLUMNS: dict[str, tuple[tuple[str, str, Callable], ...]] = dict(
+    main_record=(
+        ("past_due_amount_cents", "past_due_amount", parse_cents),
+        ("monthly_payment_remaining_cents", "monthly_payment_remaining", parse_cents),
+        ("current_amount_due_cents", "current_amount_due", parse_cents),
+        ("due_date_iso", "due_date", parse_date),
+        ("current_balance_cents", "current_balance", parse_cents),
+        ("last_payment_received_cents", "last_payment_received", parse_cents),
+        ("last_payment_received_iso", "last_payment_received", parse_date),
+    ),
+    payment_information=(
+        ("current_amount_due_cents", "current_amount_due", parse_cents),
+        ("due_date_iso", "due_date", parse_date),
+        ("interest_rate_percent", "interest_rate", parse_percent),
+        (
+            "regular_monthly_payment_amount_cents",
+            "regular_monthly_payment_amount",
+            parse_cents,
+        ),
+        ("last_payment_received_cents", "last_payment_received", parse_cents),
+        ("last_payment_received_iso", "last_payment_received", parse_date),
+    ),
+    balance_information=(
+        ("principal_balance_cents", "principal_balance", parse_cents),
+        ("accrued_interest_cents", "accrued_interest", parse_cents),
+        ("fees_cents", "fees", parse_cents),
+        ("outstanding_balance_cents", "outstanding_balance", parse_cents),
+    ),
+    loan_current_information=(
+        ("due_date_iso", "due_date", parse_date),
+        ("interest_rate_percent", "interest_rate", parse_percent),
+        ("principal_balance_cents", "principal_balance", parse_cents),
+        ("accrued_interest_cents", "accrued_interest", parse_cents),
+        ("capitalized_interest_cents", "capitalized_interest", parse_cents),
+    ),
+    loan_historic_information_history=(
+        ("convert_to_repayment_iso", "convert_to_repayment", parse_date),
+        ("original_loan_amount_cents", "original_loan_amount", parse_cents),
+    ),
+    loan_disbursement=(
+        ("info_cents", "info", parse_cents),
+        ("info_iso", "info", parse_date),
+    ),
+)
+_PARSERS: dict[str, Callable] = {
+    f.__name__: f for f in (parse_cents, parse_date, parse_percent)
+}
+_SQL_TYPES: dict[str, str] = dict(
+    parse_cents="INTEGER", parse_date="TEXT", parse_percent="REAL"
+)
+
+
+def register_functions(con: sqlite3.Connection) -> None:
+    """Makes the parsers of `TYPED_COLUMNS` available to SQL run on `con`."""
+    for name, function in _PARSERS.items():
+        con.create_function(name, 1, function, deterministic=True)
+
+
+###############################################################################
+# MIGRATIONS
+###############################################################################
+
+
+def _create_tables(con: sqlite3.Connection) -> None:
+    """Creates the original tables. In databases that already have them, adds
+    the columns that were added by hand before migrations existed.
+    """
+    # Top-level record data containing timestamp and high-level data.
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS main_record (
+            row_id INTEGER PRIMARY KEY,
+            scrape_timestamp TEXT NOT NULL,
+            past_due_amount TEXT NOT NULL,
+            monthly_payment_remaining TEXT NOT NULL,
+            current_amount_due TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            current_balance TEXT NOT NULL,
+            last_payment_received TEXT NOT NULL
+        )
+        """
+    )
+
+    # Group table for reference in many records.
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan_group (
+            row_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+        """
+    )
+
+    # Group-level data per record.
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS group_record (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            loan_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            repayment_plan TEXT NOT NULL
+        )
+        """
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS payment_information (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            current_amount_due TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            interest_rate TEXT NOT NULL,
+            regular_monthly_payment_amount TEXT NOT NULL,
+            last_payment_received TEXT NOT NULL
+        )
+        """
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS balance_information (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            group_id INTEGER NOT NULL,
+            principal_balance TEXT NOT NULL,
+            accrued_interest TEXT NOT NULL,
+            fees TEXT NOT NULL,
+            outstanding_balance TEXT NOT NULL
+        )
+        """
+    )
+
+    # Loan table for reference in many records.
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan (
+            row_id INTEGER PRIMARY KEY,
+            group_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            group_placement INTEGER NOT NULL
+        )
+        """
+    )
+
+    # Loan-level data per record.
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan_record (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            loan_id INTEGER NOT NULL,
+            loan_type TEXT NOT NULL,
+            loan_status TEXT NOT NULL,
+            interest_subsidy TEXT NOT NULL,
+            lender_name TEXT NOT NULL,
+            school_name TEXT NOT NULL
+        )
+        """
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan_current_information (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            loan_id INTEGER NOT NULL,
+            due_date TEXT NOT NULL,
+            interest_rate TEXT NOT NULL,
+            interest_rate_type TEXT NOT NULL,
+            loan_term TEXT NOT NULL,
+            principal_balance TEXT NOT NULL,
+            accrued_interest TEXT NOT NULL,
+            capitalized_interest TEXT NOT NULL
+        )
+        """
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan_historic_information (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            loan_id INTEGER NOT NULL,
+            convert_to_repayment TEXT NOT NULL,
+            original_loan_amount TEXT NOT NULL
+        )
+        """
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan_disbursement (
+            row_id INTEGER PRIMARY KEY,
+            loan_historic_information_id INTEGER NOT NULL,
+            info TEXT NOT NULL
+        )
+        """
+    )
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loan_benefit_details (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            loan_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL
+        )
+        """
+    )
+
+    # Columns added to databases from before the past due amount and the
+    # regular monthly payment amount were scraped. Inserts name their
+    # columns, so the order they end up in doesn't matter.
+    _add_missing_columns(
+        con,
+        "main_record",
+        past_due_amount="TEXT NOT NULL DEFAULT ''",
+        monthly_payment_remaining="TEXT NOT NULL DEFAULT ''",
+    )
+    _add_missing_columns(
+        con,
+        "payment_information",
+        regular_monthly_payment_amount="TEXT NOT NULL DEFAULT ''",
+    )
+
+
+def _add_content_hashes(con: sqlite3.Connection) -> None:
+    """Adds content hashes to main records, and a table of observations of
+    unchanged records.
+    """
+    _add_missing_columns(con, "main_record", content_hash="TEXT")
+    con.execute(
+        """
+        CREATE INDEX IF NOT EXISTS main_record_content_hash
+        ON main_record (content_hash)
+        """
+    )
+
+    # Each later scrape whose content was identical to an existing main
+    # record, stored instead of a copy of that record.
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS record_observation (
+            row_id INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL,
+            scrape_timestamp TEXT NOT NULL
+        )
+        """
+    )
+
+
+# The columns `_add_typed_columns` adds, as (typed column, text column,
+# parser), by the name of their table at the time. Later changes to
+# `TYPED_COLUMNS` are made by migrations of their own.
+_ADDED_TYPED_COLUMNS: dict[str, tuple[tuple[str, str, Callable], ...]] = dict(
+    main_record=(
+        ("past_due_amount_cents", "past_due_amount", parse_cents),
+        ("monthly_payment_remaining_cents", "monthly_payment_remaining", parse_cents),
+        ("current_amount_due_cents", "current_amount_due", parse_cents),
+        ("due_date_iso", "due_date", parse_date),
+        ("current_balance_cents", "current_balance", parse_cents),
+        ("last_payment_received_cents", "last_payment_received", parse_cents),
+        ("last_payment_received_iso", "last_payment_received", parse_date),
+    ),
+    payment_information=(
+        ("current_amount_due_cents", "current_amount_due", parse_cents),
+        ("due_date_iso", "due_date", parse_date),
+        ("interest_rate_percent", "interest_rate", parse_percent),
+        (
+            "regular_monthly_payment_amount_cents",
+            "regular_monthly_payment_amount",
+            parse_cents,
+        ),
+        ("last_payment_received_cents", "last_payment_received", parse_cents),
+        ("last_payment_received_iso", "last_payment_received", parse_date),
+    ),
+    balance_information=(
+        ("principal_balance_cents", "principal_balance", parse_cents),
+        ("accrued_interest_cents", "accrued_interest", parse_cents),
+        ("fees_cents", "fees", parse_cents),
+        ("outstanding_balance_cents", "outstanding_balance", parse_cents),
+    ),
+    loan_current_information=(
+        ("due_date_iso", "due_date", parse_date),
+        ("interest_rate_percent", "interest_rate", parse_percent),
+        ("principal_balance_cents", "principal_balance", parse_cents),
+        ("accrued_interest_cents", "accrued_interest", parse_cents),
+        ("capitalized_interest_cents", "capitalized_interest", parse_cents),
+    ),
+    loan_historic_information=(
+        ("convert_to_repayment_iso", "convert_to_repayment", parse_date),
+        ("original_loan_amount_cents", "original_loan_amount", parse_cents),
+    ),
+    loan_disbursement=(
+        ("info_cents", "info", parse_cents),
+        ("info_iso", "info", parse_date),
+    ),
+)
+
+
+def _add_typed_columns(con: sqlite3.Connection) -> None:
+    """Adds the columns of `_ADDED_TYPED_COLUMNS` and fills them in from the
+    display text of existing rows, with one UPDATE per table.
+    """
+    for table, typed_columns in _ADDED_TYPED_COLUMNS.items():
+        added: dict[str, str] = _add_missing_columns(
+            con,
+            table,
+            **{
+                typed: _SQL_TYPES[parser.__name__] for typed, _, parser in typed_columns
+            },
+        )
+        assignments: list[str] = [
+            f"{typed} = {parser.__name__}({text})"
+            for typed, text, parser in typed_columns
+            if typed in added
+        ]
+        if assignments:
+            con.execute(f"UPDATE {table} SET {', '.join(assignments)}")
+
+
+# Column definitions of the tables given foreign keys by
+# `_add_foreign_keys_and_indexes`, without the columns added to them later.
+_FOREIGN_KEY_TABLES: dict[str, str] = dict(
+    record_observation="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        scrape_timestamp TEXT NOT NULL
+        """,
+    group_record="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        group_id INTEGER NOT NULL REFERENCES loan_group (row_id),
+        loan_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        repayment_plan TEXT NOT NULL
+        """,
+    payment_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        group_id INTEGER NOT NULL REFERENCES loan_group (row_id),
+        current_amount_due TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        interest_rate TEXT NOT NULL,
+        regular_monthly_payment_amount TEXT NOT NULL,
+        last_payment_received TEXT NOT NULL
+        """,
+    balance_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        group_id INTEGER NOT NULL REFERENCES loan_group (row_id),
+        principal_balance TEXT NOT NULL,
+        accrued_interest TEXT NOT NULL,
+        fees TEXT NOT NULL,
+        outstanding_balance TEXT NOT NULL
+        """,
+    loan="""
+        row_id INTEGER PRIMARY KEY,
+        group_id INTEGER NOT NULL REFERENCES loan_group (row_id),
+        name TEXT NOT NULL,
+        group_placement INTEGER NOT NULL
+        """,
+    loan_record="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        loan_id INTEGER NOT NULL REFERENCES loan (row_id),
+        loan_type TEXT NOT NULL,
+        loan_status TEXT NOT NULL,
+        interest_subsidy TEXT NOT NULL,
+        lender_name TEXT NOT NULL,
+        school_name TEXT NOT NULL
+        """,
+    loan_current_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        loan_id INTEGER NOT NULL REFERENCES loan (row_id),
+        due_date TEXT NOT NULL,
+        interest_rate TEXT NOT NULL,
+        interest_rate_type TEXT NOT NULL,
+        loan_term TEXT NOT NULL,
+        principal_balance TEXT NOT NULL,
+        accrued_interest TEXT NOT NULL,
+        capitalized_interest TEXT NOT NULL
+        """,
+    loan_historic_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        loan_id INTEGER NOT NULL REFERENCES loan (row_id),
+        convert_to_repayment TEXT NOT NULL,
+        original_loan_amount TEXT NOT NULL
+        """,
+    loan_disbursement="""
+        row_id INTEGER PRIMARY KEY,
+        loan_historic_information_id INTEGER NOT NULL
+            REFERENCES loan_historic_information (row_id) ON DELETE CASCADE,
+        info TEXT NOT NULL
+        """,
+    loan_benefit_details="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL
+            REFERENCES main_record (row_id) ON DELETE CASCADE,
+        loan_id INTEGER NOT NULL REFERENCES loan (row_id),
+        name TEXT NOT NULL,
+        status TEXT NOT NULL
+        """,
+)
+
+# Indexes for looking up loans and groups by name, records by time, and the
+# rows of a record or of a loan or group over time. Foreign key columns are
+# all covered, so that deleting a record doesn't scan its child tables.
+_INDEXES: dict[str, str] = dict(
+    main_record_scrape_timestamp="main_record (scrape_timestamp)",
+    record_observation_scrape_timestamp="record_observation (scrape_timestamp)",
+    record_observation_main_record="record_observation (main_record_id)",
+    loan_group_name="loan_group (name)",
+    group_record_main_record="group_record (main_record_id, group_id)",
+    group_record_group="group_record (group_id, main_record_id)",
+    payment_information_main_record="payment_information (main_record_id, group_id)",
+    payment_information_group="payment_information (group_id, main_record_id)",
+    balance_information_main_record="balance_information (main_record_id, group_id)",
+    balance_information_group="balance_information (group_id, main_record_id)",
+    loan_name="loan (name)",
+    loan_group_id="loan (group_id)",
+    loan_record_main_record="loan_record (main_record_id, loan_id)",
+    loan_record_loan="loan_record (loan_id, main_record_id)",
+    loan_current_information_main_record=(
+        "loan_current_information (main_record_id, loan_id)"
+    ),
+    loan_current_information_loan=(
+        "loan_current_information (loan_id, main_record_id)"
+    ),
+    loan_historic_information_main_record=(
+        "loan_historic_information (main_record_id, loan_id)"
+    ),
+    loan_historic_information_loan=(
+        "loan_historic_information (loan_id, main_record_id)"
+    ),
+    loan_disbursement_historic_information=(
+        "loan_disbursement (loan_historic_information_id)"
+    ),
+    loan_benefit_details_main_record="loan_benefit_details (main_record_id, loan_id)",
+    loan_benefit_details_loan="loan_benefit_details (loan_id, main_record_id)",
+)
+# Indexes whose columns are unique within their table.
+_UNIQUE_INDEXES: frozenset[str] = frozenset(("loan_group_name", "loan_name"))
+
+
+def _add_foreign_keys_and_indexes(con: sqlite3.Connection) -> None:
+    """Declares foreign keys between the tables, deleting the rows of a main
+    record along with it, and indexes the columns queries look rows up by.
+    """
+    for table, columns in _FOREIGN_KEY_TABLES.items():
+        if not con.execute(f"PRAGMA foreign_key_list({table})").fetchone():
+            _rebuild_table(con, table, columns)
+    for index, columns in _INDEXES.items():
+        unique: str = "UNIQUE " if index in _UNIQUE_INDEXES else ""
+        con.execute(f"CREATE {unique}INDEX IF NOT EXISTS {index} ON {columns}")
+
+
+# Column definitions of the tables holding loan data that rarely changes, with
+# a row per value rather than per record. A row holds for the main records
+# from `valid_from` up to but not including `valid_to`, or up to the latest
+# record while `valid_to` is NULL. The interval columns have no foreign keys,
+# as a row outlives the record it was first seen in.
+_HISTORY_TABLES: dict[str, str] = dict(
+    loan_record_history="""
+        row_id INTEGER PRIMARY KEY,
+        loan_id INTEGER NOT NULL REFERENCES loan (row_id),
+        valid_from INTEGER NOT NULL,
+        valid_to INTEGER,
+        loan_type TEXT NOT NULL,
+        loan_status TEXT NOT NULL,
+        interest_subsidy TEXT NOT NULL,
+        lender_name TEXT NOT NULL,
+        school_name TEXT NOT NULL
+        """,
+    loan_historic_information_history="""
+        row_id INTEGER PRIMARY KEY,
+        loan_id INTEGER NOT NULL REFERENCES loan (row_id),
+        valid_from INTEGER NOT NULL,
+        valid_to INTEGER,
+        convert_to_repayment TEXT NOT NULL,
+        original_loan_amount TEXT NOT NULL,
+        convert_to_repayment_iso TEXT,
+        original_loan_amount_cents INTEGER
+        """,
+    loan_benefit_details_history="""
+        row_id INTEGER PRIMARY KEY,
+        loan_id INTEGER NOT NULL REFERENCES loan (row_id),
+        valid_from INTEGER NOT NULL,
+        valid_to INTEGER,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        status TEXT NOT NULL
+        """,
+)
+
+# Per record queries of the tables replaced by `_HISTORY_TABLES`, as
+# (columns that must stay the same for the rows of consecutive records to
+# share a history row, query). The disbursements of historic information
+# count as part of its value.
+_HISTORY_SOURCES: dict[str, tuple[str, str]] = dict(
+    loan_record_history=(
+        "loan_id, loan_type, loan_status, interest_subsidy, lender_name,"
+        " school_name",
+        "SELECT * FROM loan_record",
+    ),
+    loan_historic_information_history=(
+        "loan_id, convert_to_repayment, original_loan_amount, disbursements",
+        """
+        SELECT h.*, (
+            SELECT coalesce(group_concat(info, char(30)), '') FROM (
+                SELECT info FROM loan_disbursement AS d
+                WHERE d.loan_historic_information_id == h.row_id
+                ORDER BY d.row_id
+            )
+        ) AS disbursements
+        FROM loan_historic_information AS h
+        """,
+    ),
+    loan_benefit_details_history=(
+        "loan_id, position, name, status",
+        """
+        SELECT *, ROW_NUMBER() OVER (
+            PARTITION BY main_record_id, loan_id ORDER BY row_id
+        ) AS position
+        FROM loan_benefit_details
+        """,
+    ),
+)
+
+# Views by the names of the tables replaced by `_HISTORY_TABLES`, with the
+# same rows and columns they had. Benefit details also have their position in
+# the list of a loan, since their IDs no longer follow it.
+_HISTORY_VIEWS: dict[str, str] = dict(
+    loan_record="""
+        h.row_id, m.row_id AS main_record_id, h.loan_id, h.loan_type,
+        h.loan_status, h.interest_subsidy, h.lender_name, h.school_name
+        FROM loan_record_history AS h
+        """,
+    loan_historic_information="""
+        h.row_id, m.row_id AS main_record_id, h.loan_id, h.convert_to_repayment,
+        h.original_loan_amount, h.convert_to_repayment_iso,
+        h.original_loan_amount_cents
+        FROM loan_historic_information_history AS h
+        """,
+    loan_benefit_details="""
+        h.row_id, m.row_id AS main_record_id, h.loan_id, h.name, h.status,
+        h.position
+        FROM loan_benefit_details_history AS h
+        """,
+)
+
+# Indexes for finding the rows of a loan over time, and the rows that still
+# hold, which each insert compares the new record against.
+_HISTORY_INDEXES: dict[str, str] = dict(
+    **{f"{table}_loan": f"{table} (loan_id, valid_from)" for table in _HISTORY_TABLES},
+    **{
+        f"{table}_open": f"{table} (loan_id) WHERE valid_to IS NULL"
+        for table in _HISTORY_TABLES
+    },
+    loan_disbursement_historic_information=(
+        "loan_disbursement (loan_historic_information_id)"
+    ),
+)
+
+
+def _add_validity_intervals(con: sqlite3.Connection) -> None:
+    """Replaces the per record copies of loan data that rarely changes with
+    `_HISTORY_TABLES`, collapsing runs of consecutive records with the same
+    values into one row each, and puts views with the old shape in their
+    place. Disbursements are kept for the first row of each run only.
+    """
+    # Consecutive main records have consecutive sequence numbers, even with
+    # gaps between their IDs.
+    con.execute(
+        """
+        CREATE TEMP TABLE record_sequence (
+            seq INTEGER PRIMARY KEY,
+            main_record_id INTEGER NOT NULL UNIQUE
+        )
+        """
+    )
+    con.execute(
+        """
+        INSERT INTO temp.record_sequence (main_record_id)
+        SELECT row_id FROM main_record ORDER BY row_id
+        """
+    )
+    for table, columns in _HISTORY_TABLES.items():
+        con.execute(f"CREATE TABLE {table} ({columns})")
+        values, source = _HISTORY_SOURCES[table]
+        value_columns: list[str] = [
+            row[1]
+            for row in con.execute(f"PRAGMA table_info({table})")
+            if row[1] not in ("row_id", "valid_from", "valid_to")
+        ]
+        # Rows with the same values whose record sequence numbers are
+        # consecutive have the same difference between their sequence number
+        # and their position among the rows with those values. Each run is
+        # identified by the ID of its first row.
+        con.execute(
+            f"""
+            INSERT INTO {table}
+                (row_id, valid_from, valid_to, {", ".join(value_columns)})
+            SELECT
+                run.row_id,
+                run.valid_from,
+                s.main_record_id,
+                {", ".join(f"run.{column}" for column in value_columns)}
+            FROM (
+                SELECT
+                    min(row_id) AS row_id,
+                    min(main_record_id) AS valid_from,
+                    max(seq) + 1 AS next_seq,
+                    {", ".join(f"min({c}) AS {c}" for c in value_columns)}
+                FROM (
+                    SELECT source.*, s.seq, s.seq - ROW_NUMBER() OVER (
+                        PARTITION BY {values} ORDER BY s.seq, source.row_id
+                    ) AS run_id
+                    FROM ({source}) AS source
+                    JOIN temp.record_sequence AS s USING (main_record_id)
+                )
+                GROUP BY {values}, run_id
+            ) AS run
+            LEFT JOIN temp.record_sequence AS s ON s.seq == run.next_seq
+            """
+        )
+    con.execute("DROP TABLE temp.record_sequence")
+
+    _rebuild_table(
+        con,
+        "loan_disbursement",
+        """
+        row_id INTEGER PRIMARY KEY,
+        loan_historic_information_id INTEGER NOT NULL
+            REFERENCES loan_historic_information_history (row_id)
+            ON DELETE CASCADE,
+        info TEXT NOT NULL
+        """,
+        where="""
+        loan_historic_information_id IN (
+            SELECT row_id FROM loan_historic_information_history
+        )
+        """,
+    )
+    for view, columns in _HISTORY_VIEWS.items():
+        con.execute(f"DROP TABLE {view}")
+        con.execute(
+            f"""
+            CREATE VIEW {view} AS SELECT {columns}
+            JOIN main_record AS m ON m.row_id >= h.valid_from
+                AND (h.valid_to IS NULL OR m.row_id < h.valid_to)
+            """
+        )
+    for index, columns in _HISTORY_INDEXES.items():
+        con.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {columns}")
+
+
+# The rollup tables `_add_rollups` adds, by the column of what is rolled up,
+# or None for records.
+_ADDED_ROLLUP_TABLES: dict[str, str | None] = dict(
+    record_rollup=None, group_rollup="group_id", loan_rollup="loan_id"
+)
+# Tables referenced by the rollup tables, by the referencing column.
+_ROLLUP_REFERENCES: dict[str, str] = dict(group_id="loan_group", loan_id="loan")
+# The amount columns of the rollup tables `_add_rollups` adds.
+_ADDED_ROLLUP_COLUMNS: tuple[str, ...] = tuple(
+    f"{stat}_{metric}_cents"
+    for metric in ("balance", "accrued_interest")
+    for stat in ("first", "last", "min", "max")
+)
+
+
+def _add_rollups(con: sqlite3.Connection) -> bool:
+    """Adds the tables of `_ADDED_ROLLUP_TABLES`, each with a row per
+    resolution, period and rolled up group or loan, to be filled in from the
+    existing records.
+    """
+    for table, key in _ADDED_ROLLUP_TABLES.items():
+        keys: list[str] = ["resolution", *([key] if key else []), "period"]
+        columns: list[str] = [
+            "row_id INTEGER PRIMARY KEY",
+            "resolution TEXT NOT NULL",
+            "period TEXT NOT NULL",
+        ]
+        if key:
+            columns.append(
+                f"{key} INTEGER NOT NULL REFERENCES {_ROLLUP_REFERENCES[key]} (row_id)"
+            )
+        columns += [
+            "num_scrapes INTEGER NOT NULL",
+            "first_timestamp TEXT NOT NULL",
+            "last_timestamp TEXT NOT NULL",
+        ]
+        columns += [f"{column} INTEGER" for column in _ADDED_ROLLUP_COLUMNS]
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+        # Rows are updated by these columns, and read by them in this order.
+        con.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_{key or 'period'}"
+            f" ON {table} ({', '.join(keys)})"
+        )
+        if key:
+            con.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_period"
+                f" ON {table} (resolution, period)"
+            )
+    return True
+
+
+# Tables besides record_observation with rows of each main record, which
+# deleting the record cascades to.
+_RECORD_TABLES: tuple[str, ...] = (
+    "group_record",
+    "payment_information",
+    "balance_information",
+    "loan_current_information",
+)
+
+
+def delete_unheld_history(con: sqlite3.Connection) -> int:
+    """Deletes the rows of `_HISTORY_TABLES` that no remaining main record
+    holds, and the disbursements of those, and returns how many rows of
+    `_HISTORY_TABLES` went. Disbursements are deleted explicitly, as foreign
+    keys are off during migrations.
+    """
+    deleted: int = 0
+    for table in _HISTORY_TABLES:
+        deleted += con.execute(
+            f"""
+            DELETE FROM {table}
+            WHERE NOT EXISTS (
+                SELECT 1 FROM main_record AS m
+                WHERE m.row_id >= {table}.valid_from
+                AND ({table}.valid_to IS NULL OR m.row_id < {table}.valid_to)
+            )
+            """
+        ).rowcount
+    con.execute(
+        """
+        DELETE FROM loan_disbursement
+        WHERE loan_historic_information_id NOT IN (
+            SELECT row_id FROM loan_historic_information_history
+        )
+        """
+    )
+    return deleted
+
+
+def _add_unique_scrape_timestamps(con: sqlite3.Connection) -> bool:
+    """Makes the scrape timestamps of main records and of observations
+    unique, so that writing a scrape again can be told apart and skipped.
+    Scrapes written more than once before, e.g. by importing the same file
+    twice, are merged into the first: later observations at the time of a
+    main record or an earlier observation are deleted, and later main records
+    at the same time as an earlier one are deleted, their observations moved
+    to the earlier one. The rollups need rebuilding if anything was deleted.
+    """
+    deleted: int = con.execute(
+        """
+        DELETE FROM record_observation
+        WHERE EXISTS (
+            SELECT 1 FROM main_record AS m
+            WHERE m.scrape_timestamp == record_observation.scrape_timestamp
+        )
+        OR EXISTS (
+            SELECT 1 FROM record_observation AS o
+            WHERE o.scrape_timestamp == record_observation.scrape_timestamp
+            AND o.row_id < record_observation.row_id
+        )
+        """
+    ).rowcount
+    con.execute(
+        """
+        CREATE TEMP TABLE duplicate_record AS
+        SELECT m.row_id, min(k.row_id) AS kept_id
+        FROM main_record AS m
+        JOIN main_record AS k
+            ON k.scrape_timestamp == m.scrape_timestamp AND k.row_id < m.row_id
+        GROUP BY m.row_id
+        """
+    )
+    con.execute(
+        """
+        UPDATE record_observation
+        SET main_record_id = (
+            SELECT kept_id FROM temp.duplicate_record
+            WHERE row_id == record_observation.main_record_id
+        )
+        WHERE main_record_id IN (SELECT row_id FROM temp.duplicate_record)
+        """
+    )
+    for table in _RECORD_TABLES:
+        con.execute(
+            f"""
+            DELETE FROM {table}
+            WHERE main_record_id IN (SELECT row_id FROM temp.duplicate_record)
+            """
+        )
+    deleted += con.execute(
+        """
+        DELETE FROM main_record
+        WHERE row_id IN (SELECT row_id FROM temp.duplicate_record)
+        """
+    ).rowcount
+    con.execute("DROP TABLE temp.duplicate_record")
+    if deleted:
+        delete_unheld_history(con)
+    for table in ("main_record", "record_observation"):
+        con.execute(f"DROP INDEX IF EXISTS {table}_scrape_timestamp")
+        con.execute(
+            f"CREATE UNIQUE INDEX {table}_scrape_timestamp"
+            f" ON {table} (scrape_timestamp)"
+        )
+    return bool(deleted)
+
+
+def _add_loan_placements(con: sqlite3.Connection) -> None:
+    """Adds the group and placement of each loan in each record to
+    loan_current_information, as they can change from one record to the
+    next. Existing rows get the ones the loan was first recorded with, the
+    only ones kept until now.
+    """
+    added: dict[str, str] = _add_missing_columns(
+        con,
+        "loan_current_information",
+        group_id="INTEGER REFERENCES loan_group (row_id)",
+        group_placement="INTEGER",
+    )
+    if added:
+        con.execute(
+            """
+            UPDATE loan_current_information
+            SET (group_id, group_placement) = (
+                SELECT group_id, group_placement FROM loan
+                WHERE loan.row_id == loan_current_information.loan_id
+            )
+            """
+        )
+
+
+def _add_rollup_generation(con: sqlite3.Connection) -> None:
+    """Adds a single-row table with a count of rollup rebuilds, which tells
+    caches of rollups that they were rebuilt even when the records are the
+    same.
+    """
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rollup_generation (
+            generation INTEGER NOT NULL
+        )
+        """
+    )
+    con.execute(
+        """
+        INSERT INTO rollup_generation (generation)
+        SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM rollup_generation)
+        """
+    )
+
+
+# Migrations in order. A database at version N has had the first N applied.
+# Each returns whether the rollups need rebuilding, which `migrate` does with
+# `rollup.rebuild_rollups` once the schema is the one it is written for.
+MIGRATIONS: tuple[Callable[[sqlite3.Connection], bool | None], ...] = (
+    _create_tables,
+    _add_content_hashes,
+    _add_typed_columns,
+    _add_foreign_keys_and_indexes,
+    _add_validity_intervals,
+    _add_rollups,
+    _add_unique_scrape_timestamps,
+    _add_loan_placements,
+    _add_rollup_generation,
+)
+# Version of the schema this code reads and writes.
+SCHEMA_VERSION: int = len(MIGRATIONS)
+
+
+###############################################################################
+# ENGINE
+###############################################################################
+
+
+def schema_version(con: sqlite3.Connection) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(con: sqlite3.Connection) -> tuple[int, int]:
+    """Applies any migrations the database is missing, in a single
+    transaction, and returns its schema versions before and after. `con`
+    must be in autocommit mode, like those from `connection.connect`.
+    """
+    version: int = schema_version(con)
+    if version == SCHEMA_VERSION:
+        return version, version
+
+    # Tables may be dropped and recreated along the way, which mustn't
+    # cascade, so foreign keys are checked all at once at the end instead.
+    # The pragma has no effect inside a transaction.
+    foreign_keys: int = con.execute("PRAGMA foreign_keys").fetchone()[0]
+    con.execute("PRAGMA foreign_keys = OFF")
+    try:
+        # The transaction takes the write lock before the version is checked
+        # again, in case another process has migrated the database meanwhile.
+        with transaction(con):
+            version = schema_version(con)
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(
+                    f"Database schema version {version} is newer than the latest"
+                    f" this version of nelnet_tracker knows about"
+                    f" ({SCHEMA_VERSION})"
+                )
+            register_functions(con)
+            stale_rollups: bool = False
+            for migration in MIGRATIONS[version:]:
+                stale_rollups = bool(migration(con)) or stale_rollups
+            if stale_rollups:
+                rebuild_rollups(con)
+
+            violation: tuple | None = con.execute("PRAGMA foreign_key_check").fetchone()
+            if violation is not None:
+                raise RuntimeError(
+                    f"Row {violation[1]} of {violation[0]} refers to a missing row"
+                    f" of {violation[2]}"
+                )
+            # PRAGMA statements can't take parameters.
+            con.execute(f"PRAGMA user_version = {SCHEMA_VERSION:d}")
+    finally:
+        con.execute(f"PRAGMA foreign_keys = {foreign_keys:d}")
+    return version, SCHEMA_VERSION
+
+
+def _add_missing_columns(
+    con: sqlite3.Connection, table: str, **columns: str
+) -> dict[str, str]:
+    """Adds the columns, given as name=definition, that `table` doesn't have
+    yet, and returns the ones that were added.
+    """
+    existing: set[str] = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    added: dict[str, str] = {}
+    for name, definition in columns.items():
+        if name not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            added[name] = definition
+    return added
+
+
+def _rebuild_table(
+    con: sqlite3.Connection, table: str, columns: str, where: str = ""
+) -> None:
+    """Recreates a table with new column definitions and copies its rows over
+    with one INSERT ... SELECT, for changes that ALTER TABLE can't make, like
+    adding foreign keys. Columns the table has beyond `columns`, such as ones
+    added by later migrations, are kept. Only the rows matching `where` are
+    copied if it's given.
+    """
+    new_table: str = f"{table}_new"
+    con.execute(f"CREATE TABLE {new_table} ({columns})")
+    new_columns: set[str] = {
+        row[1] for row in con.execute(f"PRAGMA table_info({new_table})")
+    }
+    old_columns: list[str] = []
+    for _, name, type_, *_ in con.execute(f"PRAGMA table_info({table})").fetchall():
+        if name not in new_columns:
+            con.execute(f"ALTER TABLE {new_table} ADD COLUMN {name} {type_}")
+        old_columns.append(name)
+    column_list: str = ", ".join(old_columns)
+    con.execute(
+        f"INSERT INTO {new_table} ({column_list}) SELECT {column_list} FROM {table}"
+        + (f" WHERE {where}" if where else "")
+    )
+    con.execute(f"DROP TABLE {table}")
+    con.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+
+
+def migrate_database(database_path: Path | None = None) -> tuple[int, int]:
+    """Migrates the database at `database_path`, or the current account's,
+    holding `connection.write_lock` while it does, and returns its schema
+    versions before and after. Everything that reads the database calls this
+    first, so that databases from older versions read like new ones. Readers
+    only wait for the lock when there is something to migrate.
+    """
+    database_path = database_path or default_database_path()
+    database_path.parent.mkdir(parents=True, exist_ok=True)
+    with connection(database_path) as con:
+        version: int = schema_version(con)
+    if version == SCHEMA_VERSION:
+        return version, version
+    with write_lock(database_path), connection(database_path) as con:
+        return migrate(con)
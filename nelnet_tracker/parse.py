@@ -0,0 +1,283 @@
+"""Parses values as displayed on the Nelnet website into numbers and dates that
+can be stored and computed with.
+
+Each parser returns None for text it doesn't recognize, such as an empty field
+or "N/A", rather than raising. Results are cached, since the same dates and
+amounts recur throughout a record.
+
+The `*_array` versions parse whole columns at once into NumPy arrays. Text in
+the usual format, like "$12,345.67", "4.530% Fixed" or "10/15/2024", is parsed
+with array operations on a fixed-width byte string array of the column, and
+anything else by the parser for single values, so that both give the same
+results.
+"""
+
+import functools
+import re
+from typing import Iterable
+
+import numpy as np
+
+
+# A dollar amount like "$12,345.67", "-$5.00" or "($5.00)".
+_AMOUNT_PATTERN: re.Pattern = re.compile(
+    r"(?P<open>\()?(?P<sign>-)?\s*\$\s*(?P<dollars>\d[\d,]*)(?:\.(?P<cents>\d{1,2}))?"
+    r"(?(open)\))"
+)
+# A percentage like "4.530%", "4.53 %" or ".5%", not part of a longer number.
+_PERCENT_PATTERN: re.Pattern = re.compile(
+    r"(?P<value>-?(?<![\d.])(?:\d+(?:\.\d+)?|\.\d+))\s*%"
+)
+# A date as displayed, like "10/15/2024".
+_DATE_PATTERN: re.Pattern = re.compile(
+    r"\b(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4})\b"
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_cents(text: str | None) -> int | None:
+    """Returns the first dollar amount in `text` as a whole number of cents,
+    e.g. 1234567 for "$12,345.67". Amounts with a minus sign or in
+    parentheses are negative.
+    """
+    if not text:
+        return None
+    match: re.Match | None = _AMOUNT_PATTERN.search(text)
+    if match is None:
+        return None
+    cents: int = int(match["dollars"].replace(",", "")) * 100 + int(
+        (match["cents"] or "0").ljust(2, "0")
+    )
+    if match["sign"] or match["open"]:
+        cents = -cents
+    return cents
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_percent(text: str | None) -> float | None:
+    """Returns the first percentage in `text` as a number of percent, e.g.
+    4.53 for "4.530% Fixed".
+    """
+    if not text:
+        return None
+    match: re.Match | None = _PERCENT_PATTERN.search(text)
+    if match is None:
+        return None
+    return float(match["value"])
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(text: str | None) -> str | None:
+    """Returns the first month/day/year date in `text` as an ISO 8601 date,
+    e.g. "2024-10-15" for "$250.00 on 10/15/2024".
+    """
+    if not text:
+        return None
+    match: re.Match | None = _DATE_PATTERN.search(text)
+    if match is None:
+        return None
+    return f"{match['year']}-{int(match['month']):02}-{int(match['day']):02}"
+
+
+def parse_cents_array(texts: Iterable[str | None]) -> np.ma.MaskedArray:
+    """Returns `parse_cents` of each of `texts` as int64 cents, masked where
+    it's None or too large, as NumPy integers have no missing value.
+    """
+    texts, chars, lengths = _byte_columns(texts, 16)
+    # "-$1,234.56": an optional minus sign, the dollar sign, digits and
+    # commas starting with a digit, and two decimal places, in up to 15
+    # characters so that the cents fit in 64 bits.
+    negative: np.ndarray = chars[0] == ord("-")
+    fast: np.ndarray = np.where(
+        negative,
+        (chars[1] == ord("$")) & (chars[2] - _ZERO < 10),
+        (chars[0] == ord("$")) & (chars[1] - _ZERO < 10),
+    )
+    fast &= (lengths >= 5 + negative) & (lengths < len(chars))
+    fast &= _at(chars, lengths - 3) == ord(".")
+    fast &= _at(chars, lengths - 2) - _ZERO < 10
+    fast &= _at(chars, lengths - 1) - _ZERO < 10
+    num_columns: int = lengths[fast].max(initial=0)
+    # All the digits make up the cents. Apart from the signs and the point,
+    # the rest must be commas.
+    cents, num_digits = _digits(chars, num_columns)
+    num_commas: np.ndarray = np.zeros(len(texts), dtype=np.uint8)
+    for column in chars[:num_columns]:
+        num_commas += column == ord(",")
+    fast &= num_digits + num_commas == lengths - negative - 2
+    np.negative(cents, out=cents, where=negative)
+
+    slow: np.ndarray = np.flatnonzero(~fast & (lengths > 0))
+    parsed: list[int | None] = [
+        value if value is not None and abs(value) < 2**63 else None
+        for value in map(parse_cents, _select(texts, slow))
+    ]
+    cents[slow] = [0 if value is None else value for value in parsed]
+    missing: np.ndarray = ~fast
+    missing[slow] = [value is None for value in parsed]
+    return np.ma.MaskedArray(cents, mask=missing)
+
+
+def parse_percent_array(texts: Iterable[str | None]) -> np.ndarray:
+    """Returns `parse_percent` of each of `texts` as float64 percent, NaN
+    where it's None.
+    """
+    texts, chars, lengths = _byte_columns(texts, 16)
+    # "4.530%" or "4.530% Fixed": an optional minus sign and digits with an
+    # optional decimal point, followed by the percent sign within the first
+    # 16 characters, and anything after it.
+    percent: np.ndarray = _find(chars, ord("%"), len(chars))
+    negative: np.ndarray = chars[0] == ord("-")
+    fast: np.ndarray = (percent < len(chars)) & (percent > negative)
+    fast &= _at(chars, np.maximum(percent - 1, 0)) - _ZERO < 10
+    num_columns: int = percent[fast].max(initial=0)
+    number, num_digits = _digits(chars, num_columns, percent)
+    point: np.ndarray = _find(chars, ord("."), num_columns)
+    num_points: np.ndarray = np.zeros(len(texts), dtype=np.uint8)
+    for i, column in enumerate(chars[:num_columns]):
+        num_points += (column == ord(".")) & (percent > i)
+    fast &= (num_digits + num_points == percent - negative) & (num_points <= 1)
+    num_decimals: np.ndarray = np.where(num_points > 0, percent - point - 1, 0)
+    # Both are exact, with up to 15 digits, so the quotient rounds like
+    # float() does.
+    values: np.ndarray = number / 10.0**num_decimals
+    np.negative(values, out=values, where=negative)
+
+    slow: np.ndarray = np.flatnonzero(~fast & (lengths > 0))
+    values[~fast] = np.nan
+    values[slow] = [
+        np.nan if value is None else value
+        for value in map(parse_percent, _select(texts, slow))
+    ]
+    return values
+
+
+def parse_date_array(texts: Iterable[str | None]) -> np.ndarray:
+    """Returns `parse_date` of each of `texts` as datetime64[D], NaT where
+    it's None or not a real date.
+    """
+    texts, chars, lengths = _byte_columns(texts, 16)
+    # "10/15/2024".
+    fast: np.ndarray = (lengths == 10) & (chars[2] == ord("/")) & (chars[5] == ord("/"))
+    numbers: dict[str, np.ndarray] = {}
+    for name, (first, stop) in dict(month=(0, 2), day=(3, 5), year=(6, 10)).items():
+        number, num_digits = _digits(chars[first:stop], stop - first)
+        fast &= num_digits == stop - first
+        numbers[name] = number
+    fast &= (numbers["month"] >= 1) & (numbers["month"] <= 12)
+    fast &= (numbers["day"] >= 1) & (numbers["day"] <= 31)
+
+    dates: np.ndarray = np.full(len(texts), np.datetime64("NaT"), dtype="M8[D]")
+    months: np.ndarray = (
+        (numbers["year"][fast] - 1970) * 12 + numbers["month"][fast] - 1
+    ).astype("M8[M]")
+    fast_dates: np.ndarray = months.astype("M8[D]") + (numbers["day"][fast] - 1)
+    # Days past the end of the month, like 02/30, roll over into the next.
+    fast_dates[fast_dates.astype("M8[M]") != months] = np.datetime64("NaT")
+    dates[fast] = fast_dates
+
+    slow: np.ndarray = np.flatnonzero(~fast & (lengths > 0))
+    dates[slow] = [_to_date(parse_date(text)) for text in _select(texts, slow)]
+    return dates
+
+
+# The byte of the digit 0. Subtracting it leaves the digits below 10, and
+# wraps every other byte around to 10 or more.
+_ZERO: np.uint8 = np.uint8(ord("0"))
+
+
+def _byte_columns(
+    texts: Iterable[str | None], width: int
+) -> tuple[list, np.ndarray, np.ndarray]:
+    """Returns `texts` as a list, as a (character, text) array of their ASCII
+    bytes in `width` rows, a multiple of 8, padded with zeros, so that each
+    character position is contiguous, and their lengths. Longer text is cut
+    off, other text than ASCII becomes a DEL character and None "None", none
+    of which the array parsers take, so they parse the text in the list
+    instead.
+    """
+    texts = texts.tolist() if isinstance(texts, np.ndarray) else list(texts)
+    try:
+        array: np.ndarray = np.array(texts, dtype=f"S{width}")
+    except UnicodeEncodeError:
+        array = np.array(
+            [text if text is None or text.isascii() else "\x7f" for text in texts],
+            dtype=f"S{width}",
+        )
+    # The length is up to the last byte that isn't padding. Each 8 bytes are
+    # a little-endian integer, whose binary exponent tells how many of its
+    # bytes are used: with ASCII bytes below 128, rounding it to a float
+    # can't carry it into the next byte.
+    words: np.ndarray = array.view("<u8").reshape(len(texts), width // 8)
+    lengths: np.ndarray = np.zeros(len(texts), dtype=np.intp)
+    for i in range(width // 8):
+        used: np.ndarray = (np.frexp(words[:, i].astype(np.float64))[1] + 7) // 8
+        np.copyto(lengths, 8 * i + used, where=used > 0)
+    chars: np.ndarray = np.ascontiguousarray(
+        array.view(np.uint8).reshape(len(texts), width).T
+    )
+    return texts, chars, lengths
+
+
+def _at(chars: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """Returns the character in a column of each text of a `_byte_columns`
+    array.
+    """
+    return chars.ravel().take(columns * chars.shape[1] + np.arange(chars.shape[1]))
+
+
+def _find(chars: np.ndarray, byte: int, num_columns: int) -> np.ndarray:
+    """Returns the first column of each text of a `_byte_columns` array with
+    the byte in it, or `num_columns` if none of the first ones have.
+    """
+    found: np.ndarray = np.full(chars.shape[1], num_columns, dtype=np.intp)
+    for i in reversed(range(num_columns)):
+        np.copyto(found, i, where=chars[i] == byte)
+    return found
+
+
+def _digits(
+    chars: np.ndarray, num_columns: int, stop: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the numbers that the digits in the first `num_columns`, or up
+    to the column `stop` of each, of the texts of a `_byte_columns` array
+    make up, leaving out other characters, as int64, and the numbers of
+    digits.
+    """
+    number: np.ndarray = np.zeros(chars.shape[1], dtype=np.int64)
+    num_digits: np.ndarray = np.zeros(chars.shape[1], dtype=np.uint8)
+    # Up to 8 digits at a time are put together in 32 bits, which is faster.
+    for first in range(0, num_columns, 8):
+        part: np.ndarray = np.zeros(chars.shape[1], dtype=np.uint32)
+        factor: np.ndarray = np.ones(chars.shape[1], dtype=np.uint32)
+        for i in range(first, min(first + 8, num_columns)):
+            digit: np.ndarray = chars[i] - _ZERO
+            is_digit: np.ndarray = digit < 10
+            if stop is not None:
+                is_digit &= stop > i
+            is_digit = is_digit.view(np.uint8)
+            digit *= is_digit
+            # 10 for digits, else 1.
+            digit_factor: np.ndarray = is_digit * np.uint8(9) + np.uint8(1)
+            part *= digit_factor
+            part += digit
+            factor *= digit_factor
+            num_digits += is_digit
+        number *= factor
+        number += part
+    return number, num_digits
+
+
+def _select(texts: list, indices: np.ndarray) -> list:
+    """Returns the texts at the indices."""
+    return [texts[i] for i in indices.tolist()]
+
+
+def _to_date(iso_date: str | None) -> np.datetime64:
+    """Returns an ISO 8601 date from `parse_date` as a datetime64, or NaT if
+    there is none or it isn't a real date.
+    """
+    try:
+        return np.datetime64(iso_date or "NaT", "D")
+    except ValueError:
+        return np.datetime64("NaT")
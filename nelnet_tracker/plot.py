@@ -1,26 +1,237 @@
 """Defines plotting capabilities."""
 
+import math
+from pathlib import Path
+import sqlite3
+
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 import numpy as np
 
+from .cache import balance_series
 from .config import CONFIG
-from .database import select_all_balances
+from .connection import connection, snapshot
+from .migrations import migrate_database
+from .query import fetch_chunks, groups_query, loans_query, pivot, rollups_query
+
+
+# Ways of plotting the balances of several loans or groups: "stacked" areas
+# adding up to the total, or "multiples", a small plot of each.
+PLOT_STYLES: tuple[str, ...] = ("stacked", "multiples")
 
 
-def plot_aggregate_balance() -> None:
-    """Plots the aggregate balance of all loans."""
-    raw_balances: list[tuple[str, str]] = select_all_balances()
-    timestamps = []
-    balances = []
-    for ts_str, bal_str in raw_balances:
-        timestamps.append(ts_str)
-        balances.append(float(bal_str.lstrip("$").replace(",", "")))
+def plot_aggregate_balance(
+    start: str | None = None, end: str | None = None, resolution: str | None = None
+) -> None:
+    """Plots the aggregate balance of all loans, from `start` up to but not
+    including `end` if given. At a resolution of `rollup.ROLLUP_RESOLUTIONS`,
+    only the last balance of each period is plotted.
+    """
+    balances: np.ndarray = balance_series(start, end, resolution=resolution)
 
-    x: np.ndarray = np.array(timestamps, dtype=np.datetime64)
-    y: np.ndarray = np.array(balances)
+    x: np.ndarray = balances["timestamp"]
+    y: np.ndarray = balances["cents"] / 100
 
     fig, ax = plt.subplots(figsize=CONFIG.plot_figure_size)
 
     ax.plot(x, y, "-o")
 
     plt.show()
+
+
+def plot_loan_balances(
+    start: str | None = None,
+    end: str | None = None,
+    loans: list[str] | None = None,
+    groups: list[str] | None = None,
+    resolution: str | None = None,
+    style: str = "stacked",
+) -> None:
+    """Plots the principal balance of each of the `loans` in the `groups`, or
+    all of them, like `plot_aggregate_balance`. At a resolution, each
+    period's last balance is plotted at the start of the period, for the
+    loans last in the `groups` between `start` and `end`.
+    """
+    _plot_balances(*loan_balances(start, end, loans, groups, resolution), style)
+
+
+def plot_group_balances(
+    start: str | None = None,
+    end: str | None = None,
+    groups: list[str] | None = None,
+    resolution: str | None = None,
+    style: str = "stacked",
+) -> None:
+    """Plots the principal balance of each of the loan `groups`, or all of
+    them, like `plot_loan_balances`.
+    """
+    _plot_balances(*group_balances(start, end, groups, resolution), style)
+
+
+def loan_balances(
+    start: str | None = None,
+    end: str | None = None,
+    loans: list[str] | None = None,
+    groups: list[str] | None = None,
+    resolution: str | None = None,
+    database_path: Path | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the timestamps, or periods at a resolution, the loan names and
+    a (timestamp, loan) array of principal balances in cents that
+    `plot_loan_balances` plots, see `query.pivot`. The balances are read
+    with one query, whatever the number of loans.
+    """
+    migrate_database(database_path)
+    with connection(database_path) as con, snapshot(con):
+        if resolution is None:
+            # Pivoting puts the rows in order.
+            query: tuple[str, dict] = loans_query(
+                ("loan_name", "principal_balance_cents"),
+                loans,
+                groups,
+                start,
+                end,
+                ordered=False,
+            )
+        else:
+            if groups is not None:
+                # Loan rollups can only be limited to loans by name.
+                in_groups: list[str] = _loans_in_groups(con, groups, start, end)
+                loans = [n for n in loans if n in in_groups] if loans else in_groups
+            query = rollups_query(
+                "loan_rollup",
+                resolution,
+                ("name", "last_balance_cents"),
+                loans,
+                start,
+                end,
+            )
+        return _pivot_balances(con, query)
+
+
+def group_balances(
+    start: str | None = None,
+    end: str | None = None,
+    groups: list[str] | None = None,
+    resolution: str | None = None,
+    database_path: Path | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the same as `loan_balances`, for loan groups, whose principal
+    balances are those of their balance information.
+    """
+    migrate_database(database_path)
+    with connection(database_path) as con, snapshot(con):
+        query: tuple[str, dict] = (
+            groups_query(
+                ("group_name", "principal_balance_cents"),
+                groups,
+                start,
+                end,
+                ordered=False,
+            )
+            if resolution is None
+            else rollups_query(
+                "group_rollup",
+                resolution,
+                ("name", "last_balance_cents"),
+                groups,
+                start,
+                end,
+            )
+        )
+        return _pivot_balances(con, query)
+
+
+def _loans_in_groups(
+    con: sqlite3.Connection,
+    groups: list[str],
+    start: str | None = None,
+    end: str | None = None,
+) -> list[str]:
+    """Returns the names of the loans whose current information was last in
+    one of the `groups` in the scrapes from `start` up to but not including
+    `end`, like `loans_query`.
+    """
+    query, params = loans_query(
+        ("loan_name", "group_name"), start=start, end=end, ordered=False
+    )
+    # SQLite takes the bare group name from the row with the latest timestamp.
+    return [
+        name
+        for name, group_name, _ in con.execute(
+            f"""
+            SELECT loan_name, group_name, max(scrape_timestamp)
+            FROM ({query})
+            GROUP BY loan_name
+            """,
+            params,
+        )
+        if group_name in groups
+    ]
+
+
+def _pivot_balances(
+    con: sqlite3.Connection, query: tuple[str, dict]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the rows of a query of (timestamp, name, balance) pivoted, with
+    a single balance per timestamp and name.
+    """
+    timestamps, names, values = pivot(
+        row for rows in fetch_chunks(con, query) for row in rows
+    )
+    return timestamps, names, values.reshape(len(timestamps), len(names))
+
+
+def _plot_balances(
+    timestamps: np.ndarray, names: np.ndarray, cents: np.ndarray, style: str
+) -> None:
+    """Plots a (timestamp, name) array of balances in cents in a style of
+    `PLOT_STYLES`. A balance holds until the next timestamp.
+    """
+    if style not in PLOT_STYLES:
+        raise ValueError(f"Unknown plot style: {style!r}")
+    if not len(names):
+        raise RuntimeError("There are no balances to plot")
+    dollars: np.ndarray = cents / 100
+
+    if style == "stacked":
+        fig, ax = plt.subplots(figsize=CONFIG.plot_figure_size)
+        ax.stackplot(timestamps, _fill_gaps(dollars).T, labels=names, step="post")
+        ax.legend(loc="upper left", fontsize="small", ncols=math.ceil(len(names) / 12))
+    else:
+        num_columns: int = math.ceil(math.sqrt(len(names)))
+        fig, axes = plt.subplots(
+            math.ceil(len(names) / num_columns),
+            num_columns,
+            figsize=CONFIG.plot_figure_size,
+            sharex=True,
+            squeeze=False,
+            layout="constrained",
+        )
+        locator: mdates.AutoDateLocator = mdates.AutoDateLocator(maxticks=4)
+        for i, ax in enumerate(axes.flat):
+            if i < len(names):
+                ax.step(timestamps, dollars[:, i], where="post")
+                ax.set_title(names[i], fontsize="small")
+                ax.xaxis.set_major_locator(locator)
+                ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+            else:
+                ax.set_axis_off()
+
+    plt.show()
+
+
+def _fill_gaps(values: np.ndarray) -> np.ndarray:
+    """Returns a (timestamp, name) array with each NaN between a name's first
+    and last value replaced by the value before it, and the NaNs before and
+    after those, when e.g. a loan wasn't disbursed yet or was paid off,
+    replaced by zero.
+    """
+    rows: np.ndarray = np.arange(len(values))[:, np.newaxis]
+    known: np.ndarray = ~np.isnan(values)
+    # The row of the latest value up to each row, or -1 before the first.
+    latest: np.ndarray = np.maximum.accumulate(np.where(known, rows, -1), axis=0)
+    filled: np.ndarray = values[np.maximum(latest, 0), np.arange(values.shape[1])]
+    last: np.ndarray = np.where(known, rows, -1).max(axis=0, initial=-1)
+    filled[(latest < 0) | (rows > last)] = 0
+    return filled
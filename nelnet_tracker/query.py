@@ -0,0 +1,517 @@
+"""Reads time series from the database.
+
+The accessors are generators that read rows in chunks as they're iterated
+over, so that memory use doesn't grow with the length of the history. Rows
+can be limited to a range of scrape timestamps, and group and loan rows to
+some groups or loans by name. Each row is the scrape timestamp followed by
+the requested fields, from `RECORD_FIELDS`, `GROUP_FIELDS` or `LOAN_FIELDS`.
+`pivot` turns rows of groups or loans into one array over time and name.
+"""
+
+from pathlib import Path
+import sqlite3
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from .connection import connection
+from .migrations import migrate_database
+from .rollup import ROLLUP_METRICS, ROLLUP_RESOLUTIONS, ROLLUP_STATISTICS
+
+
+# Rows fetched from the database at a time.
+QUERY_CHUNK_SIZE: int = 1000
+
+# Fields of records by name, as SQL expressions of the main record `m`.
+RECORD_FIELDS: dict[str, str] = dict(
+    main_record_id="m.row_id",
+    past_due_amount_cents="m.past_due_amount_cents",
+    monthly_payment_remaining_cents="m.monthly_payment_remaining_cents",
+    current_amount_due_cents="m.current_amount_due_cents",
+    due_date_iso="m.due_date_iso",
+    current_balance_cents="m.current_balance_cents",
+    last_payment_received_cents="m.last_payment_received_cents",
+    last_payment_received_iso="m.last_payment_received_iso",
+)
+
+# Fields of loan groups by name, as SQL expressions of the group record `g`,
+# the group `lg`, and its payment information `p` and balance information
+# `b`.
+GROUP_FIELDS: dict[str, str] = dict(
+    main_record_id="g.main_record_id",
+    group_name="lg.name",
+    loan_type="g.loan_type",
+    status="g.status",
+    repayment_plan="g.repayment_plan",
+    current_amount_due_cents="p.current_amount_due_cents",
+    due_date_iso="p.due_date_iso",
+    interest_rate_percent="p.interest_rate_percent",
+    regular_monthly_payment_amount_cents="p.regular_monthly_payment_amount_cents",
+    last_payment_received_cents="p.last_payment_received_cents",
+    last_payment_received_iso="p.last_payment_received_iso",
+    principal_balance_cents="b.principal_balance_cents",
+    accrued_interest_cents="b.accrued_interest_cents",
+    fees_cents="b.fees_cents",
+    outstanding_balance_cents="b.outstanding_balance_cents",
+)
+
+# Fields of loans by name, as SQL expressions of the loan's current
+# information `c`, the loan `l`, its group `lg` at the time, and the loan
+# details `r` and historic information `h` that held at the time.
+LOAN_FIELDS: dict[str, str] = dict(
+    main_record_id="c.main_record_id",
+    loan_name="l.name",
+    group_name="lg.name",
+    group_placement="c.group_placement",
+    loan_type="r.loan_type",
+    loan_status="r.loan_status",
+    interest_subsidy="r.interest_subsidy",
+    lender_name="r.lender_name",
+    school_name="r.school_name",
+    due_date_iso="c.due_date_iso",
+    interest_rate_percent="c.interest_rate_percent",
+    interest_rate_type="c.interest_rate_type",
+    loan_term="c.loan_term",
+    principal_balance_cents="c.principal_balance_cents",
+    accrued_interest_cents="c.accrued_interest_cents",
+    capitalized_interest_cents="c.capitalized_interest_cents",
+    convert_to_repayment_iso="h.convert_to_repayment_iso",
+    original_loan_amount_cents="h.original_loan_amount_cents",
+)
+
+# Fields of rollups by name, as SQL expressions of the rollup row `u` and,
+# for groups and loans, the group or loan `n`. See `rollup`.
+ROLLUP_FIELDS: dict[str, str] = dict(
+    name="n.name",
+    num_scrapes="u.num_scrapes",
+    first_timestamp="u.first_timestamp",
+    last_timestamp="u.last_timestamp",
+    **{
+        f"{stat}_{metric}_cents": f"u.{stat}_{metric}_cents"
+        for metric in ROLLUP_METRICS
+        for stat in ROLLUP_STATISTICS
+    },
+)
+# Joins of the groups or loans to their rollups, by rollup table.
+_ROLLUP_NAMES: dict[str, str] = dict(
+    record_rollup="",
+    group_rollup="JOIN loan_group AS n ON n.row_id == u.group_id",
+    loan_rollup="JOIN loan AS n ON n.row_id == u.loan_id",
+)
+
+# Tables joined only for the fields that need them, by alias.
+_OPTIONAL_JOINS: dict[str, str] = dict(
+    p="""
+        LEFT JOIN payment_information AS p
+            ON p.main_record_id == g.main_record_id AND p.group_id == g.group_id
+        """,
+    b="""
+        LEFT JOIN balance_information AS b
+            ON b.main_record_id == g.main_record_id AND b.group_id == g.group_id
+        """,
+    r="""
+        LEFT JOIN loan_record_history AS r
+            ON r.loan_id == c.loan_id
+            AND r.valid_from <= c.main_record_id
+            AND (r.valid_to IS NULL OR c.main_record_id < r.valid_to)
+        """,
+    h="""
+        LEFT JOIN loan_historic_information_history AS h
+            ON h.loan_id == c.loan_id
+            AND h.valid_from <= c.main_record_id
+            AND (h.valid_to IS NULL OR c.main_record_id < h.valid_to)
+        """,
+)
+
+
+def records_query(
+    fields: Iterable[str] = tuple(RECORD_FIELDS),
+    start: str | None = None,
+    end: str | None = None,
+    since: tuple[int, int] | None = None,
+) -> tuple[str, dict]:
+    """Returns a query of `fields` of records and its parameters, with a row
+    for each scrape from `start` up to but not including `end`, observations
+    of unchanged records included, in order. If given, `since` is a main
+    record and an observation row ID, and only scrapes added after them are
+    included.
+    """
+    params: dict = {}
+    time_range: str = _time_range("scrape_timestamp", start, end, params)
+    added: list[str] = ["", ""]
+    if since is not None:
+        params["since_record_id"], params["since_observation_id"] = since
+        added = ["row_id > :since_record_id", "row_id > :since_observation_id"]
+    return (
+        f"""
+        SELECT o.scrape_timestamp, {_select(RECORD_FIELDS, fields, "record")}
+        FROM (
+            SELECT row_id AS main_record_id, scrape_timestamp FROM main_record
+            {_where([time_range, added[0]])}
+            UNION ALL
+            SELECT main_record_id, scrape_timestamp FROM record_observation
+            {_where([time_range, added[1]])}
+        ) AS o
+        JOIN main_record AS m ON m.row_id == o.main_record_id
+        ORDER BY o.scrape_timestamp
+        """,
+        params,
+    )
+
+
+def groups_query(
+    fields: Iterable[str] = tuple(GROUP_FIELDS),
+    groups: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    ordered: bool = True,
+) -> tuple[str, dict]:
+    """Returns a query of `fields` of loan groups and its parameters, with a
+    row for each of the `groups`, or all of them, in each scrape from `start`
+    up to but not including `end`, observations of unchanged records
+    included, in order unless not `ordered`, which saves sorting them.
+    """
+    fields = tuple(fields)
+    params: dict = {}
+    return (
+        _per_scrape(
+            _select(GROUP_FIELDS, fields, "group"),
+            fields,
+            f"""
+            JOIN group_record AS g ON g.main_record_id == m.row_id
+            JOIN loan_group AS lg ON lg.row_id == g.group_id
+            {_joins(GROUP_FIELDS, fields)}
+            """,
+            [_in("lg.name", groups, "group", params)],
+            start,
+            end,
+            params,
+            "g.row_id" if ordered else None,
+        ),
+        params,
+    )
+
+
+def loans_query(
+    fields: Iterable[str] = tuple(LOAN_FIELDS),
+    loans: Iterable[str] | None = None,
+    groups: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    ordered: bool = True,
+) -> tuple[str, dict]:
+    """Returns a query of `fields` of loans and its parameters, with a row for
+    each of the `loans` in the `groups`, or all of them, in each scrape from
+    `start` up to but not including `end`, like `groups_query`.
+    """
+    fields = tuple(fields)
+    params: dict = {}
+    return (
+        _per_scrape(
+            _select(LOAN_FIELDS, fields, "loan"),
+            fields,
+            f"""
+            JOIN loan_current_information AS c ON c.main_record_id == m.row_id
+            JOIN loan AS l ON l.row_id == c.loan_id
+            JOIN loan_group AS lg ON lg.row_id == c.group_id
+            {_joins(LOAN_FIELDS, fields)}
+            """,
+            [
+                _in("l.name", loans, "loan", params),
+                _in("lg.name", groups, "group", params),
+            ],
+            start,
+            end,
+            params,
+            "c.row_id" if ordered else None,
+        ),
+        params,
+    )
+
+
+def rollups_query(
+    table: str,
+    resolution: str,
+    fields: Iterable[str] = ("last_timestamp", "last_balance_cents"),
+    names: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+) -> tuple[str, dict]:
+    """Returns a query of `fields` of a rollup table at a resolution of
+    `rollup.ROLLUP_RESOLUTIONS` and its parameters, with a row for each
+    group or loan of `names`, or all of them, in each period with scrapes
+    from `start` up to but not including `end`, in order.
+    """
+    fields = tuple(fields)
+    if table not in _ROLLUP_NAMES:
+        raise ValueError(f"Unknown rollup table: {table!r}")
+    if resolution not in ROLLUP_RESOLUTIONS:
+        raise ValueError(f"Unknown rollup resolution: {resolution!r}")
+    if not _ROLLUP_NAMES[table] and ("name" in fields or names is not None):
+        raise ValueError("Record rollups have no names")
+    params: dict = dict(resolution=resolution, length=ROLLUP_RESOLUTIONS[resolution])
+    conditions: list[str] = ["u.resolution == :resolution"]
+    # Periods are compared for the sake of the index, and the end timestamp
+    # too since a period may start after it.
+    if start is not None:
+        params["start"] = start
+        conditions.append("u.period >= substr(:start, 1, :length)")
+    if end is not None:
+        params["end"] = end
+        conditions.append("u.period <= substr(:end, 1, :length)")
+        conditions.append("u.first_timestamp < :end")
+    conditions.append(_in("n.name", names, "name", params))
+    return (
+        f"""
+        SELECT u.period, {_select(ROLLUP_FIELDS, fields, "rollup")}
+        FROM {table} AS u
+        {_ROLLUP_NAMES[table]}
+        {_where(conditions)}
+        ORDER BY u.period, u.row_id
+        """,
+        params,
+    )
+
+
+def fetch_chunks(
+    con: sqlite3.Connection,
+    query: tuple[str, dict],
+    chunk_size: int = QUERY_CHUNK_SIZE,
+) -> Iterator[list[tuple]]:
+    """Yields the rows of a query from one of the functions above in lists of
+    up to `chunk_size`.
+    """
+    cur: sqlite3.Cursor = con.execute(*query)
+    while rows := cur.fetchmany(chunk_size):
+        yield rows
+
+
+def iter_rows(
+    query: tuple[str, dict],
+    database_path: Path | None = None,
+    chunk_size: int = QUERY_CHUNK_SIZE,
+) -> Iterator[tuple]:
+    """Yields the rows of a query from one of the functions above, on a
+    connection of its own that is closed once they run out or the generator
+    is closed.
+    """
+    migrate_database(database_path)
+    with connection(database_path) as con:
+        for rows in fetch_chunks(con, query, chunk_size):
+            yield from rows
+
+
+def iter_records(
+    fields: Iterable[str] = tuple(RECORD_FIELDS),
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+) -> Iterator[tuple]:
+    """Yields (scrape timestamp, *fields) for each scrape, see
+    `records_query`.
+    """
+    yield from iter_rows(records_query(fields, start, end), database_path)
+
+
+def iter_groups(
+    fields: Iterable[str] = tuple(GROUP_FIELDS),
+    groups: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+) -> Iterator[tuple]:
+    """Yields (scrape timestamp, *fields) for each loan group in each scrape,
+    see `groups_query`.
+    """
+    yield from iter_rows(groups_query(fields, groups, start, end), database_path)
+
+
+def iter_loans(
+    fields: Iterable[str] = tuple(LOAN_FIELDS),
+    loans: Iterable[str] | None = None,
+    groups: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+) -> Iterator[tuple]:
+    """Yields (scrape timestamp, *fields) for each loan in each scrape, see
+    `loans_query`. For example, the principal, accrued interest and rate
+    of one loan over time:
+
+        iter_loans(
+            ("principal_balance_cents", "accrued_interest_cents",
+             "interest_rate_percent"),
+            loans=["1-01"],
+        )
+    """
+    yield from iter_rows(loans_query(fields, loans, groups, start, end), database_path)
+
+
+def iter_rollups(
+    table: str,
+    resolution: str,
+    fields: Iterable[str] = ("last_timestamp", "last_balance_cents"),
+    names: Iterable[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+) -> Iterator[tuple]:
+    """Yields (period, *fields) for each group or loan in each period, or for
+    each period for records, see `rollups_query`.
+    """
+    yield from iter_rows(
+        rollups_query(table, resolution, fields, names, start, end), database_path
+    )
+
+
+def iter_balances(
+    start: str | None = None,
+    end: str | None = None,
+    database_path: Path | None = None,
+    resolution: str | None = None,
+) -> Iterator[tuple[str, int]]:
+    """Yields (scrape timestamp, aggregate balance in cents) for each scrape
+    whose balance could be read. At a resolution of
+    `rollup.ROLLUP_RESOLUTIONS`, yields the last scrape of each period and
+    its balance instead.
+    """
+    rows: Iterator[tuple]
+    if resolution is None:
+        rows = iter_records(("current_balance_cents",), start, end, database_path)
+    else:
+        rows = (
+            row[1:]
+            for row in iter_rollups(
+                "record_rollup",
+                resolution,
+                ("last_timestamp", "last_balance_cents"),
+                start=start,
+                end=end,
+                database_path=database_path,
+            )
+        )
+    for timestamp, cents in rows:
+        if cents is not None:
+            yield timestamp, cents
+
+
+def pivot(rows: Iterable[tuple]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns rows of (timestamp, name, *values), like those of loans or
+    groups with their name as the first field, or of their rollups, as the
+    distinct timestamps in order as datetime64[us], the distinct names in
+    order, and a (timestamp, name, value) float64 array of the values. It is
+    NaN where a name has no row at a timestamp, or the value is NULL.
+    """
+    columns: list[tuple] = list(zip(*rows))
+    if not columns:
+        return np.empty(0, dtype="M8[us]"), np.empty(0, dtype=str), np.empty((0, 0, 0))
+    timestamps, time_index = np.unique(
+        np.array(columns[0], dtype="M8[us]"), return_inverse=True
+    )
+    names, name_index = np.unique(np.array(columns[1], dtype=str), return_inverse=True)
+    values: np.ndarray = np.full(
+        (len(timestamps), len(names), len(columns) - 2), np.nan
+    )
+    # None becomes NaN.
+    values[time_index, name_index] = np.array(columns[2:], dtype=float).T
+    return timestamps, names, values
+
+
+def _select(known: dict[str, str], fields: Iterable[str], kind: str) -> str:
+    """Returns the SQL expressions of `fields`, named after them."""
+    expressions: list[str] = []
+    for field in fields:
+        if field not in known:
+            raise ValueError(f"Unknown {kind} field: {field!r}")
+        expressions.append(f"{known[field]} AS {field}")
+    if not expressions:
+        raise ValueError(f"No {kind} fields given")
+    return ", ".join(expressions)
+
+
+def _joins(known: dict[str, str], fields: tuple[str, ...]) -> str:
+    """Returns the optional joins of the tables that `fields` come from."""
+    aliases: set[str] = {known[field].split(".")[0] for field in fields}
+    return "".join(join for alias, join in _OPTIONAL_JOINS.items() if alias in aliases)
+
+
+def _per_scrape(
+    select: str,
+    fields: tuple[str, ...],
+    joins: str,
+    conditions: list[str],
+    start: str | None,
+    end: str | None,
+    params: dict,
+    order: str | None,
+) -> str:
+    """Returns a query of the scrape timestamp and the `select` expressions,
+    named after `fields`, of the rows that `joins` joins to the main record
+    `m` of each scrape from `start` up to but not including `end` that meet
+    the `conditions`, observations of unchanged records included, and adds
+    its parameters to `params`. Rows are in order of timestamp and then the
+    `order` expression, if given.
+
+    Main records and observations are read by separate queries put together
+    with UNION ALL, rather than by joining a subquery of both, which SQLite
+    would read in full, so that each can use indexes.
+    """
+    sources: dict[str, str] = {
+        "m.scrape_timestamp": "main_record AS m",
+        "s.scrape_timestamp": """
+            record_observation AS s
+            JOIN main_record AS m ON m.row_id == s.main_record_id
+            """,
+    }
+    queries: list[str] = [
+        f"""
+        SELECT {timestamp} AS scrape_timestamp, {select}
+            {f", {order} AS sort_key" if order else ""}
+        FROM {source}
+        {joins}
+        {_where([_time_range(timestamp, start, end, params), *conditions])}
+        """
+        for timestamp, source in sources.items()
+    ]
+    union: str = "UNION ALL".join(queries)
+    if order is None:
+        return union
+    return f"""
+        SELECT scrape_timestamp, {", ".join(fields)}
+        FROM ({union})
+        ORDER BY scrape_timestamp, sort_key
+        """
+
+
+def _time_range(column: str, start: str | None, end: str | None, params: dict) -> str:
+    """Returns a condition for timestamps in `column` from `start` up to but
+    not including `end`, either of which may be left open, and adds its
+    parameters to `params`.
+    """
+    conditions: list[str] = []
+    if start is not None:
+        params["start"] = start
+        conditions.append(f"{column} >= :start")
+    if end is not None:
+        params["end"] = end
+        conditions.append(f"{column} < :end")
+    return " AND ".join(conditions)
+
+
+def _in(column: str, names: Iterable[str] | None, kind: str, params: dict) -> str:
+    """Returns a condition for values of `column` among `names`, unless they
+    are None, and adds its parameters to `params`.
+    """
+    if names is None:
+        return ""
+    placeholders: list[str] = []
+    for i, name in enumerate(names):
+        params[f"{kind}_{i}"] = name
+        placeholders.append(f":{kind}_{i}")
+    return f"{column} IN ({', '.join(placeholders)})"
+
+
+def _where(conditions: list[str]) -> str:
+    """Returns a WHERE clause of the non-empty conditions, if any."""
+    conditions = [c for c in conditions if c]
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
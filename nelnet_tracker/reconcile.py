@@ -0,0 +1,159 @@
+"""Checks the interest accrued on each loan against its stated rate.
+
+Between two consecutive scrapes of a loan with the same principal, the
+accrued interest should grow by simple daily interest on the principal at the
+loan's rate, for the days between them. Scrapes of unchanged records, stored
+as observations, count like any other. Intervals in which the principal
+changed or the accrued interest went down, e.g. with a payment or when
+interest was capitalized, can't be checked this way and are left out. All
+intervals of all loans are worked out at once, from a single query.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from .config import CONFIG
+from .connection import connection, snapshot
+from .migrations import migrate_database
+from .query import loans_query
+from .simulate import DAYS_PER_YEAR
+
+
+# Type of the intervals between consecutive scrapes of a loan, with the
+# principal and rate at the start, the interest that should have accrued and
+# the interest that did, and whether they diverge beyond the tolerance.
+ACCRUAL_INTERVAL_DTYPE: np.dtype = np.dtype(
+    [
+        ("loan", "U64"),
+        ("start", "datetime64[us]"),
+        ("end", "datetime64[us]"),
+        ("days", "int64"),
+        ("principal_cents", "int64"),
+        ("interest_rate_percent", "float64"),
+        ("expected_cents", "float64"),
+        ("observed_cents", "int64"),
+        ("divergent", "bool"),
+    ]
+)
+
+# Type of the summary of each loan's intervals: how many were checked and
+# diverged, and the expected and observed interest over all of them.
+LOAN_ACCRUAL_DTYPE: np.dtype = np.dtype(
+    [
+        ("loan", "U64"),
+        ("intervals", "int64"),
+        ("divergent", "int64"),
+        ("expected_cents", "float64"),
+        ("observed_cents", "int64"),
+    ]
+)
+
+
+def reconcile_accrual(
+    start: str | None = None,
+    end: str | None = None,
+    loans: list[str] | None = None,
+    groups: list[str] | None = None,
+    tolerance_cents: float | None = None,
+    tolerance_fraction: float | None = None,
+    database_path: Path | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the intervals between consecutive scrapes of the `loans` in
+    the `groups`, or all of them, from `start` up to but not including `end`,
+    as an array of `ACCRUAL_INTERVAL_DTYPE` in order of loan and time, and
+    their summary by loan as an array of `LOAN_ACCRUAL_DTYPE`. An interval
+    diverges if the observed interest is further from the expected than
+    `tolerance_cents` plus `tolerance_fraction` of the expected, which
+    default to `CONFIG.accrual_tolerance_cents` and
+    `CONFIG.accrual_tolerance_fraction`.
+    """
+    if tolerance_cents is None:
+        tolerance_cents = CONFIG.accrual_tolerance_cents
+    if tolerance_fraction is None:
+        tolerance_fraction = CONFIG.accrual_tolerance_fraction
+    migrate_database(database_path)
+    with connection(database_path) as con, snapshot(con):
+        rows: list[tuple] = con.execute(
+            *loans_query(
+                (
+                    "loan_name",
+                    "principal_balance_cents",
+                    "accrued_interest_cents",
+                    "interest_rate_percent",
+                ),
+                loans,
+                groups,
+                start,
+                end,
+                # The rows are sorted by loan and time below.
+                ordered=False,
+            )
+        ).fetchall()
+    intervals: np.ndarray = _intervals(rows)
+    intervals["divergent"] = np.abs(
+        intervals["observed_cents"] - intervals["expected_cents"]
+    ) > tolerance_cents + tolerance_fraction * np.abs(intervals["expected_cents"])
+    return intervals, _by_loan(intervals)
+
+
+def _intervals(rows: list[tuple]) -> np.ndarray:
+    """Returns the intervals that can be checked between rows of (timestamp,
+    loan name, principal, accrued interest, rate) as an array of
+    `ACCRUAL_INTERVAL_DTYPE`, not yet marked divergent.
+    """
+    if not rows:
+        return np.empty(0, dtype=ACCRUAL_INTERVAL_DTYPE)
+    columns: list[tuple] = list(zip(*rows))
+    timestamps: np.ndarray = np.array(columns[0], dtype="M8[us]")
+    names, loan_index = np.unique(np.array(columns[1], dtype=str), return_inverse=True)
+    # None becomes NaN.
+    principal, accrued, rate = np.array(columns[2:], dtype=np.float64)
+
+    order: np.ndarray = np.lexsort((timestamps, loan_index))
+    timestamps, loan_index = timestamps[order], loan_index[order]
+    principal, accrued, rate = principal[order], accrued[order], rate[order]
+
+    # Interest accrues by the day, whatever the time of the scrapes.
+    days: np.ndarray = np.diff(timestamps.astype("M8[D]")).astype(np.int64)
+    # Comparisons with NaN are false, so rows missing a value are left out.
+    checkable: np.ndarray = (
+        (loan_index[1:] == loan_index[:-1])
+        & (principal[1:] == principal[:-1])
+        & (accrued[1:] >= accrued[:-1])
+        & ~np.isnan(rate[:-1])
+    )
+    i: np.ndarray = np.flatnonzero(checkable)
+
+    intervals: np.ndarray = np.zeros(len(i), dtype=ACCRUAL_INTERVAL_DTYPE)
+    intervals["loan"] = names[loan_index[i]]
+    intervals["start"] = timestamps[i]
+    intervals["end"] = timestamps[i + 1]
+    intervals["days"] = days[i]
+    intervals["principal_cents"] = principal[i]
+    intervals["interest_rate_percent"] = rate[i]
+    intervals["expected_cents"] = principal[i] * rate[i] / 100 / DAYS_PER_YEAR * days[i]
+    intervals["observed_cents"] = accrued[i + 1] - accrued[i]
+    return intervals
+
+
+def _by_loan(intervals: np.ndarray) -> np.ndarray:
+    """Returns the summary by loan of intervals in order of loan, as an array
+    of `LOAN_ACCRUAL_DTYPE`.
+    """
+    names, loan_index, counts = np.unique(
+        intervals["loan"], return_inverse=True, return_counts=True
+    )
+    summary: np.ndarray = np.zeros(len(names), dtype=LOAN_ACCRUAL_DTYPE)
+    summary["loan"] = names
+    summary["intervals"] = counts
+    summary["divergent"] = np.bincount(
+        loan_index, weights=intervals["divergent"], minlength=len(names)
+    )
+    summary["expected_cents"] = np.bincount(
+        loan_index, weights=intervals["expected_cents"], minlength=len(names)
+    )
+    summary["observed_cents"] = np.bincount(
+        loan_index, weights=intervals["observed_cents"], minlength=len(names)
+    )
+    return summary
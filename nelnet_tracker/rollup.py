@@ -0,0 +1,263 @@
+"""Keeps per day and per month summaries of records, loan groups and loans up
+to date, so that long-range views read a row per period instead of one per
+scrape.
+
+Each rollup row covers the scrapes of a period, observations of unchanged
+records included, with their number, the first and last scrape timestamps,
+and the first, last, minimum and maximum balance and accrued interest. The
+balance of a record is its current balance, and that of a group or loan its
+principal balance. The accrued interest of a record is the sum over its
+groups.
+"""
+
+import functools
+import sqlite3
+
+
+# Lengths of the prefixes of scrape timestamps that identify the period a
+# scrape falls in, by resolution.
+ROLLUP_RESOLUTIONS: dict[str, int] = dict(day=len("YYYY-MM-DD"), month=len("YYYY-MM"))
+# Amounts summarized by the rollups, each in first, last, min and max columns
+# named like `first_<metric>_cents`.
+ROLLUP_METRICS: tuple[str, ...] = ("balance", "accrued_interest")
+ROLLUP_STATISTICS: tuple[str, ...] = ("first", "last", "min", "max")
+# Average number of scrapes per period of the finest resolution from which
+# `rebuild_rollups` fills in each table with a query per resolution, rather
+# than replaying each scrape through `update_rollups`. The queries' window
+# functions cost something per period, so replaying is faster when periods
+# hold a few scrapes each, see `util.bench.bench_rollup_rebuild`.
+SET_BASED_REBUILD_MIN_SCRAPES: float = 6
+
+# Rollup tables, as (column of what is rolled up, or None for records, query
+# of it and of the metrics in each main record, by `main_record_id`).
+ROLLUP_TABLES: dict[str, tuple[str | None, str]] = dict(
+    record_rollup=(
+        None,
+        """
+        SELECT
+            m.row_id AS main_record_id,
+            m.current_balance_cents AS balance,
+            (
+                SELECT sum(b.accrued_interest_cents) FROM balance_information AS b
+                WHERE b.main_record_id == m.row_id
+            ) AS accrued_interest
+        FROM main_record AS m
+        """,
+    ),
+    group_rollup=(
+        "group_id",
+        """
+        SELECT
+            main_record_id,
+            group_id,
+            principal_balance_cents AS balance,
+            accrued_interest_cents AS accrued_interest
+        FROM balance_information
+        """,
+    ),
+    loan_rollup=(
+        "loan_id",
+        """
+        SELECT
+            main_record_id,
+            loan_id,
+            principal_balance_cents AS balance,
+            accrued_interest_cents AS accrued_interest
+        FROM loan_current_information
+        """,
+    ),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _upsert_statement(table: str) -> str:
+    """Returns a statement that adds a scrape of the main record
+    :main_record_id at :scrape_timestamp to the rows of a rollup table for
+    :resolution and :period, creating them if they don't exist yet.
+    """
+    key, source = ROLLUP_TABLES[table]
+    keys: list[str] = ["resolution", *([key] if key else []), "period"]
+    columns: list[str] = keys + ["num_scrapes", "first_timestamp", "last_timestamp"]
+    values: list[str] = [":resolution", *([f"s.{key}"] if key else []), ":period"]
+    values += ["1", ":scrape_timestamp", ":scrape_timestamp"]
+    # In the update, bare column names are the existing row's values, and
+    # `excluded` holds the new scrape's.
+    updates: list[str] = [
+        "num_scrapes = num_scrapes + 1",
+        "first_timestamp = min(first_timestamp, excluded.first_timestamp)",
+        "last_timestamp = max(last_timestamp, excluded.last_timestamp)",
+    ]
+    for metric in ROLLUP_METRICS:
+        columns += [f"{stat}_{metric}_cents" for stat in ROLLUP_STATISTICS]
+        values += [f"s.{metric}"] * len(ROLLUP_STATISTICS)
+        first, last, min_, max_ = (
+            f"{stat}_{metric}_cents" for stat in ROLLUP_STATISTICS
+        )
+        # Missing amounts are NULL, which never replaces a known one.
+        updates += [
+            f"{first} = CASE WHEN excluded.first_timestamp < first_timestamp"
+            f" THEN excluded.{first} ELSE {first} END",
+            f"{last} = CASE WHEN excluded.last_timestamp >= last_timestamp"
+            f" THEN excluded.{last} ELSE {last} END",
+            f"{min_} = CASE WHEN excluded.{min_} < {min_} OR {min_} IS NULL"
+            f" THEN excluded.{min_} ELSE {min_} END",
+            f"{max_} = CASE WHEN excluded.{max_} > {max_} OR {max_} IS NULL"
+            f" THEN excluded.{max_} ELSE {max_} END",
+        ]
+    # Besides picking the main record, the WHERE clause keeps ON CONFLICT
+    # from being parsed as part of the SELECT's join.
+    return f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        SELECT {", ".join(values)} FROM ({source}) AS s
+        WHERE s.main_record_id == :main_record_id
+        ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {", ".join(updates)}
+        """
+
+
+@functools.lru_cache(maxsize=None)
+def _rebuild_statement(table: str, from_scrapes: bool) -> str:
+    """Returns a statement that fills in the rows of a rollup table for
+    :resolution, with periods the first :length characters of scrape
+    timestamps, all at once, either from every recorded scrape or from the
+    rows of a finer :from_resolution.
+    """
+    key, source = ROLLUP_TABLES[table]
+    keys: list[str] = [key] if key else []
+    # Rows to combine, what they're ordered by, and the aggregates over the
+    # rows of a period so far, by rollup column. Aggregates run from the
+    # first row of each period, so the last row of a period has them all,
+    # and its own timestamp and amounts are the last. Like the updates, first
+    # and last amounts are those of the first and last scrapes even if
+    # missing, and min and max skip missing amounts.
+    rows: str
+    order: str
+    aggregates: dict[str, str]
+    if from_scrapes:
+        rows = f"""
+            SELECT s.*, r.scrape_timestamp
+            FROM (
+                SELECT row_id AS main_record_id, scrape_timestamp FROM main_record
+                UNION ALL
+                SELECT main_record_id, scrape_timestamp FROM record_observation
+            ) AS r
+            JOIN ({source}) AS s USING (main_record_id)
+            """
+        order = "scrape_timestamp"
+        aggregates = dict(
+            num_scrapes="count(*) OVER w",
+            first_timestamp="first_value(scrape_timestamp) OVER w",
+            last_timestamp="scrape_timestamp",
+        )
+        for metric in ROLLUP_METRICS:
+            aggregates |= {
+                f"first_{metric}_cents": f"first_value({metric}) OVER w",
+                f"last_{metric}_cents": metric,
+                f"min_{metric}_cents": f"min({metric}) OVER w",
+                f"max_{metric}_cents": f"max({metric}) OVER w",
+            }
+    else:
+        rows = f"SELECT * FROM {table} WHERE resolution == :from_resolution"
+        order = "first_timestamp"
+        aggregates = dict(
+            num_scrapes="sum(num_scrapes) OVER w",
+            first_timestamp="first_value(first_timestamp) OVER w",
+            last_timestamp="last_timestamp",
+        )
+        for metric in ROLLUP_METRICS:
+            aggregates |= {
+                f"first_{metric}_cents": f"first_value(first_{metric}_cents) OVER w",
+                f"last_{metric}_cents": f"last_{metric}_cents",
+                f"min_{metric}_cents": f"min(min_{metric}_cents) OVER w",
+                f"max_{metric}_cents": f"max(max_{metric}_cents) OVER w",
+            }
+    period: str = f"substr({order}, 1, :length)"
+    selected: list[str] = [
+        ":resolution AS resolution",
+        *keys,
+        f"{period} AS period",
+        *(f"{value} AS {column}" for column, value in aggregates.items()),
+    ]
+    columns: list[str] = ["resolution", *keys, "period", *aggregates]
+    return f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        SELECT {", ".join(columns)} FROM (
+            SELECT {", ".join(selected)}, lead(true) OVER w AS more
+            FROM ({rows})
+            WINDOW w AS (
+                PARTITION BY {", ".join([*keys, period])}
+                ORDER BY {order}
+                ROWS UNBOUNDED PRECEDING
+            )
+        )
+        WHERE more IS NULL
+        """
+
+
+def update_rollups(
+    con: sqlite3.Connection, main_record_id: int, scrape_timestamp: str
+) -> None:
+    """Adds a scrape of a main record, which may be an observation of it, to
+    the rollups of every table and resolution. Must run in the transaction
+    that records the scrape.
+    """
+    for table in ROLLUP_TABLES:
+        statement: str = _upsert_statement(table)
+        for resolution, length in ROLLUP_RESOLUTIONS.items():
+            con.execute(
+                statement,
+                dict(
+                    resolution=resolution,
+                    period=scrape_timestamp[:length],
+                    main_record_id=main_record_id,
+                    scrape_timestamp=scrape_timestamp,
+                ),
+            )
+
+
+def rebuild_rollups(con: sqlite3.Connection, set_based: bool | None = None) -> int:
+    """Recomputes all rollups from the recorded scrapes and returns how many
+    there were, and counts the rollup generation up. If `set_based`, each
+    table is rebuilt at the finest resolution from the scrapes, and at the
+    others from that, and otherwise each scrape is replayed; by default, the
+    faster of the two for the number of scrapes per period is used. Must run
+    in a write transaction.
+    """
+    # Periods are prefixes of the timestamps, so each finer period falls in
+    # a single coarser one.
+    finest, *coarser = sorted(
+        ROLLUP_RESOLUTIONS, key=ROLLUP_RESOLUTIONS.get, reverse=True
+    )
+    scrapes: list[tuple[int, str]] = con.execute(
+        """
+        SELECT row_id, scrape_timestamp FROM main_record
+        UNION ALL
+        SELECT main_record_id, scrape_timestamp FROM record_observation
+        """
+    ).fetchall()
+    if set_based is None:
+        num_periods: int = len(
+            {timestamp[: ROLLUP_RESOLUTIONS[finest]] for _, timestamp in scrapes}
+        )
+        set_based = len(scrapes) >= SET_BASED_REBUILD_MIN_SCRAPES * num_periods
+    for table in ROLLUP_TABLES:
+        con.execute(f"DELETE FROM {table}")
+    if not set_based:
+        for main_record_id, scrape_timestamp in scrapes:
+            update_rollups(con, main_record_id, scrape_timestamp)
+    else:
+        for table in ROLLUP_TABLES:
+            con.execute(
+                _rebuild_statement(table, from_scrapes=True),
+                dict(resolution=finest, length=ROLLUP_RESOLUTIONS[finest]),
+            )
+            for resolution in coarser:
+                con.execute(
+                    _rebuild_statement(table, from_scrapes=False),
+                    dict(
+                        resolution=resolution,
+                        length=ROLLUP_RESOLUTIONS[resolution],
+                        from_resolution=finest,
+                    ),
+                )
+    con.execute("UPDATE rollup_generation SET generation = generation + 1")
+    return len(scrapes)
@@ -1,15 +1,30 @@
 """Scrapes data from Nelnet's web interface."""
 
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+import contextlib
 import datetime as dt
+from pathlib import Path
+import re
+import time
+from typing import Iterator
+from urllib.parse import urlsplit
 
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import (
+    InvalidCookieDomainException,
+    NoSuchElementException,
+    TimeoutException,
+)
 from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.webdriver.firefox.webdriver import WebDriver as FirefoxWebDriver
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from .config import CONFIG
+from .dom import SNAPSHOT_SCRIPT, DomNode, evaluate_xpath, parse_html
+
 
 # NOTE: The order of classes (which are space-separated) in XPath class
 # identifiers matters. E.g. div[@class='u-grid-item u-xs-6'] is not the same as
@@ -44,50 +59,206 @@ class ElementFinder:
         return self.find_element(xpath).text
 
 
-class WebScraper:
-    """Responsible for using Selenium to scrape loan data from the Nelnet
-    website.
+class DomFinder:
+    """Drop-in replacement for `ElementFinder` that looks elements up in a
+    `DomNode` tree held in memory instead of asking the browser each time.
     """
 
-    def __init__(self) -> None:
-        # Web driver for interacting with Selenium's API.
-        self.driver: FirefoxWebDriver = webdriver.Firefox()
-        # Custom object for encapsulating element finding boilerplate.
-        self.finder: ElementFinder = ElementFinder(self.driver)
+    def __init__(self, root: DomNode, root_xpath: NodeXPath | None = None) -> None:
+        self.root: DomNode = root
+        # Absolute XPath of `root`, or None if `root` is the document itself.
+        self.root_xpath: NodeXPath | None = root_xpath
+        # Nodes found so far by relative path, shared between lookups.
+        self.cache: dict[str, list[DomNode]] = {}
+
+    def find_element(self, xpath: NodeXPath) -> DomNode:
+        path: str = str(xpath)
+        if self.root_xpath is not None:
+            prefix: str = str(self.root_xpath)
+            if path == prefix:
+                return self.root
+            if not path.startswith(prefix + "/"):
+                raise NoSuchElementException(f"Outside of snapshot: {xpath}")
+            path = path[len(prefix) + 1 :]
+        nodes: list[DomNode] = evaluate_xpath(self.root, path, self.cache)
+        if not nodes:
+            raise NoSuchElementException(f"Unable to locate element: {xpath}")
+        return nodes[0]
 
-    def scrape_all_data(self) -> dict:
-        self.driver.get("https://nelnet.studentaid.gov/account/login")
-
-        input('Press Enter after you have logged in and reached the "My Loans" page.')
-
-        # Start by scraping overview data.
-        main_node: NodeXPath = (
-            NodeXPath("/html")
-            / "body"
-            / "app-root"
-            / "layout-content-layout"
-            / "div[@id='mainContent']"
-            / "main"
-            / "loan-loan-details"
-            / "loan-single-account"
-            / "div"
-            / "div[3]"
-        )
+    def find_element_text(self, xpath: NodeXPath) -> str:
+        return self.find_element(xpath).text
 
-        # Wait for the main content to load.
-        WebDriverWait(self.driver, 10).until(
-            EC.presence_of_element_located((By.XPATH, str(main_node)))
+
+LOGIN_URL: str = "https://nelnet.studentaid.gov/account/login"
+
+# Root of the "My Loans" page content.
+ACCOUNT_NODE: NodeXPath = (
+    NodeXPath("/html")
+    / "body"
+    / "app-root"
+    / "layout-content-layout"
+    / "div[@id='mainContent']"
+    / "main"
+    / "loan-loan-details"
+    / "loan-single-account"
+)
+MAIN_NODE: NodeXPath = ACCOUNT_NODE / "div" / "div[3]"
+
+# How page data is read once the page is loaded. "snapshot" copies the whole
+# account subtree out of the browser in one call and reads fields from the
+# copy; "per-field" asks the browser for each field separately.
+EXTRACTION_MODES: tuple[str, ...] = ("snapshot", "per-field")
+
+# How loan group accordions are expanded. "all" clicks every accordion in one
+# call and then waits once for all of them; "sequential" clicks and waits for
+# one group at a time.
+EXPANSION_MODES: tuple[str, ...] = ("all", "sequential")
+
+# Clicks every element matched by the XPath given as the first argument and
+# returns how many were clicked.
+CLICK_ALL_SCRIPT: str = """
+const result = document.evaluate(
+    arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+);
+for (let i = 0; i < result.snapshotLength; i++) {
+    result.snapshotItem(i).click();
+}
+return result.snapshotLength;
+"""
+
+# Returns whether at least the number of elements given as the second argument
+# match the XPath given as the first, and each of them has a child `div`, as
+# the panel of an expanded loan group does once its loans have loaded.
+ALL_LOADED_SCRIPT: str = """
+const result = document.evaluate(
+    arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+);
+if (result.snapshotLength < arguments[1]) {
+    return false;
+}
+for (let i = 0; i < result.snapshotLength; i++) {
+    if (result.snapshotItem(i).querySelector(":scope > div") === null) {
+        return false;
+    }
+}
+return true;
+"""
+
+# First line of saved page sources, recording when the page was scraped.
+PAGE_SOURCE_HEADER: str = "<!-- nelnet_tracker scrape_timestamp: {} -->\n"
+_PAGE_SOURCE_HEADER_PATTERN: re.Pattern = re.compile(
+    r"^<!-- nelnet_tracker scrape_timestamp: (?P<timestamp>.*?) -->"
+)
+
+
+# Browser profiles, see `firefox_options`.
+PROFILES: tuple[str, ...] = ("default", "fast")
+
+# Copies web storage out of the page, so a session can be moved to another
+# browser.
+EXPORT_STORAGE_SCRIPT: str = """
+return {
+    local: Object.entries(window.localStorage),
+    session: Object.entries(window.sessionStorage),
+};
+"""
+IMPORT_STORAGE_SCRIPT: str = """
+for (const [key, value] of arguments[0].local) {
+    window.localStorage.setItem(key, value);
+}
+for (const [key, value] of arguments[0].session) {
+    window.sessionStorage.setItem(key, value);
+}
+"""
+
+
+def firefox_options(
+    profile: str, headless: bool = False, profile_dir: Path | None = None
+) -> FirefoxOptions:
+    """Returns browser options for the given profile, one of PROFILES.
+    `profile_dir` is a Firefox profile directory to use and keep, instead of a
+    throwaway one.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown browser profile: {profile!r}")
+    options: FirefoxOptions = FirefoxOptions()
+    if headless:
+        options.add_argument("-headless")
+    if profile_dir is not None:
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        options.add_argument("-profile")
+        options.add_argument(str(profile_dir))
+    if profile == "fast":
+        # Return from page loads once the DOM is ready rather than after
+        # every subresource has loaded. We wait for the elements we need
+        # anyway.
+        options.page_load_strategy = "eager"
+        # Don't load images, web fonts or autoplay media.
+        options.set_preference("permissions.default.image", 2)
+        options.set_preference("gfx.downloadable_fonts.enabled", False)
+        options.set_preference("browser.display.use_document_fonts", 0)
+        options.set_preference("media.autoplay.default", 5)
+        # Route blocked hosts to a closed local port with a proxy
+        # auto-config file, so their requests fail immediately.
+        options.set_preference("network.proxy.type", 2)
+        options.set_preference(
+            "network.proxy.autoconfig_url", _blocked_hosts_pac().as_uri()
         )
+    return options
+
+
+def _blocked_hosts_pac() -> Path:
+    """Writes the proxy auto-config file blocking `CONFIG.blocked_hosts` and
+    returns its path.
+    """
+    conditions: str = " ||\n        ".join(
+        f'host == "{host}" || dnsDomainIs(host, ".{host}")'
+        for host in CONFIG.blocked_hosts
+    )
+    pac: str = (
+        "function FindProxyForURL(url, host) {\n"
+        f"    if ({conditions or 'false'}) {{\n"
+        '        return "PROXY 127.0.0.1:9";\n'
+        "    }\n"
+        '    return "DIRECT";\n'
+        "}\n"
+    )
+    path: Path = CONFIG.cache_dir / "blocked_hosts.pac"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(pac)
+    return path
+
+
+def group_node(main_node: NodeXPath, index: int | None = None) -> NodeXPath:
+    """Returns the XPath of the loan group at the given 0-based index, or of
+    all loan groups if no index is given.
+    """
+    if index is None:
+        return main_node / "div[3]" / "div[@class='ng-star-inserted']"
+    return main_node / "div[3]" / f"div[@class='ng-star-inserted'][{index+1}]"
+
 
+def group_loans_node(group_xpath: NodeXPath) -> NodeXPath:
+    """Returns the XPath of the accordion panel holding a group's loans."""
+    return group_xpath / "u-panel-accordion" / "u-panel" / "div"
+
+
+class PageExtractor:
+    """Extracts loan data from a loaded "My Loans" page, with all loan group
+    accordions expanded, through the given finder.
+    """
+
+    def __init__(self, finder: ElementFinder | DomFinder) -> None:
+        self.finder: ElementFinder | DomFinder = finder
+
+    def scrape_page(self, main_node: NodeXPath) -> dict:
         data: dict = self.scrape_overview_data(main_node / "div[2]")
 
         # Loop through loans, collecting data.
         groups = []
         i: int = 0
         while True:
-            group_xpath: NodeXPath = (
-                main_node / "div[3]" / f"div[@class='ng-star-inserted'][{i+1}]"
-            )
+            group_xpath: NodeXPath = group_node(main_node, i)
             try:
                 self.finder.find_element(group_xpath)
             except NoSuchElementException:
@@ -96,38 +267,19 @@ class WebScraper:
             # Scrape group data.
             group_data: dict = self.scrape_group_data(group_xpath)
 
-            # Expand details accordion.
-            loans_xpath: NodeXPath = (
-                group_xpath / "u-panel-accordion" / "u-panel" / "div"
-            )
-            details_drop_down = self.finder.find_element(
-                loans_xpath / "u-panel-header" / "span" / "button"
-            )
-            details_drop_down.click()
-            # Wait for the accordion content to load.
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, str(loans_xpath / "div")))
-            )
-
             # Scrape individual loan details.
             group_data["loans"] = self.scrape_individual_loans(
-                loans_xpath / "div" / "div" / "div"
+                group_loans_node(group_xpath) / "div" / "div" / "div"
             )
 
             groups.append(group_data)
             i += 1
 
         data["groups"] = groups
-
-        # Metadata.
-        data["scrape_timestamp"] = str(dt.datetime.now())
-
-        self.driver.close()
-
         return data
 
     def scrape_overview_data(self, main_node: NodeXPath) -> dict:
-        finder: ElementFinder = self.finder
+        finder: ElementFinder | DomFinder = self.finder
 
         # If you have some amount past due, the layout is different.
         first_div_text: str = finder.find_element_text(main_node / "div[1]" / "div[1]")
@@ -161,7 +313,7 @@ class WebScraper:
         return data
 
     def scrape_group_data(self, group_xpath: NodeXPath) -> dict:
-        finder: ElementFinder = self.finder
+        finder: ElementFinder | DomFinder = self.finder
         data_xpath: NodeXPath = group_xpath / "div"
         return dict(
             name=finder.find_element_text(group_xpath / "h2"),
@@ -198,7 +350,7 @@ class WebScraper:
         )
 
     def scrape_individual_loans(self, group_loans_xpath: NodeXPath) -> list[dict]:
-        finder: ElementFinder = self.finder
+        finder: ElementFinder | DomFinder = self.finder
         loans: list[dict] = []
 
         i: int = 0
@@ -216,7 +368,7 @@ class WebScraper:
         return loans
 
     def scrape_single_loan(self, loan_xpath: NodeXPath) -> dict:
-        finder: ElementFinder = self.finder
+        finder: ElementFinder | DomFinder = self.finder
         loan_data_xpath = loan_xpath / "u-card" / "u-card-content" / "div"
         data: dict = dict(
             name=finder.find_element_text(loan_xpath / "h3" / "strong"),
@@ -291,9 +443,328 @@ class WebScraper:
         return data
 
 
-def scrape_all_data() -> dict:
+class WebScraper:
+    """Responsible for using Selenium to scrape loan data from the Nelnet
+    website.
+    """
+
+    def __init__(
+        self,
+        extraction: str = CONFIG.scrape_extraction,
+        page_source_dir: Path | None = None,
+        expansion: str = CONFIG.scrape_expansion,
+        profile: str = CONFIG.scrape_profile,
+        headless_after_login: bool = CONFIG.headless_after_login,
+        profile_dir: Path | None = None,
+    ) -> None:
+        if extraction not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode: {extraction!r}")
+        if expansion not in EXPANSION_MODES:
+            raise ValueError(f"Unknown expansion mode: {expansion!r}")
+        # How page data is read, one of EXTRACTION_MODES.
+        self.extraction: str = extraction
+        # How loan groups are expanded, one of EXPANSION_MODES.
+        self.expansion: str = expansion
+        # Seconds spent in each phase of the latest scrape, since the latest
+        # `login` or `reload`.
+        self.timings: dict[str, float] = {}
+        # Where to save the loaded page source, if anywhere.
+        self.page_source_dir: Path | None = page_source_dir
+        # Path of the page source saved by the latest scrape.
+        self.page_source_path: Path | None = None
+        # Address of the "My Loans" page, known once the user has logged in.
+        self.loans_url: str | None = None
+        # Browser profile, one of PROFILES.
+        self.profile: str = profile
+        # Whether to move the session to a headless browser after logging in.
+        self.headless_after_login: bool = headless_after_login
+        # Firefox profile directory, or None for a throwaway one.
+        self.profile_dir: Path | None = profile_dir
+        # Whether the browser is headless, once the session has been moved.
+        self.headless: bool = False
+        # Web driver for interacting with Selenium's API.
+        self.driver: FirefoxWebDriver = webdriver.Firefox(
+            options=firefox_options(profile, profile_dir=profile_dir)
+        )
+        # Custom object for encapsulating element finding boilerplate.
+        self.finder: ElementFinder = ElementFinder(self.driver)
+
+    def scrape_all_data(self) -> dict:
+        self.login()
+        data: dict = self.scrape_loaded_page()
+
+        self.driver.close()
+
+        return data
+
+    def login(self, interactive: bool = True) -> None:
+        """Opens the login page and waits for the user to log in and reach
+        the "My Loans" page. If not `interactive`, the page is detected
+        without asking the user to press Enter, for when there is no terminal
+        to ask in. A headless browser, from an earlier login, is replaced with
+        one the user can log in with.
+        """
+        if self.headless:
+            self.open_browser(headless=False)
+        self.driver.get(LOGIN_URL)
+
+        if interactive:
+            input(
+                'Press Enter after you have logged in and reached the "My Loans"'
+                " page."
+            )
+        else:
+            WebDriverWait(self.driver, CONFIG.login_timeout).until(
+                EC.presence_of_element_located((By.XPATH, str(MAIN_NODE)))
+            )
+
+        self.loans_url = self.driver.current_url
+        self.timings = {}
+
+        if self.headless_after_login:
+            with self.timed("go_headless"):
+                self.go_headless()
+
+    def go_headless(self) -> None:
+        """Moves the logged-in session into a new headless browser and opens
+        the "My Loans" page there.
+        """
+        assert self.loans_url is not None
+        cookies: list[dict] = self.driver.get_cookies()
+        storage: dict = self.driver.execute_script(EXPORT_STORAGE_SCRIPT)
+        self.open_browser(headless=True)
+
+        # Cookies and web storage can only be set for the site currently open.
+        url = urlsplit(self.loans_url)
+        self.driver.get(f"{url.scheme}://{url.netloc}/")
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(cookie)
+            except InvalidCookieDomainException:
+                # Belongs to another site, e.g. the identity provider.
+                pass
+        self.driver.execute_script(IMPORT_STORAGE_SCRIPT, storage)
+        self.driver.get(self.loans_url)
+
+    def open_browser(self, headless: bool) -> None:
+        """Quits the browser and opens a new one, headless or not."""
+        self.driver.quit()
+        self.driver = webdriver.Firefox(
+            options=firefox_options(
+                self.profile, headless=headless, profile_dir=self.profile_dir
+            )
+        )
+        self.finder = ElementFinder(self.driver)
+        self.headless = headless
+
+    def reload(self) -> bool:
+        """Loads the "My Loans" page again in the current session. Returns
+        False if the session is no longer logged in, in which case `login`
+        needs to be called again.
+        """
+        if self.loans_url is None:
+            return False
+        self.timings = {}
+        with self.timed("page_load"):
+            self.driver.get(self.loans_url)
+        try:
+            WebDriverWait(self.driver, CONFIG.session_check_timeout).until(
+                EC.presence_of_element_located((By.XPATH, str(MAIN_NODE)))
+            )
+        except TimeoutException:
+            return False
+        return True
+
+    def scrape_loaded_page(self) -> dict:
+        """Scrapes the "My Loans" page currently open in the browser."""
+        # Wait for the main content to load.
+        with self.timed("main_content"):
+            WebDriverWait(self.driver, 10).until(
+                EC.presence_of_element_located((By.XPATH, str(MAIN_NODE)))
+            )
+
+        if self.expansion == "all":
+            self.expand_all_groups(MAIN_NODE)
+        else:
+            self.expand_groups(MAIN_NODE)
+
+        timestamp: str = str(dt.datetime.now())
+        if self.page_source_dir is not None:
+            with self.timed("save_page"):
+                self.save_page_source(timestamp)
+
+        with self.timed("extract"):
+            finder: ElementFinder | DomFinder = self.finder
+            if self.extraction == "snapshot":
+                finder = self.snapshot_finder()
+            data: dict = PageExtractor(finder).scrape_page(MAIN_NODE)
+
+        # Metadata.
+        data["scrape_timestamp"] = timestamp
+
+        return data
+
+    @contextlib.contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        """Adds the time spent in the context to the given phase's timing."""
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed: float = time.perf_counter() - start
+            self.timings[phase] = self.timings.get(phase, 0.0) + elapsed
+
+    def expand_groups(self, main_node: NodeXPath) -> None:
+        """Expands the details accordion of every loan group, one at a time,
+        so that the individual loans can be read.
+        """
+        i: int = 0
+        while True:
+            group_xpath: NodeXPath = group_node(main_node, i)
+            try:
+                self.finder.find_element(group_xpath)
+            except NoSuchElementException:
+                break
+
+            # Expand details accordion.
+            loans_xpath: NodeXPath = group_loans_node(group_xpath)
+            with self.timed("expand_click"):
+                details_drop_down = self.finder.find_element(
+                    loans_xpath / "u-panel-header" / "span" / "button"
+                )
+                details_drop_down.click()
+            # Wait for the accordion content to load.
+            with self.timed("expand_wait"):
+                WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.XPATH, str(loans_xpath / "div")))
+                )
+
+            i += 1
+
+    def expand_all_groups(self, main_node: NodeXPath) -> None:
+        """Expands the details accordion of every loan group at once, then
+        waits until all of them have loaded.
+        """
+        loans_xpath: NodeXPath = group_loans_node(group_node(main_node))
+        with self.timed("expand_click"):
+            num_groups: int = self.driver.execute_script(
+                CLICK_ALL_SCRIPT,
+                str(loans_xpath / "u-panel-header" / "span" / "button"),
+            )
+        # Wait for the content of every accordion to load, checking them all
+        # in one call each time.
+        with self.timed("expand_wait"):
+            WebDriverWait(self.driver, 10).until(
+                lambda driver: driver.execute_script(
+                    ALL_LOADED_SCRIPT, str(loans_xpath), num_groups
+                )
+            )
+
+    def snapshot_finder(self) -> DomFinder:
+        """Copies the account subtree out of the browser in a single call and
+        returns a finder that reads from the copy.
+        """
+        snapshot: dict | None = self.driver.execute_script(
+            SNAPSHOT_SCRIPT, str(ACCOUNT_NODE)
+        )
+        if snapshot is None:
+            raise NoSuchElementException(f"Unable to locate element: {ACCOUNT_NODE}")
+        return DomFinder(DomNode.from_snapshot(snapshot), ACCOUNT_NODE)
+
+    def save_page_source(self, timestamp: str) -> None:
+        """Saves the page as currently loaded, so that it can be parsed again
+        later with `scrape_page_source`.
+        """
+        assert self.page_source_dir is not None
+        self.page_source_dir.mkdir(parents=True, exist_ok=True)
+        path: Path = self.page_source_dir / scrape_file_name(timestamp, ".html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(PAGE_SOURCE_HEADER.format(timestamp))
+            f.write(self.driver.page_source)
+        self.page_source_path = path
+
+
+def scrape_file_name(timestamp: str, suffix: str) -> str:
+    """Returns the name of a file holding a scrape from the given time."""
+    # Colons aren't allowed in file names on all platforms.
+    return timestamp.replace(" ", "T").replace(":", "-") + suffix
+
+
+def scrape_all_data(
+    extraction: str = CONFIG.scrape_extraction,
+    page_source_dir: Path | None = None,
+    expansion: str = CONFIG.scrape_expansion,
+    profile: str = CONFIG.scrape_profile,
+) -> dict:
     """Scrapes all loan details from the Nelnet web interface and returns it in
     a dictionary.
     """
-    scraper: WebScraper = WebScraper()
+    scraper: WebScraper = WebScraper(extraction, page_source_dir, expansion, profile)
     return scraper.scrape_all_data()
+
+
+def scrape_accounts(
+    accounts: list[str], **options
+) -> Iterator[tuple[str, dict | None, Exception | None]]:
+    """Scrapes several accounts at once, each in its own process, browser and
+    browser profile. Yields (account, data, None) as each scrape finishes, or
+    (account, None, error) if it failed, without stopping the others.
+    `options` are passed on to `WebScraper`.
+    """
+    with ProcessPoolExecutor(max_workers=len(accounts)) as executor:
+        futures: dict[Future, str] = {
+            executor.submit(_scrape_account, account, options): account
+            for account in accounts
+        }
+        for future in as_completed(futures):
+            try:
+                data: dict = future.result()
+            except Exception as e:
+                yield futures[future], None, e
+            else:
+                yield futures[future], data, None
+
+
+def _scrape_account(account: str, options: dict) -> dict:
+    CONFIG.account = account
+    if options.pop("save_page", False):
+        options["page_source_dir"] = CONFIG.page_source_dir
+    scraper: WebScraper = WebScraper(profile_dir=CONFIG.browser_profile_dir, **options)
+    try:
+        # Worker processes can't read from the terminal.
+        scraper.login(interactive=False)
+        return scraper.scrape_loaded_page()
+    finally:
+        scraper.driver.quit()
+
+
+def scrape_page_source(path: Path) -> dict:
+    """Extracts the same data as `scrape_all_data` from a page source saved
+    during an earlier scrape, without a browser.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        html: str = f.read()
+
+    # Only parse the account subtree when it can be cut out of the page, like
+    # the live snapshot does. The rest of the page is mostly scripts and
+    # styles.
+    start: int = html.find("<loan-single-account")
+    end_tag: str = "</loan-single-account>"
+    end: int = html.rfind(end_tag)
+    finder: DomFinder
+    if 0 <= start < end:
+        fragment: DomNode = parse_html(html[start : end + len(end_tag)])
+        finder = DomFinder(fragment.children[0], ACCOUNT_NODE)
+    else:
+        finder = DomFinder(parse_html(html))
+    data: dict = PageExtractor(finder).scrape_page(MAIN_NODE)
+
+    # Metadata. Fall back on the file's modification time for pages that
+    # weren't saved by the scraper.
+    match: re.Match | None = _PAGE_SOURCE_HEADER_PATTERN.match(html)
+    if match is not None:
+        data["scrape_timestamp"] = match["timestamp"]
+    else:
+        data["scrape_timestamp"] = str(dt.datetime.fromtimestamp(path.stat().st_mtime))
+
+    return data
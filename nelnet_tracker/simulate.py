@@ -0,0 +1,310 @@
+"""Simulates paying off the loans under many payment strategies at once, to
+compare what-if scenarios.
+
+The loans start as they were in the latest record. Each month, interest
+accrues daily on each loan's principal at its rate, as simple interest, and
+the month's payment goes to accrued interest first and then to principal.
+Every loan gets its share of its group's regular monthly payment. The rest of
+the payment, the strategy's extra amount, its lump sum in the month it's
+paid and the regular payments of loans already paid off, goes to the loans in
+the strategy's order: highest rate first ("avalanche") or smallest balance
+first ("snowball").
+
+Strategies are simulated together, one month at a time, on arrays with a row
+per strategy and a column per loan. Rows drop out as their loans are paid
+off.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from .config import CONFIG
+from .connection import connection, snapshot
+from .migrations import migrate_database
+from .query import groups_query, loans_query
+
+
+# Orders in which payments beyond the regular ones go to the loans.
+SIMULATION_ORDERS: tuple[str, ...] = ("avalanche", "snowball")
+
+# Days per year of daily interest, as in the interest rate factor of federal
+# student loans.
+DAYS_PER_YEAR: float = 365.25
+
+# Type of the loans a simulation starts from, a row per loan. The minimum
+# payment is the loan's share of its group's regular monthly payment.
+SIMULATION_LOAN_DTYPE: np.dtype = np.dtype(
+    [
+        ("name", "U64"),
+        ("principal_cents", "int64"),
+        ("accrued_interest_cents", "int64"),
+        ("interest_rate_percent", "float64"),
+        ("due_date", "datetime64[D]"),
+        ("minimum_payment_cents", "int64"),
+    ]
+)
+
+# Type of payment strategies, a row per strategy: an order of
+# `SIMULATION_ORDERS`, an extra amount paid every month, and a lump sum paid
+# along with the payment of a month, counted from 0 for the first payment.
+SCENARIO_DTYPE: np.dtype = np.dtype(
+    [
+        ("order", "U16"),
+        ("extra_cents", "int64"),
+        ("lump_sum_cents", "int64"),
+        ("lump_sum_month", "int64"),
+    ]
+)
+
+# Type of simulation results, a row per strategy: the date of the last
+# payment, the number of monthly payments, and the interest and total paid.
+# Strategies that don't pay the loans off within the simulated months have no
+# payoff date, and the totals of the months simulated.
+SIMULATION_RESULT_DTYPE: np.dtype = np.dtype(
+    [
+        ("payoff_date", "datetime64[D]"),
+        ("months", "int64"),
+        ("total_interest_cents", "int64"),
+        ("total_paid_cents", "int64"),
+    ]
+)
+
+# Balances below half a cent count as paid off.
+_PAID_OFF_CENTS: float = 0.5
+
+
+def latest_loans(
+    database_path: Path | None = None,
+) -> tuple[np.datetime64, np.ndarray]:
+    """Returns the date of the latest scrape and the loans with a balance in
+    it, as an array of `SIMULATION_LOAN_DTYPE`.
+    """
+    migrate_database(database_path)
+    with connection(database_path) as con, snapshot(con):
+        latest: str | None = con.execute(
+            """
+            SELECT max(scrape_timestamp) FROM (
+                SELECT max(scrape_timestamp) AS scrape_timestamp FROM main_record
+                UNION ALL
+                SELECT max(scrape_timestamp) FROM record_observation
+            )
+            """
+        ).fetchone()[0]
+        if latest is None:
+            raise RuntimeError("There are no records to simulate from")
+        loan_rows: list[tuple] = con.execute(
+            *loans_query(
+                (
+                    "group_name",
+                    "loan_name",
+                    "principal_balance_cents",
+                    "accrued_interest_cents",
+                    "interest_rate_percent",
+                    "due_date_iso",
+                ),
+                start=latest,
+            )
+        ).fetchall()
+        payments: dict[str, int] = {
+            name: cents or 0
+            for _, name, cents in con.execute(
+                *groups_query(
+                    ("group_name", "regular_monthly_payment_amount_cents"),
+                    start=latest,
+                )
+            )
+        }
+
+    loan_rows = [row for row in loan_rows if (row[3] or 0) + (row[4] or 0) > 0]
+    group_principal: dict[str, int] = {}
+    for _, group, _, principal, *_ in loan_rows:
+        group_principal[group] = group_principal.get(group, 0) + (principal or 0)
+    loans: np.ndarray = np.array(
+        [
+            (
+                name,
+                principal or 0,
+                interest or 0,
+                rate or 0.0,
+                due_date or "NaT",
+                # Groups split their payment among their loans by principal.
+                round(
+                    payments.get(group, 0)
+                    * (principal or 0)
+                    / (group_principal[group] or 1)
+                ),
+            )
+            for _, group, name, principal, interest, rate, due_date in loan_rows
+        ],
+        dtype=SIMULATION_LOAN_DTYPE,
+    )
+    return np.datetime64(latest[:10], "D"), loans
+
+
+def scenario_grid(
+    orders: tuple[str, ...] = SIMULATION_ORDERS,
+    extra_cents: tuple[int, ...] = (0,),
+    lump_sum_cents: tuple[int, ...] = (0,),
+    lump_sum_months: tuple[int, ...] = (0,),
+) -> np.ndarray:
+    """Returns every combination of the orders, extra amounts, lump sums and
+    months to pay them in, as an array of `SCENARIO_DTYPE`.
+    """
+    grid: list[np.ndarray] = np.meshgrid(
+        np.arange(len(orders)),
+        np.asarray(extra_cents, dtype=np.int64),
+        np.asarray(lump_sum_cents, dtype=np.int64),
+        np.asarray(lump_sum_months, dtype=np.int64),
+        indexing="ij",
+    )
+    scenarios: np.ndarray = np.empty(grid[0].size, dtype=SCENARIO_DTYPE)
+    scenarios["order"] = np.asarray(orders, dtype=str)[grid[0].ravel()]
+    for field, values in zip(SCENARIO_DTYPE.names[1:], grid[1:]):
+        scenarios[field] = values.ravel()
+    return scenarios
+
+
+def simulate_repayment(
+    loans: np.ndarray,
+    scenarios: np.ndarray,
+    start: np.datetime64,
+    max_months: int | None = None,
+) -> np.ndarray:
+    """Returns the results of paying off `loans`, an array of
+    `SIMULATION_LOAN_DTYPE` as of the date `start`, under each of the
+    `scenarios`, an array of `SCENARIO_DTYPE`, as an array of
+    `SIMULATION_RESULT_DTYPE`. At most `max_months`, or
+    `CONFIG.simulation_max_months`, are simulated.
+    """
+    if max_months is None:
+        max_months = CONFIG.simulation_max_months
+    unknown: np.ndarray = np.setdiff1d(scenarios["order"], SIMULATION_ORDERS)
+    if len(unknown):
+        raise ValueError(f"Unknown payment order: {unknown[0]!r}")
+    if (
+        (scenarios["extra_cents"] < 0).any()
+        or (scenarios["lump_sum_cents"] < 0).any()
+        or (scenarios["lump_sum_month"] < 0).any()
+    ):
+        raise ValueError("Payments and months must not be negative")
+
+    num_scenarios: int = len(scenarios)
+    num_loans: int = len(loans)
+    dates: np.ndarray = _payment_dates(loans["due_date"], start, max_months)
+    days: np.ndarray = np.diff(
+        dates, axis=0, prepend=np.full((1, num_loans), start)
+    ).astype(np.int64)
+    # Interest accrued in each month, per cent of principal.
+    accrual: np.ndarray = (
+        days * loans["interest_rate_percent"] / 100 / DAYS_PER_YEAR
+    ).astype(np.float64)
+    minimum: np.ndarray = loans["minimum_payment_cents"].astype(np.float64)
+
+    owed: np.ndarray = (
+        loans["principal_cents"] + loans["accrued_interest_cents"]
+    ).astype(np.float64)
+    rates: np.ndarray = loans["interest_rate_percent"]
+    orders: np.ndarray = np.where(
+        (scenarios["order"] == "avalanche")[:, np.newaxis],
+        np.lexsort((owed, -rates)),
+        np.lexsort((-rates, owed)),
+    )
+
+    # State of the strategies not paid off yet, a row each.
+    active: np.ndarray = np.arange(num_scenarios)
+    principal: np.ndarray = np.tile(
+        loans["principal_cents"].astype(np.float64), (num_scenarios, 1)
+    )
+    interest: np.ndarray = np.tile(
+        loans["accrued_interest_cents"].astype(np.float64), (num_scenarios, 1)
+    )
+    # Regular payments of loans paid off go to the others.
+    payment: np.ndarray = minimum.sum() + scenarios["extra_cents"].astype(np.float64)
+    lump_sum: np.ndarray = scenarios["lump_sum_cents"].astype(np.float64)
+    lump_sum_month: np.ndarray = scenarios["lump_sum_month"]
+    inverse_orders: np.ndarray = np.argsort(orders, axis=1)
+    # Month in which each loan was paid off, -1 if it was from the start.
+    paid_month: np.ndarray = np.where(owed < _PAID_OFF_CENTS, -1, max_months)
+    paid_month = np.tile(paid_month, (num_scenarios, 1))
+
+    results: np.ndarray = np.zeros(num_scenarios, dtype=SIMULATION_RESULT_DTYPE)
+    results["payoff_date"] = np.datetime64("NaT")
+    results["months"] = max_months
+    total_interest: np.ndarray = np.zeros(num_scenarios)
+    total_paid: np.ndarray = np.zeros(num_scenarios)
+    loan_columns: np.ndarray = np.arange(num_loans)
+
+    for month in range(max_months + 1):
+        done: np.ndarray = (paid_month < month).all(axis=1)
+        if done.any():
+            finished: np.ndarray = active[done]
+            results["months"][finished] = month
+            results["payoff_date"][finished] = np.where(
+                paid_month[done] < 0,
+                start,
+                dates[paid_month[done].clip(0, max_months - 1), loan_columns],
+            ).max(axis=1, initial=start)
+            keep: np.ndarray = ~done
+            active = active[keep]
+            principal, interest, paid_month = (
+                principal[keep],
+                interest[keep],
+                paid_month[keep],
+            )
+            orders, inverse_orders = orders[keep], inverse_orders[keep]
+            payment, lump_sum, lump_sum_month = (
+                payment[keep],
+                lump_sum[keep],
+                lump_sum_month[keep],
+            )
+        if not len(active) or month == max_months:
+            break
+
+        accrued: np.ndarray = principal * accrual[month]
+        interest += accrued
+        owed_now: np.ndarray = principal + interest
+        paid: np.ndarray = np.minimum(minimum, owed_now)
+        left: np.ndarray = (
+            payment + np.where(lump_sum_month == month, lump_sum, 0) - paid.sum(axis=1)
+        )
+        # The rest goes to each loan in order until it's used up.
+        rest: np.ndarray = np.take_along_axis(owed_now - paid, orders, axis=1)
+        before: np.ndarray = np.cumsum(rest, axis=1) - rest
+        paid += np.take_along_axis(
+            np.clip(left[:, np.newaxis] - before, 0, rest), inverse_orders, axis=1
+        )
+        to_interest: np.ndarray = np.minimum(paid, interest)
+        interest -= to_interest
+        principal -= paid - to_interest
+        total_interest[active] += accrued.sum(axis=1)
+        total_paid[active] += paid.sum(axis=1)
+
+        paid_off: np.ndarray = principal + interest < _PAID_OFF_CENTS
+        principal[paid_off] = 0
+        interest[paid_off] = 0
+        paid_month[paid_off & (paid_month == max_months)] = month
+
+    results["total_interest_cents"] = total_interest.round()
+    results["total_paid_cents"] = total_paid.round()
+    return results
+
+
+def _payment_dates(
+    due_dates: np.ndarray, start: np.datetime64, num_months: int
+) -> np.ndarray:
+    """Returns a (month, loan) array of the dates of the monthly payments of
+    loans with the next `due_dates`, on the same day of each month or the
+    last day of shorter months. Due dates before `start`, or missing, are
+    taken to be the first due date on or after it.
+    """
+    upcoming: np.ndarray = due_dates[due_dates >= start]
+    first: np.datetime64 = upcoming.min() if len(upcoming) else start
+    due_dates = np.where(np.isnat(due_dates) | (due_dates < start), first, due_dates)
+
+    months: np.ndarray = (
+        due_dates.astype("M8[M]") + np.arange(num_months)[:, np.newaxis]
+    )
+    day: np.ndarray = (due_dates - due_dates.astype("M8[M]")).astype(np.int64)
+    month_days: np.ndarray = ((months + 1) - months.astype("M8[D]")).astype(np.int64)
+    return months.astype("M8[D]") + np.minimum(day, month_days - 1)
@@ -0,0 +1,220 @@
+"""Reports how much space the database takes up and where it goes, from
+SQLite's `dbstat` virtual table (https://www.sqlite.org/dbstat.html), so
+that its growth can be watched.
+"""
+
+from pathlib import Path
+import sqlite3
+
+from .connection import connection, default_database_path, snapshot
+from .migrations import SCHEMA_VERSION, schema_version
+
+
+# Rows written along with the main record :main_record_id, by table, as
+# conditions on the table's rows. Observations of unchanged records only add
+# a row to record_observation, and rollups are updated in place, so neither is
+# counted.
+_RECORD_ROWS: dict[str, str] = dict(
+    main_record="row_id == :main_record_id",
+    group_record="main_record_id == :main_record_id",
+    payment_information="main_record_id == :main_record_id",
+    balance_information="main_record_id == :main_record_id",
+    loan_current_information="main_record_id == :main_record_id",
+    loan_record_history="valid_from == :main_record_id",
+    loan_historic_information_history="valid_from == :main_record_id",
+    loan_benefit_details_history="valid_from == :main_record_id",
+    loan_disbursement="""
+        loan_historic_information_id IN (
+            SELECT row_id FROM loan_historic_information_history
+            WHERE valid_from == :main_record_id
+        )
+        """,
+)
+
+
+def database_stats(database_path: Path | None = None) -> dict:
+    """Returns statistics of the database, from a single snapshot of it:
+
+    - "path", "file_bytes", "page_size", "free_pages" and "schema_version".
+    - "objects": For each table and index by name, the "table" it belongs to,
+      its number of "rows" if it's a table, the "bytes" of its pages, the
+      "unused_bytes" in them, and its "fragmentation", the fraction of its
+      pages that don't directly follow the one before them in the file.
+    - "records", "observations", "scrapes" (the two together),
+      "first_scrape" and "last_scrape".
+    - "bytes_per_scrape": Bytes in use over the number of scrapes.
+    - "latest_record_bytes": An estimate of the bytes taken up by the latest
+      full record, from the average size of the rows it has in each table.
+    - "bytes_per_day": Bytes in use over the days between the first and last
+      scrape.
+    - "growth": For each month with scrapes, its "records", "observations"
+      and an estimate of the "bytes" they take up.
+
+    Sizes are None where there is nothing to divide by. The database is only
+    read, so a RuntimeError is raised if it doesn't exist or hasn't been
+    migrated to the current schema, rather than creating or migrating it.
+    """
+    database_path = database_path or default_database_path()
+    if not database_path.exists():
+        raise RuntimeError(f"There is no database at {database_path}")
+    with connection(database_path, read_only=True) as con, snapshot(con):
+        version: int = schema_version(con)
+        if version < SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {version} is older than the current"
+                f" one ({SCHEMA_VERSION}), run `migrate` to update it"
+            )
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"Database schema version {version} is newer than the latest"
+                f" this version of nelnet_tracker knows about ({SCHEMA_VERSION})"
+            )
+        page_size: int = con.execute("PRAGMA page_size").fetchone()[0]
+        page_count: int = con.execute("PRAGMA page_count").fetchone()[0]
+        free_pages: int = con.execute("PRAGMA freelist_count").fetchone()[0]
+        objects: dict[str, dict] = _object_stats(con)
+        records, observations, first_scrape, last_scrape, days = con.execute(
+            """
+            SELECT
+                (SELECT count(*) FROM main_record),
+                (SELECT count(*) FROM record_observation),
+                min(scrape_timestamp),
+                max(scrape_timestamp),
+                julianday(max(scrape_timestamp)) - julianday(min(scrape_timestamp))
+            FROM (
+                SELECT scrape_timestamp FROM main_record
+                UNION ALL
+                SELECT scrape_timestamp FROM record_observation
+            )
+            """
+        ).fetchone()
+        months: list[tuple[str, int, int]] = con.execute(
+            """
+            SELECT month, sum(is_record), sum(NOT is_record)
+            FROM (
+                SELECT substr(scrape_timestamp, 1, 7) AS month, 1 AS is_record
+                FROM main_record
+                UNION ALL
+                SELECT substr(scrape_timestamp, 1, 7), 0 FROM record_observation
+            )
+            GROUP BY month
+            ORDER BY month
+            """
+        ).fetchall()
+        latest_rows: dict[str, int] = _latest_record_rows(con)
+
+    # Average bytes of a row of each table, its indexes included.
+    row_bytes: dict[str, float] = {
+        table: _divide(
+            sum(o["bytes"] for o in objects.values() if o["table"] == table),
+            objects[table]["rows"],
+        )
+        or 0
+        for table in [*_RECORD_ROWS, "record_observation"]
+    }
+    record_bytes: float = sum(
+        row_bytes[table] * objects[table]["rows"] for table in _RECORD_ROWS
+    )
+    used_bytes: int = (page_count - free_pages) * page_size
+    scrapes: int = records + observations
+    return dict(
+        path=str(database_path),
+        file_bytes=page_count * page_size,
+        page_size=page_size,
+        free_pages=free_pages,
+        schema_version=version,
+        objects=objects,
+        records=records,
+        observations=observations,
+        scrapes=scrapes,
+        first_scrape=first_scrape,
+        last_scrape=last_scrape,
+        bytes_per_scrape=_divide(used_bytes, scrapes),
+        latest_record_bytes=(
+            round(sum(row_bytes[t] * n for t, n in latest_rows.items()))
+            if latest_rows
+            else None
+        ),
+        bytes_per_day=_divide(used_bytes, days),
+        growth=[
+            dict(
+                month=month,
+                records=num_records,
+                observations=num_observations,
+                bytes=round(
+                    num_records * (_divide(record_bytes, records) or 0)
+                    + num_observations * row_bytes["record_observation"]
+                ),
+            )
+            for month, num_records, num_observations in months
+        ],
+    )
+
+
+def _object_stats(con: sqlite3.Connection) -> dict[str, dict]:
+    """Returns the statistics of each table and index, see `database_stats`."""
+    try:
+        pages: list[tuple[str, int, int, int, int]] = con.execute(
+            """
+            SELECT
+                name, count(*), sum(pgsize), sum(unused),
+                -- The first page of each has no page before it, and is NULL.
+                coalesce(sum(pageno != previous + 1), 0)
+            FROM (
+                SELECT
+                    name, pgsize, unused, pageno,
+                    lag(pageno) OVER (PARTITION BY name ORDER BY path) AS previous
+                FROM dbstat
+            )
+            GROUP BY name
+            ORDER BY name
+            """
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        raise RuntimeError(
+            "This build of SQLite doesn't have the dbstat virtual table"
+        ) from e
+    tables: dict[str, tuple[str, str]] = {
+        name: (kind, table)
+        for kind, name, table in con.execute(
+            "SELECT type, name, tbl_name FROM sqlite_master"
+        )
+    }
+    objects: dict[str, dict] = {}
+    for name, num_pages, num_bytes, unused_bytes, out_of_order in pages:
+        kind, table = tables.get(name, ("table", name))
+        objects[name] = dict(
+            table=table,
+            rows=(
+                con.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+                if kind == "table"
+                else None
+            ),
+            bytes=num_bytes,
+            unused_bytes=unused_bytes,
+            fragmentation=_divide(out_of_order, num_pages - 1) or 0.0,
+        )
+    return objects
+
+
+def _latest_record_rows(con: sqlite3.Connection) -> dict[str, int]:
+    """Returns the number of rows written with the latest main record in each
+    table, or nothing if there are no records.
+    """
+    main_record_id: int | None = con.execute(
+        "SELECT max(row_id) FROM main_record"
+    ).fetchone()[0]
+    if main_record_id is None:
+        return {}
+    return {
+        table: con.execute(
+            f"SELECT count(*) FROM {table} WHERE {condition}",
+            dict(main_record_id=main_record_id),
+        ).fetchone()[0]
+        for table, condition in _RECORD_ROWS.items()
+    }
+
+
+def _divide(numerator: float, denominator: float | None) -> float | None:
+    """Returns the quotient, or None if the denominator is zero or None."""
+    return numerator / denominator if denominator else None
@@ -0,0 +1,747 @@
+"""Benchmarks for developers. These run against synthetic data, so no browser,
+Nelnet account or real database is needed.
+
+Run all of them with `python -m util.bench`.
+"""
+
+import copy
+import datetime as dt
+import html
+from pathlib import Path
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Callable
+
+import numpy as np
+
+from nelnet_tracker.connection import connection, transaction
+from nelnet_tracker.database import write_record_to_database
+from nelnet_tracker.dom import DomNode
+from nelnet_tracker.parse import (
+    parse_cents,
+    parse_cents_array,
+    parse_date,
+    parse_date_array,
+    parse_percent,
+    parse_percent_array,
+)
+from nelnet_tracker.plot import loan_balances
+from nelnet_tracker.query import iter_loans
+from nelnet_tracker.reconcile import reconcile_accrual
+from nelnet_tracker.rollup import rebuild_rollups
+from nelnet_tracker.scrape import (
+    ACCOUNT_NODE,
+    MAIN_NODE,
+    PAGE_SOURCE_HEADER,
+    PROFILES,
+    DomFinder,
+    NodeXPath,
+    PageExtractor,
+    WebScraper,
+    scrape_page_source,
+)
+from nelnet_tracker.simulate import latest_loans, scenario_grid, simulate_repayment
+
+###############################################################################
+# SYNTHETIC DATA
+###############################################################################
+
+
+def synthetic_record(
+    num_groups: int = 3,
+    loans_per_group: int = 4,
+    num_disbursements: int = 2,
+    num_benefits: int = 3,
+    timestamp: str = "2024-10-20 12:00:00.000000",
+) -> dict:
+    """Returns a record shaped like the output of `scrape_all_data`."""
+    groups: list[dict] = []
+    for g in range(num_groups):
+        loans: list[dict] = []
+        for n in range(loans_per_group):
+            principal: int = 500_000 + 12_345 * (g * loans_per_group + n)
+            loans.append(
+                dict(
+                    name=f"1-{g+1:02}-{n+1:02}",
+                    group_placement=f"Loan {n+1} of {loans_per_group}",
+                    loan_type="DIRECT SUBSIDIZED",
+                    loan_status="REPAYMENT",
+                    interest_subsidy="Yes",
+                    lender_name="U.S. DEPARTMENT OF EDUCATION",
+                    school_name="STATE UNIVERSITY",
+                    current_information=dict(
+                        due_date="11/15/2024",
+                        interest_rate=f"{3.5 + 0.25 * n:.3f}% Fixed",
+                        interest_rate_type="Fixed",
+                        loan_term="120 months",
+                        principal_balance=_dollars(principal),
+                        accrued_interest=_dollars(principal // 400),
+                        capitalized_interest="$0.00",
+                    ),
+                    historic_information=dict(
+                        convert_to_repayment="05/01/2018",
+                        original_loan_amount=_dollars(principal + 100_000),
+                        disbursements=[
+                            f"{_dollars(250_000)} on 0{d+1}/15/2016"
+                            for d in range(num_disbursements)
+                        ],
+                    ),
+                    benefit_details=[
+                        (f"Benefit {b+1}", "Not Eligible") for b in range(num_benefits)
+                    ],
+                )
+            )
+        groups.append(
+            dict(
+                name=f"Group {chr(ord('A') + g)}",
+                loan_type="Direct Loans",
+                status="Repayment",
+                repayment_plan="Standard",
+                payment_information=dict(
+                    current_amount_due="$250.00",
+                    due_date="11/15/2024",
+                    interest_rate="4.250%",
+                    regular_monthly_payment_amount="$250.00",
+                    last_payment_received="$250.00 on 10/15/2024",
+                ),
+                balance_information=dict(
+                    principal_balance="$20,000.00",
+                    accrued_interest="$12.34",
+                    fees="$0.00",
+                    outstanding_balance="$20,012.34",
+                ),
+                loans=loans,
+            )
+        )
+    return dict(
+        past_due_amount="",
+        monthly_payment_remaining="",
+        current_amount_due="$750.00",
+        due_date="11/15/2024",
+        current_balance="$60,037.02",
+        last_payment_received="$750.00 on 10/15/2024",
+        groups=groups,
+        scrape_timestamp=timestamp,
+    )
+
+
+def _time(run: Callable[[], object]) -> float:
+    """Returns how many seconds a call of `run` took."""
+    start: float = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def _dollars(cents: int) -> str:
+    return f"${cents / 100:,.2f}"
+
+
+def _el(
+    tag: str, *children: dict, text: str | None = None, own: str = "", **attrs: str
+) -> dict:
+    """Builds an element in the format returned by `SNAPSHOT_SCRIPT`. `own` is
+    text rendered ahead of the children when written out as HTML.
+    """
+    if text is None:
+        text = "\n".join(c["text"] for c in children if c["text"])
+    return dict(tag=tag, attrs=attrs, text=text, children=list(children), own=own)
+
+
+def _pairs(*pairs: tuple[str, dict | str]) -> list[dict]:
+    """Label/value div pairs, the layout Nelnet uses for most fields."""
+    divs: list[dict] = []
+    for label, value in pairs:
+        divs.append(_el("div", text=label))
+        divs.append(value if isinstance(value, dict) else _el("div", text=value))
+    return divs
+
+
+def synthetic_account_snapshot(record: dict) -> dict:
+    """Renders a record into a `loan-single-account` element laid out the way
+    the scraper's XPaths expect.
+    """
+    overview: dict = _el(
+        "div",
+        _el(
+            "div",
+            *_pairs(
+                ("Current Amount Due", record["current_amount_due"]),
+                ("Payment Options", "Pay Now"),
+                ("Due Date", record["due_date"]),
+            ),
+        ),
+        _el(
+            "div",
+            *_pairs(
+                ("Current Balance", record["current_balance"]),
+                ("Unpaid Accrued Interest", "$0.00"),
+                ("Last Payment Received", record["last_payment_received"]),
+            ),
+        ),
+    )
+    groups: list[dict] = [_render_group(group) for group in record["groups"]]
+    main: dict = _el(
+        "div",
+        _el("div", text="Account Summary"),
+        overview,
+        _el("div", *groups),
+    )
+    return _el(
+        "loan-single-account",
+        _el("div", _el("div", text="Notices"), _el("div", text="Loans"), main),
+    )
+
+
+def _render_group(group: dict) -> dict:
+    payment: dict = group["payment_information"]
+    balance: dict = group["balance_information"]
+    data: dict = _el(
+        "div",
+        _el(
+            "div",
+            *_pairs(("Loan Type", group["loan_type"]), ("Status", group["status"])),
+        ),
+        _el("div", *_pairs(("Repayment Plan", group["repayment_plan"]))),
+        _el(
+            "div",
+            *_pairs(
+                ("Current Amount Due", payment["current_amount_due"]),
+                ("Due Date", payment["due_date"]),
+                ("Interest Rate", payment["interest_rate"]),
+                ("Regular Monthly Payment", payment["regular_monthly_payment_amount"]),
+                (
+                    "Last Payment Received",
+                    _el("div", _el("div", text=payment["last_payment_received"])),
+                ),
+            ),
+        ),
+        _el(
+            "div",
+            *_pairs(
+                ("Principal Balance", balance["principal_balance"]),
+                ("Accrued Interest", balance["accrued_interest"]),
+                ("Fees", balance["fees"]),
+                ("Outstanding Balance", balance["outstanding_balance"]),
+            ),
+        ),
+    )
+    loans: list[dict] = [_render_loan(loan) for loan in group["loans"]]
+    accordion: dict = _el(
+        "u-panel-accordion",
+        _el(
+            "u-panel",
+            _el(
+                "div",
+                _el("u-panel-header", _el("span", _el("button", text="Details"))),
+                _el("div", _el("div", _el("div", *loans))),
+            ),
+        ),
+    )
+    return _el(
+        "div",
+        _el("h2", text=group["name"]),
+        data,
+        accordion,
+        **{"class": "ng-star-inserted"},
+    )
+
+
+def _render_loan(loan: dict) -> dict:
+    current: dict = loan["current_information"]
+    historic: dict = loan["historic_information"]
+    card: dict = _el(
+        "div",
+        _el(
+            "div",
+            *_pairs(
+                ("Loan Type", loan["loan_type"]),
+                ("Loan Status", loan["loan_status"]),
+                ("Interest Subsidy", loan["interest_subsidy"]),
+            ),
+        ),
+        _el(
+            "div",
+            *_pairs(("Lender", loan["lender_name"]), ("School", loan["school_name"])),
+        ),
+        _el(
+            "div",
+            *_pairs(
+                ("Due Date", current["due_date"]),
+                (
+                    "Interest Rate",
+                    _el(
+                        "div",
+                        _el("span", text=current["interest_rate_type"]),
+                        text=current["interest_rate"],
+                        own=current["interest_rate"].removesuffix(
+                            current["interest_rate_type"]
+                        ),
+                    ),
+                ),
+                ("Loan Term", _el("div", _el("div", text=current["loan_term"]))),
+            ),
+        ),
+        _el(
+            "div",
+            *_pairs(
+                ("Principal Balance", current["principal_balance"]),
+                ("Accrued Interest", current["accrued_interest"]),
+                ("Capitalized Interest", current["capitalized_interest"]),
+            ),
+        ),
+        _el(
+            "div",
+            *_pairs(
+                ("Convert To Repayment", historic["convert_to_repayment"]),
+                ("Original Loan Amount", historic["original_loan_amount"]),
+            ),
+        ),
+        _el(
+            "div",
+            _el("div", text="Disbursements"),
+            _el(
+                "div",
+                *(_el("div", _el("div", text=d)) for d in historic["disbursements"]),
+            ),
+        ),
+        _el(
+            "div",
+            _el("div", text="Benefits"),
+            _el(
+                "div",
+                _el(
+                    "table",
+                    _el(
+                        "tbody",
+                        *(
+                            _el("tr", _el("td", text=name), _el("td", text=status))
+                            for name, status in loan["benefit_details"]
+                        ),
+                    ),
+                ),
+            ),
+        ),
+    )
+    return _el(
+        "div",
+        _el(
+            "h3",
+            _el("strong", text=loan["name"]),
+            _el("span", text=loan["group_placement"]),
+        ),
+        _el("u-card", _el("u-card-content", card)),
+    )
+
+
+def synthetic_page_source(record: dict) -> str:
+    """Renders a record into a full "My Loans" page, as saved by `scrape`."""
+    account: str = _render_html(synthetic_account_snapshot(record))
+    # Stand-in for the rest of the page, which is mostly scripts and styles.
+    head: str = "<script>{}</script><style>{}</style>".format(
+        "var x = 1;" * 5000, ".u-grid-item { margin: 0; }" * 2000
+    )
+    return (
+        PAGE_SOURCE_HEADER.format(record["scrape_timestamp"])
+        + f"<html><head>{head}</head><body><app-root><layout-content-layout>"
+        + "<div><nav><a href='#'>Home</a></nav></div>"
+        + "<div id='mainContent'><main><loan-loan-details>"
+        + account
+        + "</loan-loan-details></main></div>"
+        + "</layout-content-layout></app-root></body></html>"
+    )
+
+
+def _render_html(element: dict) -> str:
+    attrs: str = "".join(
+        f' {k}="{html.escape(v)}"' for k, v in element["attrs"].items()
+    )
+    if element["children"]:
+        content: str = html.escape(element["own"]) + "".join(
+            _render_html(child) for child in element["children"]
+        )
+    else:
+        content = html.escape(element["text"])
+    return f"<{element['tag']}{attrs}>{content}</{element['tag']}>"
+
+
+###############################################################################
+# SCRAPING
+###############################################################################
+
+
+class CountingFinder:
+    """Wraps a finder and counts the WebDriver commands the same lookups would
+    cost against a live browser. Reading an element's text takes a second
+    command after finding it.
+    """
+
+    def __init__(self, finder: DomFinder) -> None:
+        self.finder: DomFinder = finder
+        self.round_trips: int = 0
+
+    def find_element(self, xpath: NodeXPath) -> DomNode:
+        self.round_trips += 1
+        return self.finder.find_element(xpath)
+
+    def find_element_text(self, xpath: NodeXPath) -> str:
+        self.round_trips += 2
+        return self.finder.find_element_text(xpath)
+
+
+def bench_extraction_round_trips(latency: float = 0.005) -> None:
+    """Compares WebDriver round trips needed to extract a loaded page with
+    per-field lookups against a single snapshot call. `latency` is the assumed
+    cost of one round trip to geckodriver, in seconds.
+    """
+    print(f"Extraction round trips (assuming {latency * 1000:.0f} ms per call)")
+    for num_groups, loans_per_group in ((1, 4), (3, 4), (4, 12)):
+        record: dict = synthetic_record(num_groups, loans_per_group)
+        root: DomNode = DomNode.from_snapshot(synthetic_account_snapshot(record))
+
+        counter: CountingFinder = CountingFinder(DomFinder(root, ACCOUNT_NODE))
+        per_field: dict = PageExtractor(counter).scrape_page(MAIN_NODE)
+
+        start: float = time.perf_counter()
+        snapshot: dict = PageExtractor(DomFinder(root, ACCOUNT_NODE)).scrape_page(
+            MAIN_NODE
+        )
+        in_memory: float = time.perf_counter() - start
+
+        del record["scrape_timestamp"]
+        assert per_field == snapshot == record, "extraction does not match record"
+        print(
+            f"  {num_groups} groups x {loans_per_group} loans:"
+            f" per-field {counter.round_trips} calls"
+            f" (~{counter.round_trips * latency:.2f} s),"
+            f" snapshot 1 call (~{latency + in_memory:.3f} s)"
+        )
+
+
+def bench_page_source_parsing(num_pages: int = 365) -> None:
+    """Times re-parsing a year of daily saved page sources without a browser."""
+    record: dict = synthetic_record()
+    page_source: str = synthetic_page_source(record)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths: list[Path] = []
+        for i in range(num_pages):
+            path: Path = Path(tmp_dir) / f"{i:04}.html"
+            path.write_text(page_source, encoding="utf-8")
+            paths.append(path)
+
+        start: float = time.perf_counter()
+        for path in paths:
+            data: dict = scrape_page_source(path)
+        elapsed: float = time.perf_counter() - start
+
+    assert data == record, "parsed page source does not match record"
+    print(
+        f"Parsed {num_pages} page sources of {len(page_source) / 1024:.0f} KiB"
+        f" in {elapsed:.2f} s ({elapsed / num_pages * 1000:.1f} ms each)"
+    )
+
+
+def bench_page_load_profiles(reloads: int = 5) -> None:
+    """Compares time to the main content of the "My Loans" page between
+    browser profiles. Unlike the other benchmarks, this one needs a real
+    browser and asks you to log in once per profile.
+    """
+    results: dict[str, list[float]] = {}
+    for profile in PROFILES:
+        print(f'Log in for the "{profile}" profile.')
+        scraper: WebScraper = WebScraper(profile=profile)
+        try:
+            scraper.login()
+            times: list[float] = []
+            for _ in range(reloads):
+                if not scraper.reload():
+                    raise RuntimeError("Session expired during benchmark")
+                scraper.scrape_loaded_page()
+                times.append(
+                    scraper.timings["page_load"] + scraper.timings["main_content"]
+                )
+            results[profile] = times
+        finally:
+            scraper.driver.quit()
+
+    print(f"Time to main content over {reloads} reloads")
+    for profile, times in results.items():
+        times.sort()
+        print(
+            f"  {profile}: median {times[len(times) // 2]:.2f} s,"
+            f" min {times[0]:.2f} s, max {times[-1]:.2f} s"
+        )
+
+
+def bench_database_insert(
+    num_records: int = 20, num_groups: int = 10, loans_per_group: int = 30
+) -> None:
+    """Times writing records with hundreds of loans to a new database. Each
+    record has a different balance, so none are skipped as unchanged.
+    """
+    record: dict = synthetic_record(num_groups, loans_per_group)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "bench.sqlite3"
+        elapsed: float = 0
+        for i in range(num_records):
+            data: dict = copy.deepcopy(record)
+            data["scrape_timestamp"] = f"2024-10-{i + 1:02} 12:00:00.000000"
+            data["current_balance"] = _dollars(6_003_702 - 25_000 * i)
+            start: float = time.perf_counter()
+            write_record_to_database(data, database_path)
+            elapsed += time.perf_counter() - start
+
+        con: sqlite3.Connection = sqlite3.connect(database_path)
+        num_loan_records: int = con.execute(
+            "SELECT count(*) FROM loan_record"
+        ).fetchone()[0]
+        con.close()
+
+    assert num_loan_records == num_records * num_groups * loans_per_group
+    print(
+        f"Inserted {num_records} records of {num_groups * loans_per_group} loans"
+        f" in {elapsed:.2f} s ({elapsed / num_records * 1000:.1f} ms each)"
+    )
+
+
+def bench_rollup_rebuild(
+    num_scrapes: int = 1500,
+    scrapes_per_day: tuple[int, ...] = (1, 8, 24),
+    num_groups: int = 4,
+    loans_per_group: int = 6,
+) -> None:
+    """Times rebuilding the rollups of dozens of loans with a query per table
+    and resolution and by replaying each scrape, for scrapes spread over
+    days more or less thinly. Records change once a day, so the other
+    scrapes of each day are observations of unchanged ones.
+    """
+    record: dict = synthetic_record(num_groups, loans_per_group)
+    first: dt.datetime = dt.datetime(2020, 1, 1)
+    for per_day in scrapes_per_day:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database_path: Path = Path(tmp_dir) / "bench.sqlite3"
+            for i in range(num_scrapes):
+                data: dict = copy.deepcopy(record)
+                data["scrape_timestamp"] = str(
+                    first + dt.timedelta(days=i // per_day, minutes=i % per_day)
+                )
+                data["current_balance"] = _dollars(6_003_702 - 100 * (i // per_day))
+                write_record_to_database(data, database_path)
+
+            elapsed: dict[bool, float] = {}
+            with connection(database_path) as con, transaction(con):
+                for set_based in (True, False):
+                    # Best of a few runs, each with the database already
+                    # cached.
+                    elapsed[set_based] = min(
+                        _time(lambda: rebuild_rollups(con, set_based)) for _ in range(3)
+                    )
+        print(
+            f"Rebuilt rollups of {num_scrapes} scrapes, {per_day} a day, with"
+            f" queries in {elapsed[True] * 1000:.0f} ms, by replaying them in"
+            f" {elapsed[False] * 1000:.0f} ms"
+        )
+
+
+def bench_column_parsing(num_values: int = 1_000_000) -> None:
+    """Times parsing columns of amounts, rates and dates as displayed, with
+    a tenth of them blank, as arrays, against a plain loop like the one
+    `plot balance` used to parse amounts with, and against the parsers for
+    single values. The loops can't handle negative amounts, so there are
+    none.
+    """
+    rng: random.Random = random.Random(0)
+    columns: dict[str, list[str]] = dict(
+        amounts=[_dollars(rng.randrange(10_000_000)) for _ in range(num_values)],
+        rates=[
+            f"{rng.randrange(20_000) / 1000:.3f}%{rng.choice(['', ' Fixed'])}"
+            for _ in range(num_values)
+        ],
+        dates=[
+            f"{rng.randint(1, 12):02}/{rng.randint(1, 28):02}/{rng.randint(2000, 2040)}"
+            for _ in range(num_values)
+        ],
+    )
+    for values in columns.values():
+        for i in range(0, num_values, 10):
+            values[i] = ""
+
+    def date_loop(text: str) -> dt.date:
+        month, day, year = text.split("/")
+        return dt.date(int(year), int(month), int(day))
+
+    # (loop body, parser, array parser, the array's values with None where
+    # missing)
+    parsers: dict[str, tuple[Callable, Callable, Callable, Callable]] = dict(
+        amounts=(
+            lambda text: float(text.lstrip("$").replace(",", "")),
+            parse_cents,
+            parse_cents_array,
+            lambda parsed: parsed.tolist(),
+        ),
+        rates=(
+            lambda text: float(text.partition("%")[0]),
+            parse_percent,
+            parse_percent_array,
+            lambda parsed: np.where(np.isnan(parsed), None, parsed).tolist(),
+        ),
+        dates=(
+            date_loop,
+            parse_date,
+            parse_date_array,
+            lambda parsed: [
+                None if date == "NaT" else date for date in parsed.astype(str)
+            ],
+        ),
+    )
+    for name, (loop_body, parse, parse_array, values) in parsers.items():
+        texts: list[str] = columns[name]
+        loop_elapsed: float = _time(lambda: [loop_body(text) for text in texts if text])
+        parse.cache_clear()
+        start: float = time.perf_counter()
+        expected: list = [parse(text) for text in texts]
+        elapsed: float = time.perf_counter() - start
+        start = time.perf_counter()
+        parsed: np.ndarray = parse_array(texts)
+        array_elapsed: float = time.perf_counter() - start
+
+        assert values(parsed) == expected, f"{name} parsed as arrays differ"
+        print(
+            f"Parsed {num_values:,} {name} as an array in {array_elapsed:.2f} s,"
+            f" {loop_elapsed / array_elapsed:.1f}x as fast as a plain loop"
+            f" ({loop_elapsed:.2f} s) and {elapsed / array_elapsed:.1f}x as the"
+            f" single-value parser ({elapsed:.2f} s)"
+        )
+
+
+def bench_loan_pivot(
+    num_days: int = 730, num_groups: int = 6, loans_per_group: int = 8
+) -> None:
+    """Times reading the principal balance of dozens of loans over years of
+    daily scrapes into a (time, loan) array, as `plot loans` does, against
+    a query per loan.
+    """
+    record: dict = synthetic_record(num_groups, loans_per_group)
+    first: dt.datetime = dt.datetime(2023, 1, 1, 12)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "bench.sqlite3"
+        for day in range(num_days):
+            data: dict = copy.deepcopy(record)
+            data["scrape_timestamp"] = str(first + dt.timedelta(days=day))
+            for group in data["groups"]:
+                for loan in group["loans"]:
+                    information: dict = loan["current_information"]
+                    information["principal_balance"] = _dollars(
+                        parse_cents(information["principal_balance"]) - 100 * day
+                    )
+            write_record_to_database(data, database_path)
+
+        def read_per_loan() -> None:
+            for name in names:
+                list(
+                    iter_loans(
+                        ("principal_balance_cents",),
+                        loans=[name],
+                        database_path=database_path,
+                    )
+                )
+
+        timestamps, names, balances = loan_balances(database_path=database_path)
+        # Best of a few runs, each with the database already cached.
+        elapsed: float = min(
+            _time(lambda: loan_balances(database_path=database_path)) for _ in range(3)
+        )
+        per_loan_elapsed: float = min(_time(read_per_loan) for _ in range(3))
+
+    assert balances.shape == (num_days, num_groups * loans_per_group)
+    assert not np.isnan(balances).any()
+    print(
+        f"Read {num_days} days of {len(names)} loans into an array in"
+        f" {elapsed * 1000:.0f} ms, with a query per loan in"
+        f" {per_loan_elapsed * 1000:.0f} ms"
+    )
+
+
+def bench_simulation(num_groups: int = 3, loans_per_group: int = 4) -> None:
+    """Times simulating 10,000 payment strategies of the synthetic loans:
+    both orders, 100 extra monthly amounts, and 5 lump sums paid in 10
+    different months.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "bench.sqlite3"
+        write_record_to_database(
+            synthetic_record(num_groups, loans_per_group), database_path
+        )
+        start, loans = latest_loans(database_path)
+    scenarios: np.ndarray = scenario_grid(
+        extra_cents=tuple(range(0, 100_000, 1000)),
+        lump_sum_cents=(0, 100_000, 500_000, 1_000_000, 2_000_000),
+        lump_sum_months=tuple(range(0, 120, 12)),
+    )
+
+    elapsed: float = min(
+        _time(lambda: simulate_repayment(loans, scenarios, start)) for _ in range(3)
+    )
+    results: np.ndarray = simulate_repayment(loans, scenarios, start)
+    assert not np.isnat(results["payoff_date"]).any()
+    print(
+        f"Simulated {len(scenarios)} strategies for {len(loans)} loans, up to"
+        f" {results['months'].max()} months, in {elapsed:.2f} s"
+    )
+
+
+def bench_reconciliation(
+    num_days: int = 730, num_groups: int = 6, loans_per_group: int = 8
+) -> None:
+    """Times checking the accrued interest of dozens of loans over years of
+    daily scrapes, paid monthly, with one loan accruing more than its rate
+    calls for.
+    """
+    record: dict = synthetic_record(num_groups, loans_per_group)
+    loans: list[dict] = [
+        loan["current_information"]
+        for group in record["groups"]
+        for loan in group["loans"]
+    ]
+    principal: list[int] = [parse_cents(loan["principal_balance"]) for loan in loans]
+    rates: list[float] = [parse_percent(loan["interest_rate"]) for loan in loans]
+    # Exact interest accrued since the last payment, shown rounded down.
+    accrued: list[float] = [0.0] * len(loans)
+    first: dt.datetime = dt.datetime(2023, 1, 1, 12)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "bench.sqlite3"
+        for day in range(num_days):
+            if day and day % 30 == 0:
+                principal = [p - 20_000 for p in principal]
+                accrued = [0.0] * len(loans)
+            for n, loan in enumerate(loans):
+                loan["principal_balance"] = _dollars(principal[n])
+                loan["accrued_interest"] = _dollars(int(accrued[n]))
+                rate: float = rates[n] + (0.5 if n == 1 else 0)
+                accrued[n] += principal[n] * rate / 100 / 365.25
+            record["scrape_timestamp"] = str(first + dt.timedelta(days=day))
+            write_record_to_database(record, database_path)
+
+        intervals, summary = reconcile_accrual(database_path=database_path)
+        elapsed: float = min(
+            _time(lambda: reconcile_accrual(database_path=database_path))
+            for _ in range(3)
+        )
+
+    assert list(summary["loan"][summary["divergent"] > 0]) == ["1-01-02"]
+    print(
+        f"Checked {len(intervals)} intervals of {len(summary)} loans over"
+        f" {num_days} days in {elapsed * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    bench_extraction_round_trips()
+    bench_page_source_parsing()
+    bench_database_insert()
+    bench_rollup_rebuild()
+    bench_column_parsing()
+    bench_loan_pivot()
+    bench_simulation()
+    bench_reconciliation()
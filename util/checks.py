@@ -0,0 +1,1017 @@
+"""Checks for developers. Like the benchmarks, these run against synthetic data
+in a temporary database.
+
+Run all of them with `python -m util.checks`. Each check raises an
+AssertionError describing what went wrong.
+"""
+
+import contextlib
+import copy
+import datetime as dt
+import functools
+import itertools
+import json
+import multiprocessing
+from pathlib import Path
+import random
+import re
+import sqlite3
+import tempfile
+from types import SimpleNamespace
+from typing import Callable, Iterator
+
+from selenium.common.exceptions import NoSuchElementException
+
+from nelnet_tracker import scrape
+from nelnet_tracker.compact import compact_database
+from nelnet_tracker.config import CONFIG
+from nelnet_tracker.connection import connection, transaction
+from nelnet_tracker.database import (
+    WRITE_RESULTS,
+    read_records_from_database,
+    write_record_to_database,
+)
+from nelnet_tracker.migrations import SCHEMA_VERSION, migrate
+from nelnet_tracker.parse import parse_cents, parse_percent
+from nelnet_tracker.plot import group_balances, loan_balances
+from nelnet_tracker.query import (
+    GROUP_FIELDS,
+    LOAN_FIELDS,
+    RECORD_FIELDS,
+    groups_query,
+    iter_balances,
+    iter_groups,
+    iter_loans,
+    iter_rows,
+    loans_query,
+    records_query,
+)
+from nelnet_tracker.reconcile import reconcile_accrual
+from nelnet_tracker.rollup import (
+    ROLLUP_METRICS,
+    ROLLUP_RESOLUTIONS,
+    ROLLUP_STATISTICS,
+    ROLLUP_TABLES,
+    rebuild_rollups,
+)
+from nelnet_tracker.scrape import LOGIN_URL, WebScraper
+from nelnet_tracker.simulate import DAYS_PER_YEAR
+
+from .bench import synthetic_record
+
+
+# A step of a query plan that reads every row of a table, as opposed to
+# searching an index.
+_FULL_SCAN_PATTERN: re.Pattern = re.compile(r"^SCAN (?P<table>\w+)$")
+# Tables that any query may read in full.
+_SMALL_TABLES: frozenset[str] = frozenset(("sqlite_master",))
+
+
+@contextlib.contextmanager
+def traced_queries() -> Iterator[list[str]]:
+    """Collects the SELECT statements run on any connection opened inside
+    the context, with their parameters filled in.
+    """
+    statements: list[str] = []
+    connect: Callable = sqlite3.connect
+
+    def traced_connect(*args, **kwargs) -> sqlite3.Connection:
+        con: sqlite3.Connection = connect(*args, **kwargs)
+        con.set_trace_callback(statements.append)
+        return con
+
+    sqlite3.connect = traced_connect
+    try:
+        yield statements
+    finally:
+        sqlite3.connect = connect
+
+
+def full_scans(con: sqlite3.Connection, statement: str) -> set[str]:
+    """Returns the tables, by their name or alias in `statement`, that its
+    query plan reads in full.
+    """
+    return {
+        match["table"]
+        for *_, detail in con.execute(f"EXPLAIN QUERY PLAN {statement}")
+        if (match := _FULL_SCAN_PATTERN.match(detail))
+    }
+
+
+def check_query_plans(num_records: int = 30) -> None:
+    """Checks that the queries run when writing and reading records search
+    indexes instead of scanning whole tables, apart from reads that are meant
+    to return every row.
+    """
+    record: dict = synthetic_record(num_groups=5, loans_per_group=10)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "check.sqlite3"
+        for i in range(num_records):
+            data: dict = copy.deepcopy(record)
+            data["scrape_timestamp"] = f"2024-10-{i % 28 + 1:02} {i:02}:00:00"
+            data["current_balance"] = f"${60_000 - i:,}.00"
+            write_record_to_database(data, database_path)
+
+        # (what is run, tables it may read in full)
+        cases: list[tuple[str, Callable[[], object], set[str]]] = [
+            (
+                "write_record_to_database",
+                lambda: write_record_to_database(copy.deepcopy(record), database_path),
+                set(),
+            ),
+            (
+                "iter_balances",
+                lambda: list(iter_balances(database_path=database_path)),
+                {"main_record", "o"},
+            ),
+            (
+                "iter_balances in a time range",
+                lambda: list(
+                    iter_balances(
+                        "2024-10-05", "2024-10-10", database_path=database_path
+                    )
+                ),
+                set(),
+            ),
+            (
+                "iter_balances by month",
+                lambda: list(
+                    iter_balances(database_path=database_path, resolution="month")
+                ),
+                set(),
+            ),
+            (
+                "read_records_from_database",
+                lambda: list(read_records_from_database(None, None, database_path)),
+                {"main_record", "o"},
+            ),
+            (
+                "iter_groups of a group",
+                lambda: list(
+                    iter_groups(groups=["Group A"], database_path=database_path)
+                ),
+                set(),
+            ),
+            (
+                "iter_loans of a loan",
+                lambda: list(
+                    iter_loans(
+                        ("principal_balance_cents", "loan_status"),
+                        loans=["1-01-01"],
+                        database_path=database_path,
+                    )
+                ),
+                set(),
+            ),
+        ]
+        con: sqlite3.Connection = sqlite3.connect(database_path)
+        for name, run, allowed in cases:
+            with traced_queries() as statements:
+                run()
+            for statement in statements:
+                if not statement.lstrip().upper().startswith("SELECT"):
+                    continue
+                scanned: set[str] = full_scans(con, statement) - allowed - _SMALL_TABLES
+                assert not scanned, (
+                    f"{name} scans {', '.join(sorted(scanned))} in full:"
+                    f"\n{statement}"
+                )
+        con.close()
+    print("Query plans use indexes")
+
+
+def check_rollups(num_records: int = 60) -> None:
+    """Checks that the rollups kept up to date by each write, including ones
+    of unchanged records and ones out of time order, are the same as those
+    rebuilt from scratch either way and as plain aggregates over the scrapes.
+    """
+    record: dict = synthetic_record(num_groups=3, loans_per_group=4)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "check.sqlite3"
+        for i in range(num_records):
+            data: dict = copy.deepcopy(record)
+            # Out of order, a few per day, and some unchanged.
+            day: int = (i * 7) % 45
+            data["scrape_timestamp"] = (
+                f"2024-{day // 28 + 9:02}-{day % 28 + 1:02} {i % 24:02}:00:00"
+            )
+            data["current_balance"] = f"${60_000 - i // 3:,}.00"
+            write_record_to_database(data, database_path)
+
+        with connection(database_path) as con:
+            kept: dict[str, list[tuple]] = {
+                table: con.execute(f"SELECT * FROM {table} ORDER BY row_id").fetchall()
+                for table in ROLLUP_TABLES
+            }
+            for set_based in (True, False):
+                with transaction(con):
+                    rebuild_rollups(con, set_based)
+                    for table, rows in kept.items():
+                        rebuilt: list[tuple] = con.execute(
+                            f"SELECT * FROM {table}"
+                        ).fetchall()
+                        # Row IDs depend on the order rows were created in.
+                        assert sorted(row[1:] for row in rows) == sorted(
+                            row[1:] for row in rebuilt
+                        ), f"{table} differs from a rebuild"
+            # Loan rollups are also compared with plain aggregates over every
+            # scrape of each loan.
+            scrapes: list[tuple] = con.execute(
+                """
+                SELECT
+                    c.loan_id, s.scrape_timestamp,
+                    c.principal_balance_cents, c.accrued_interest_cents
+                FROM (
+                    SELECT row_id AS main_record_id, scrape_timestamp
+                    FROM main_record
+                    UNION ALL
+                    SELECT main_record_id, scrape_timestamp
+                    FROM record_observation
+                ) AS s
+                JOIN loan_current_information AS c USING (main_record_id)
+                ORDER BY 1, 2
+                """
+            ).fetchall()
+            for resolution, length in ROLLUP_RESOLUTIONS.items():
+                expected: list[tuple] = []
+                for (loan_id, period), group in itertools.groupby(
+                    scrapes, lambda row: (row[0], row[1][:length])
+                ):
+                    rows: list[tuple] = list(group)
+                    expected.append(
+                        (loan_id, period, len(rows), rows[0][1], rows[-1][1])
+                    )
+                    for i in (2, 3):
+                        known: list[int] = [
+                            row[i] for row in rows if row[i] is not None
+                        ]
+                        expected[-1] += (
+                            rows[0][i],
+                            rows[-1][i],
+                            min(known, default=None),
+                            max(known, default=None),
+                        )
+                actual: list[tuple] = con.execute(
+                    f"""
+                    SELECT
+                        loan_id, period, num_scrapes, first_timestamp,
+                        last_timestamp,
+                        {", ".join(
+                            f"{stat}_{metric}_cents"
+                            for metric in ROLLUP_METRICS
+                            for stat in ROLLUP_STATISTICS
+                        )}
+                    FROM loan_rollup
+                    WHERE resolution == ?
+                    ORDER BY 1, 2
+                    """,
+                    (resolution,),
+                ).fetchall()
+                assert actual == expected, f"{resolution} loan rollups are wrong"
+    print("Rollups match a rebuild and plain aggregates")
+
+
+def scrape_contents(database_path: Path) -> dict[str, list[tuple]]:
+    """Returns everything recorded for each scrape, by scrape timestamp: the
+    record, its groups and loans, and the benefit details and disbursements of
+    its loans, all without IDs.
+    """
+    queries: list[tuple[str, dict]] = [
+        records_query(RECORD_FIELDS),
+        groups_query(GROUP_FIELDS),
+        loans_query(LOAN_FIELDS),
+        (
+            """
+            SELECT m.scrape_timestamp, m.row_id, l.name, b.position, b.name, b.status
+            FROM main_record AS m
+            JOIN loan_benefit_details AS b ON b.main_record_id == m.row_id
+            JOIN loan AS l ON l.row_id == b.loan_id
+            ORDER BY 2, 3, 4
+            """,
+            {},
+        ),
+        (
+            """
+            SELECT m.scrape_timestamp, m.row_id, l.name, d.info
+            FROM main_record AS m
+            JOIN loan_historic_information AS h ON h.main_record_id == m.row_id
+            JOIN loan_disbursement AS d ON d.loan_historic_information_id == h.row_id
+            JOIN loan AS l ON l.row_id == h.loan_id
+            ORDER BY 2, 3, d.row_id
+            """,
+            {},
+        ),
+    ]
+    # The record, group and loan queries have rows for each scrape, the others
+    # only for main records, whose observations share their rows. Each query
+    # has the main record ID second.
+    contents: dict[str, list[tuple]] = {}
+    record_contents: dict[int, list[tuple]] = {}
+    scrapes: dict[str, int] = {}
+    for i, query in enumerate(queries):
+        for timestamp, main_record_id, *fields in iter_rows(query, database_path):
+            if i == 0:
+                scrapes[timestamp] = main_record_id
+            if i < 3:
+                contents.setdefault(timestamp, []).append(tuple(fields))
+            else:
+                record_contents.setdefault(main_record_id, []).append(tuple(fields))
+    return {
+        timestamp: contents[timestamp] + record_contents.get(main_record_id, [])
+        for timestamp, main_record_id in scrapes.items()
+    }
+
+
+def check_compact(num_records: int = 240) -> None:
+    """Checks that compacting keeps exactly the scrapes the retention policy
+    calls for, each with everything recorded for it, even when the record
+    it observed is removed, and that records written afterwards are stored
+    the same as without compacting.
+    """
+    record: dict = synthetic_record(num_groups=3, loans_per_group=4)
+    first: dt.datetime = dt.datetime(2024, 1, 1)
+    timestamps: list[str] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "check.sqlite3"
+        reference_path: Path = Path(tmp_dir) / "reference.sqlite3"
+
+        def write(i: int, path: Path) -> None:
+            data: dict = copy.deepcopy(record)
+            # A few a day, three of each content in a row, the second and
+            # third stored as observations.
+            data["scrape_timestamp"] = str(first + dt.timedelta(hours=13 * i))
+            data["current_balance"] = f"${60_000 - i // 3:,}.00"
+            loan: dict = data["groups"][0]["loans"][0]
+            loan["loan_status"] = "FORBEARANCE" if i // 30 % 2 else "REPAYMENT"
+            if i // 45 % 2:
+                loan["benefit_details"] = loan["benefit_details"][:1]
+                loan["historic_information"]["disbursements"] = []
+            write_record_to_database(data, path)
+
+        for i in range(num_records):
+            write(i, database_path)
+            timestamps.append(str(first + dt.timedelta(hours=13 * i)))
+        with connection(database_path) as con, connection(reference_path) as ref:
+            con.backup(ref)
+        before: dict[str, list[tuple]] = scrape_contents(database_path)
+
+        now: dt.datetime = first + dt.timedelta(hours=13 * num_records)
+        keep_all_days, keep_daily_days = 10, 40
+        periods: dict[str, str] = {}
+        for timestamp in timestamps:
+            age: dt.timedelta = now - dt.datetime.fromisoformat(timestamp)
+            if age <= dt.timedelta(days=keep_all_days):
+                periods[timestamp] = timestamp
+            elif age <= dt.timedelta(days=keep_daily_days):
+                periods[timestamp] = timestamp[:10]
+            else:
+                periods[timestamp] = timestamp[:7]
+        kept: list[str] = sorted({period: t for t, period in periods.items()}.values())
+
+        dry_run: dict[str, int] = compact_database(
+            keep_all_days, keep_daily_days, now, True, database_path
+        )
+        assert scrape_contents(database_path) == before, "A dry run changed data"
+        result: dict[str, int] = compact_database(
+            keep_all_days, keep_daily_days, now, database_path=database_path
+        )
+        assert {k: result[k] for k in dry_run if k != "after"} == {
+            k: v for k, v in dry_run.items() if k != "after"
+        }, "A dry run reported something else"
+        after: dict[str, list[tuple]] = scrape_contents(database_path)
+        assert sorted(after) == kept, "Compacting kept other scrapes"
+        for timestamp in kept:
+            assert after[timestamp] == before[timestamp], f"{timestamp} changed"
+        assert result["after"] < result["before"], "The database didn't shrink"
+
+        with connection(database_path) as con:
+            assert con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+            assert con.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+            assert con.execute("PRAGMA foreign_key_check").fetchone() is None
+
+        for i in range(num_records, num_records + 50):
+            write(i, database_path)
+            write(i, reference_path)
+            timestamps.append(str(first + dt.timedelta(hours=13 * i)))
+        after = scrape_contents(database_path)
+        reference: dict[str, list[tuple]] = scrape_contents(reference_path)
+        for timestamp in timestamps[num_records:]:
+            assert after[timestamp] == reference[timestamp], f"{timestamp} differs"
+            assert after[timestamp], f"{timestamp} is missing"
+    print("Compacting keeps what the retention policy calls for")
+
+
+def changing_records(
+    num_records: int, loans_per_group: int = 4, move_loans: bool = True
+) -> list[dict]:
+    """Returns records that change from one to the next in all the ways the
+    database stores differently: loans coming and going, moving between
+    groups and changing placement unless not `move_loans`, and each kind of
+    loan detail changing, with some records unchanged.
+    """
+    rng: random.Random = random.Random(0)
+    # Kept apart, so that the other changes don't depend on it.
+    move_rng: random.Random = random.Random(1)
+    base: dict = synthetic_record(num_groups=3, loans_per_group=loans_per_group)
+    records: list[dict] = []
+    data: dict = base
+    for i in range(num_records):
+        data = copy.deepcopy(data)
+        data["scrape_timestamp"] = (
+            f"2024-{i // 28 % 12 + 1:02}-{i % 28 + 1:02} 08:00:00"
+        )
+        if rng.random() < 0.3:
+            records.append(data)
+            continue
+        data["current_balance"] = f"${rng.randint(50_000, 60_000):,}.00"
+        for group, base_group in zip(data["groups"], base["groups"]):
+            group["loans"] = [
+                copy.deepcopy(loan)
+                for loan in base_group["loans"]
+                if rng.random() < 0.9
+            ]
+            for loan in group["loans"]:
+                historic: dict = loan["historic_information"]
+                if rng.random() < 0.2:
+                    loan["loan_status"] = rng.choice(["REPAYMENT", "FORBEARANCE"])
+                if rng.random() < 0.2:
+                    historic["disbursements"] = historic["disbursements"][::-1]
+                if rng.random() < 0.1:
+                    historic["disbursements"] = []
+                if rng.random() < 0.1:
+                    historic["original_loan_amount"] = "$1.00"
+                if rng.random() < 0.2:
+                    loan["benefit_details"] = loan["benefit_details"][::-1]
+                if rng.random() < 0.1:
+                    loan["benefit_details"] = loan["benefit_details"][:1]
+                loan["current_information"][
+                    "accrued_interest"
+                ] = f"${rng.randint(0, 99)}.00"
+        if not move_loans:
+            records.append(data)
+            continue
+        # Loans sometimes move to another group, and are numbered within
+        # their group as it is.
+        if move_rng.random() < 0.2 and data["groups"][0]["loans"]:
+            data["groups"][1]["loans"].append(data["groups"][0]["loans"].pop())
+        for group in data["groups"]:
+            for n, loan in enumerate(group["loans"], 1):
+                loan["group_placement"] = f"Loan {n} of {len(group['loans'])}"
+        records.append(data)
+    return records
+
+
+def check_record_round_trip(num_records: int = 60) -> None:
+    """Checks that records read back from the database are the same as the
+    ones written, which are left as they were, with a number of queries that
+    doesn't depend on the number of loans, and that writing them again stores
+    the same thing.
+    """
+    num_queries: dict[int, int] = {}
+    for loans_per_group in (2, 8):
+        records: list[dict] = changing_records(num_records, loans_per_group)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database_path: Path = Path(tmp_dir) / "check.sqlite3"
+            copy_path: Path = Path(tmp_dir) / "copy.sqlite3"
+            for data in records:
+                # Not copied, so that writes that change the caller's data
+                # show up below.
+                write_record_to_database(data, database_path)
+
+            with traced_queries() as statements:
+                read: list[dict] = list(
+                    read_records_from_database(None, None, database_path)
+                )
+            num_queries[loans_per_group] = len(statements)
+            assert read == records, "Records read back differ from those written"
+
+            for data in read:
+                # Through JSON, like export-json and from-json.
+                write_record_to_database(json.loads(json.dumps(data)), copy_path)
+            assert scrape_contents(copy_path) == scrape_contents(
+                database_path
+            ), "Records written again are stored differently"
+    assert (
+        len(set(num_queries.values())) == 1
+    ), f"Reading records takes more queries with more loans: {num_queries}"
+    print("Records read back are the ones written")
+
+
+# Tables as `create_database` made them before schema versions were
+# recorded, at version 0.
+_VERSION_0_TABLES: dict[str, str] = dict(
+    main_record="""
+        row_id INTEGER PRIMARY KEY,
+        scrape_timestamp TEXT NOT NULL,
+        past_due_amount TEXT NOT NULL,
+        monthly_payment_remaining TEXT NOT NULL,
+        current_amount_due TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        current_balance TEXT NOT NULL,
+        last_payment_received TEXT NOT NULL
+        """,
+    loan_group="""
+        row_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+        """,
+    group_record="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL,
+        group_id INTEGER NOT NULL,
+        loan_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        repayment_plan TEXT NOT NULL
+        """,
+    payment_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL,
+        group_id INTEGER NOT NULL,
+        current_amount_due TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        interest_rate TEXT NOT NULL,
+        regular_monthly_payment_amount TEXT NOT NULL,
+        last_payment_received TEXT NOT NULL
+        """,
+    balance_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL,
+        group_id INTEGER NOT NULL,
+        principal_balance TEXT NOT NULL,
+        accrued_interest TEXT NOT NULL,
+        fees TEXT NOT NULL,
+        outstanding_balance TEXT NOT NULL
+        """,
+    loan="""
+        row_id INTEGER PRIMARY KEY,
+        group_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        group_placement INTEGER NOT NULL
+        """,
+    loan_record="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL,
+        loan_id INTEGER NOT NULL,
+        loan_type TEXT NOT NULL,
+        loan_status TEXT NOT NULL,
+        interest_subsidy TEXT NOT NULL,
+        lender_name TEXT NOT NULL,
+        school_name TEXT NOT NULL
+        """,
+    loan_current_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL,
+        loan_id INTEGER NOT NULL,
+        due_date TEXT NOT NULL,
+        interest_rate TEXT NOT NULL,
+        interest_rate_type TEXT NOT NULL,
+        loan_term TEXT NOT NULL,
+        principal_balance TEXT NOT NULL,
+        accrued_interest TEXT NOT NULL,
+        capitalized_interest TEXT NOT NULL
+        """,
+    loan_historic_information="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL,
+        loan_id INTEGER NOT NULL,
+        convert_to_repayment TEXT NOT NULL,
+        original_loan_amount TEXT NOT NULL
+        """,
+    loan_disbursement="""
+        row_id INTEGER PRIMARY KEY,
+        loan_historic_information_id INTEGER NOT NULL,
+        info TEXT NOT NULL
+        """,
+    loan_benefit_details="""
+        row_id INTEGER PRIMARY KEY,
+        main_record_id INTEGER NOT NULL,
+        loan_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        status TEXT NOT NULL
+        """,
+)
+
+
+def write_version_0_record(data: dict, database_path: Path) -> None:
+    """Writes a record like `DatabaseRecord.insert_all` did at schema version
+    0: every scrape in full, and each group and loan as first seen.
+    """
+    con: sqlite3.Connection = sqlite3.connect(database_path)
+
+    def insert(table: str, *values: object) -> int:
+        placeholders: str = ", ".join("?" * (len(values) + 1))
+        cur: sqlite3.Cursor = con.execute(
+            f"INSERT INTO {table} VALUES ({placeholders})", (None, *values)
+        )
+        assert cur.lastrowid is not None
+        return cur.lastrowid
+
+    def find(table: str, name: str) -> int | None:
+        row: tuple | None = con.execute(
+            f"SELECT row_id FROM {table} WHERE name == ?", (name,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    with con:
+        for table, columns in _VERSION_0_TABLES.items():
+            con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+        main_record_id: int = insert(
+            "main_record",
+            data["scrape_timestamp"],
+            data["past_due_amount"],
+            data["monthly_payment_remaining"],
+            data["current_amount_due"],
+            data["due_date"],
+            data["current_balance"],
+            data["last_payment_received"],
+        )
+        for group in data["groups"]:
+            group_id: int = find("loan_group", group["name"]) or insert(
+                "loan_group", group["name"]
+            )
+            insert(
+                "group_record",
+                main_record_id,
+                group_id,
+                group["loan_type"],
+                group["status"],
+                group["repayment_plan"],
+            )
+            payment: dict = group["payment_information"]
+            insert(
+                "payment_information",
+                main_record_id,
+                group_id,
+                payment["current_amount_due"],
+                payment["due_date"],
+                payment["interest_rate"],
+                payment["regular_monthly_payment_amount"],
+                payment["last_payment_received"],
+            )
+            balance: dict = group["balance_information"]
+            insert(
+                "balance_information",
+                main_record_id,
+                group_id,
+                balance["principal_balance"],
+                balance["accrued_interest"],
+                balance["fees"],
+                balance["outstanding_balance"],
+            )
+            for loan in group["loans"]:
+                loan_id: int = find("loan", loan["name"]) or insert(
+                    "loan", group_id, loan["name"], loan["group_placement"]
+                )
+                insert(
+                    "loan_record",
+                    main_record_id,
+                    loan_id,
+                    loan["loan_type"],
+                    loan["loan_status"],
+                    loan["interest_subsidy"],
+                    loan["lender_name"],
+                    loan["school_name"],
+                )
+                current: dict = loan["current_information"]
+                insert(
+                    "loan_current_information",
+                    main_record_id,
+                    loan_id,
+                    current["due_date"],
+                    current["interest_rate"],
+                    current["interest_rate_type"],
+                    current["loan_term"],
+                    current["principal_balance"],
+                    current["accrued_interest"],
+                    current["capitalized_interest"],
+                )
+                historic: dict = loan["historic_information"]
+                historic_id: int = insert(
+                    "loan_historic_information",
+                    main_record_id,
+                    loan_id,
+                    historic["convert_to_repayment"],
+                    historic["original_loan_amount"],
+                )
+                for disbursement in historic["disbursements"]:
+                    insert("loan_disbursement", historic_id, disbursement)
+                for name, status in loan["benefit_details"]:
+                    insert(
+                        "loan_benefit_details", main_record_id, loan_id, name, status
+                    )
+    con.close()
+
+
+def check_migrated_records(num_records: int = 60) -> None:
+    """Checks that records written at schema version 0 read back, once
+    migrated, the same as the same records written at the latest version,
+    and have the same rollups. Loans keep their groups and placements, which
+    version 0 only stored once.
+    """
+    records: list[dict] = changing_records(num_records, move_loans=False)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        old_path: Path = Path(tmp_dir) / "old.sqlite3"
+        new_path: Path = Path(tmp_dir) / "new.sqlite3"
+        for data in records:
+            write_version_0_record(data, old_path)
+            write_record_to_database(data, new_path)
+        with connection(old_path) as con:
+            assert migrate(con) == (
+                0,
+                SCHEMA_VERSION,
+            ), "Version 0 database wasn't migrated to the latest version"
+        assert list(read_records_from_database(None, None, old_path)) == list(
+            read_records_from_database(None, None, new_path)
+        ), "Migrated records differ from ones written at the latest version"
+        contents: list[dict[str, list[tuple]]] = []
+        for database_path in (old_path, new_path):
+            with connection(database_path) as con:
+                contents.append(
+                    {
+                        table: sorted(
+                            row[1:] for row in con.execute(f"SELECT * FROM {table}")
+                        )
+                        for table in ROLLUP_TABLES
+                    }
+                )
+        assert contents[0] == contents[1], "Migrated rollups differ"
+    print("Records migrated from version 0 read like new ones")
+
+
+def check_observed_scrapes(num_records: int = 30) -> None:
+    """Checks that group and loan rows, in order or not and in a time range,
+    and the balances plotted from them, are there for every scrape, scrapes
+    of unchanged records stored as observations included, with the values of
+    the record they observed.
+    """
+    record: dict = synthetic_record(num_groups=3, loans_per_group=4)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "check.sqlite3"
+        results: list[str] = []
+        for i in range(num_records):
+            data: dict = copy.deepcopy(record)
+            # Three of each content in a row, the second and third observed.
+            data["scrape_timestamp"] = f"2024-10-{i + 1:02} 08:00:00"
+            data["groups"][0]["loans"][0]["current_information"][
+                "accrued_interest"
+            ] = f"${i // 3}.00"
+            results.append(write_record_to_database(data, database_path))
+        assert results.count("observed") == num_records * 2 // 3, results
+
+        start, end = "2024-10-05", "2024-10-20"
+        scrapes: dict[str, int] = dict(
+            iter_rows(records_query(("main_record_id",), start, end), database_path)
+        )
+        for name, make_query in [
+            ("groups", functools.partial(groups_query, GROUP_FIELDS)),
+            ("loans", functools.partial(loans_query, LOAN_FIELDS)),
+        ]:
+            rows: list[tuple] = list(
+                iter_rows(make_query(start=start, end=end), database_path)
+            )
+            unordered: list[tuple] = list(
+                iter_rows(
+                    make_query(start=start, end=end, ordered=False), database_path
+                )
+            )
+            assert sorted(rows) == sorted(unordered), f"{name} differ out of order"
+            assert [row[0] for row in rows] == sorted(
+                row[0] for row in rows
+            ), f"{name} are out of order"
+            by_scrape: dict[str, list[tuple]] = {}
+            for timestamp, main_record_id, *fields in rows:
+                assert main_record_id == scrapes.get(
+                    timestamp
+                ), f"{name} of {timestamp} are from another record"
+                by_scrape.setdefault(timestamp, []).append(tuple(fields))
+            assert list(by_scrape) == list(scrapes), f"{name} miss scrapes"
+            for timestamp, main_record_id in scrapes.items():
+                first: str = min(t for t, i in scrapes.items() if i == main_record_id)
+                assert (
+                    by_scrape[timestamp] == by_scrape[first]
+                ), f"{name} of {timestamp} differ from the record it observed"
+
+        # As `plot loans` and `plot groups` plot them, groups by the principal
+        # of their balance information.
+        expected: dict[str, dict[str, int | None]] = dict(
+            loan_balances={
+                loan["name"]: parse_cents(
+                    loan["current_information"]["principal_balance"]
+                )
+                for group in record["groups"]
+                for loan in group["loans"]
+            },
+            group_balances={
+                group["name"]: parse_cents(
+                    group["balance_information"]["principal_balance"]
+                )
+                for group in record["groups"]
+            },
+        )
+        for balances in (loan_balances, group_balances):
+            timestamps, names, cents = balances(start, end, database_path=database_path)
+            assert list(timestamps) == [
+                dt.datetime.fromisoformat(t) for t in scrapes
+            ], f"{balances.__name__} miss scrapes"
+            assert (
+                cents == [expected[balances.__name__][name] for name in names]
+            ).all(), f"{balances.__name__} are wrong"
+    print("Groups and loans are read for observed scrapes")
+
+
+def check_reconcile_observed_scrapes(num_days: int = 20) -> None:
+    """Checks that interest accrual is reconciled between every two
+    consecutive scrapes of each loan, scrapes of unchanged records stored as
+    observations included, and that interest accruing at the stated rate
+    doesn't diverge.
+    """
+    record: dict = synthetic_record(num_groups=2, loans_per_group=3)
+    loans: list[dict] = [loan for group in record["groups"] for loan in group["loans"]]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "check.sqlite3"
+        observed: list[str] = []
+        for day in range(num_days):
+            data: dict = copy.deepcopy(record)
+            for loan in (loan for group in data["groups"] for loan in group["loans"]):
+                current: dict = loan["current_information"]
+                accrued: float = (
+                    parse_cents(current["principal_balance"])
+                    * parse_percent(current["interest_rate"])
+                    / 100
+                    / DAYS_PER_YEAR
+                    * day
+                )
+                current["accrued_interest"] = f"${round(accrued) / 100:,.2f}"
+            # The evening's scrape is the same as the morning's.
+            for hour in ("08", "20"):
+                data["scrape_timestamp"] = f"2024-10-{day + 1:02} {hour}:00:00"
+                if write_record_to_database(copy.deepcopy(data), database_path) == (
+                    "observed"
+                ):
+                    observed.append(data["scrape_timestamp"])
+        assert len(observed) == num_days, "Evening scrapes weren't observations"
+
+        intervals, summary = reconcile_accrual(database_path=database_path)
+        assert len(intervals) == len(loans) * (2 * num_days - 1), (
+            f"{len(intervals)} intervals of {len(loans)} loans over"
+            f" {2 * num_days} scrapes"
+        )
+        ends: set[dt.datetime] = set(intervals["end"].tolist())
+        assert all(
+            dt.datetime.fromisoformat(t) in ends for t in observed
+        ), "Observed scrapes are left out"
+        assert not intervals["divergent"].any(), "Accrual at the rate diverges"
+        assert (summary["intervals"] == 2 * num_days - 1).all()
+    print("Interest accrual is reconciled between observed scrapes")
+
+
+def _write_shuffled(records: list[dict], database_path: Path, seed: int) -> list[str]:
+    """Writes records in a random order, and returns what each came to."""
+    records = records.copy()
+    random.Random(seed).shuffle(records)
+    return [write_record_to_database(data, database_path) for data in records]
+
+
+def check_concurrent_writes(num_records: int = 40, num_processes: int = 4) -> None:
+    """Checks that processes writing the same records at the same time, each
+    in its own order, store each scrape once and the same as writing them
+    one after another, and that writing them all again changes nothing.
+    """
+    records: list[dict] = changing_records(num_records, loans_per_group=2)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path: Path = Path(tmp_dir) / "check.sqlite3"
+        reference_path: Path = Path(tmp_dir) / "reference.sqlite3"
+        for data in records:
+            write_record_to_database(copy.deepcopy(data), reference_path)
+
+        with multiprocessing.Pool(num_processes) as pool:
+            results: list[list[str]] = pool.starmap(
+                _write_shuffled,
+                [(records, database_path, seed) for seed in range(num_processes)],
+            )
+        counts: dict[str, int] = dict.fromkeys(WRITE_RESULTS, 0)
+        for result in [*results, _write_shuffled(records, database_path, 0)]:
+            for outcome in result:
+                counts[outcome] += 1
+        assert counts["inserted"] + counts["observed"] == num_records, (
+            f"{counts['inserted'] + counts['observed']} of {num_records} scrapes"
+            f" were written"
+        )
+        assert scrape_contents(database_path) == scrape_contents(
+            reference_path
+        ), "Records written concurrently are stored differently"
+        with connection(database_path) as con:
+            kept: dict[str, list[tuple]] = {
+                table: con.execute(f"SELECT * FROM {table}").fetchall()
+                for table in ROLLUP_TABLES
+            }
+            with transaction(con):
+                rebuild_rollups(con)
+                for table, rows in kept.items():
+                    rebuilt: list[tuple] = con.execute(
+                        f"SELECT * FROM {table}"
+                    ).fetchall()
+                    assert sorted(row[1:] for row in rows) == sorted(
+                        row[1:] for row in rebuilt
+                    ), f"{table} differs from a rebuild"
+    print("Concurrent writes store each scrape once")
+
+
+# Address of the "My Loans" page of `_FakeBrowser`.
+_FAKE_LOANS_URL: str = "https://nelnet.studentaid.gov/loans"
+
+
+class _FakeBrowser:
+    """Stands in for Firefox on a site with one session at a time, which a
+    user logs into as soon as the login page opens in a browser they can
+    see. Browsers opened are appended to `opened`.
+    """
+
+    opened: list["_FakeBrowser"] = []
+    session: str | None = None
+
+    def __init__(self, options) -> None:
+        self.headless: bool = "-headless" in options.arguments
+        self.url: str | None = None
+        self.cookies: list[dict] = []
+        self.quit_called: bool = False
+        _FakeBrowser.opened.append(self)
+
+    @property
+    def current_url(self) -> str | None:
+        return self.url
+
+    def get(self, url: str) -> None:
+        assert not self.quit_called, "A browser was used after quitting"
+        self.url = url
+        if url == LOGIN_URL and not self.headless:
+            _FakeBrowser.session = f"session {len(_FakeBrowser.opened)}"
+            self.cookies = [dict(name="session", value=_FakeBrowser.session)]
+            self.url = _FAKE_LOANS_URL
+
+    def find_element(self, by: str, xpath: str) -> object:
+        if self.url != _FAKE_LOANS_URL or not any(
+            cookie["value"] == _FakeBrowser.session for cookie in self.cookies
+        ):
+            raise NoSuchElementException(xpath)
+        return object()
+
+    def get_cookies(self) -> list[dict]:
+        return self.cookies
+
+    def add_cookie(self, cookie: dict) -> None:
+        self.cookies.append(cookie)
+
+    def execute_script(self, script: str, *args) -> dict:
+        return {}
+
+    def quit(self) -> None:
+        self.quit_called = True
+
+
+def check_relogin_after_expiry() -> None:
+    """Checks that when a session moved to a headless browser expires,
+    logging in again, as `scrape-daemon` does, happens in a browser the user
+    can see, and the new session moves to a headless one again.
+    """
+    webdriver: object = scrape.webdriver
+    timeouts: tuple[float, float] = (
+        CONFIG.session_check_timeout,
+        CONFIG.login_timeout,
+    )
+    scrape.webdriver = SimpleNamespace(Firefox=_FakeBrowser)
+    # The fake pages are there at once, or not at all.
+    CONFIG.session_check_timeout = CONFIG.login_timeout = 0
+    _FakeBrowser.opened = []
+    try:
+        scraper: WebScraper = WebScraper(profile="default", headless_after_login=True)
+        scraper.login(interactive=False)
+        assert scraper.driver.headless, "The session didn't move to a headless browser"
+        assert scraper.reload(), "The session wasn't kept"
+
+        # The session expires.
+        _FakeBrowser.session = None
+        assert not scraper.reload(), "The expired session was reused"
+        scraper.login(interactive=False)
+        login_browser: _FakeBrowser = _FakeBrowser.opened[-2]
+        assert not login_browser.headless, "Logged in again in a headless browser"
+        assert scraper.driver.headless, "The new session didn't move to a headless one"
+        assert scraper.reload(), "The new session wasn't kept"
+        assert all(
+            browser.quit_called for browser in _FakeBrowser.opened[:-1]
+        ), "A browser was left open"
+    finally:
+        scrape.webdriver = webdriver
+        CONFIG.session_check_timeout, CONFIG.login_timeout = timeouts
+    print("Logging in again after a session expires opens a visible browser")
+
+
+if __name__ == "__main__":
+    check_query_plans()
+    check_rollups()
+    check_compact()
+    check_record_round_trip()
+    check_migrated_records()
+    check_observed_scrapes()
+    check_reconcile_observed_scrapes()
+    check_concurrent_writes()
+    check_relogin_after_expiry()